@@ -1,43 +1,31 @@
 #!/bin/bash
 # Example script for gathering additional context for AI Command Helper
 # Copy this file to .aih_context.sh and customize as needed
-
-# Current directory listing
-echo "# Directory listing"
-ls -la
-
-# Git information (if in a git repository)
+#
+# Directory listing, git branch, system, disk, memory, load and top processes
+# are collected without a script (see CONTEXT_COLLECTORS in .env); this script
+# is for everything else, such as git status below.
+#
+# Each "# @section" block runs in parallel with the others:
+#   timeout=SECONDS  drop this section if it takes longer (default 5)
+#   cache=cwd,git    reuse the last output while the directory / git HEAD and index are unchanged
+#   ttl=SECONDS      reuse the last output for at most this long
+
+# @section git timeout=3 cache=cwd,git ttl=60
 if git rev-parse --is-inside-work-tree &>/dev/null; then
-  echo -e "\n# Git branch"
-  git branch --show-current
-  
-  echo -e "\n# Git status"
+  echo "# Git status"
   git status -s
   
   echo -e "\n# Recent commits"
   git log --oneline -n 5
 fi
 
-# System information
-echo -e "\n# System information"
-uname -a
-
-# Disk space
-echo -e "\n# Disk space"
-df -h .
-
-# Memory usage
-echo -e "\n# Memory usage"
-free -h
-
-# Running processes (top 5 by CPU)
-echo -e "\n# Top processes"
-ps aux --sort=-%cpu | head -n 6
-
-# Add your custom commands below
-# For example:
-# echo -e "\n# Docker containers"
-# docker ps
-
-# echo -e "\n# Kubernetes pods"
-# kubectl get pods
\ No newline at end of file
+# Add your custom sections below, for example:
+#
+#   # @section docker timeout=3 ttl=30
+#   echo -e "# Docker containers"
+#   docker ps
+#
+#   # @section kubernetes timeout=5 ttl=30
+#   echo -e "# Kubernetes pods"
+#   kubectl get pods
@@ -0,0 +1,160 @@
+"""Non-interactive batch mode: many prompts in, one JSON line per result out.
+
+Input is read from a file or stdin, one item per line: either a plain prompt
+or a JSON object such as ``{"id": "x", "prompt": "...", "model": "ollama/llama3",
+"context": "...", "max": 3}``. Items run concurrently (at most ``concurrency``
+at a time, each provider limited to its requests per second) and results are
+written as JSON lines in the order they complete::
+
+    {"index": 0, "id": "x", "prompt": "...", "model": "...", "suggestions": [...],
+     "latency_ms": 812.4, "error": null}
+
+latency_ms covers the model call only, not time spent waiting for a rate
+limit. Batch mode never prompts and never writes .aih_command.
+"""
+import json
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, TextIO
+
+# (prompt, context, model_name, max_suggestions) -> suggestions
+SuggestFn = Callable[[str, Optional[str], str, int], List[str]]
+
+
+class RateLimiter:
+    """Spaces calls evenly so that at most rate calls start per second."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def parse_rate_limits(spec: str) -> Dict[str, float]:
+    """Parse "openai=5,ollama=2" into requests per second per provider."""
+    limits: Dict[str, float] = {}
+    for part in spec.split(","):
+        provider, _, rate = part.strip().partition("=")
+        if not provider or not rate:
+            continue
+        try:
+            if float(rate) > 0:
+                limits[provider.strip()] = float(rate)
+        except ValueError:
+            print(f"Warning: Ignoring invalid rate limit '{part.strip()}'", file=sys.stderr)
+    return limits
+
+
+def read_items(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Yield batch items from input lines, plain prompts or JSON objects."""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                yield {"error": f"Invalid JSON: {e}", "prompt": line}
+                continue
+            yield item if isinstance(item, dict) else {"error": "Item is not a JSON object", "prompt": line}
+        else:
+            yield {"prompt": line}
+
+
+def _provider(model_name: str) -> str:
+    return model_name.split("/", 1)[0]
+
+
+class BatchRunner:
+    """Runs batch items concurrently through suggest and writes results as they complete."""
+
+    def __init__(
+        self,
+        suggest: SuggestFn,
+        model_name: str,
+        max_suggestions: int,
+        context: Optional[str] = None,
+        concurrency: int = 4,
+        rate_limits: Optional[Dict[str, float]] = None,
+        out: TextIO = sys.stdout,
+    ) -> None:
+        self.suggest = suggest
+        self.model_name = model_name
+        self.max_suggestions = max_suggestions
+        self.context = context
+        self.concurrency = max(1, concurrency)
+        self.limiters = {provider: RateLimiter(rate) for provider, rate in (rate_limits or {}).items()}
+        self.out = out
+        self.succeeded = 0
+        self.failed = 0
+
+    def _run_item(self, index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+        model_name = item.get("model") or self.model_name
+        result: Dict[str, Any] = {
+            "index": index,
+            "id": item.get("id"),
+            "prompt": item.get("prompt"),
+            "model": model_name,
+            "suggestions": [],
+            "latency_ms": None,
+            "error": item.get("error"),
+        }
+        if result["error"]:
+            return result
+        if not isinstance(item.get("prompt"), str) or not item["prompt"].strip():
+            result["error"] = "Missing prompt"
+            return result
+        if not isinstance(model_name, str):
+            result["error"] = "Invalid model"
+            return result
+
+        limiter = self.limiters.get(_provider(model_name))
+        if limiter:
+            limiter.acquire()
+        started = time.perf_counter()
+        try:
+            result["suggestions"] = self.suggest(
+                item["prompt"],
+                item.get("context", self.context),
+                model_name,
+                int(item.get("max") or self.max_suggestions),
+            )
+        except Exception as e:
+            result["error"] = str(e) or type(e).__name__
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    def _emit(self, future: "Future[Dict[str, Any]]") -> None:
+        result = future.result()
+        if result["error"]:
+            self.failed += 1
+        else:
+            self.succeeded += 1
+        self.out.write(json.dumps(result) + "\n")
+        self.out.flush()
+
+    def run(self, items: Iterable[Dict[str, Any]]) -> None:
+        """Run all items, reading ahead only as far as the pool can work on."""
+        pending: Set["Future[Dict[str, Any]]"] = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for index, item in enumerate(items):
+                if len(pending) >= self.concurrency * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._emit(future)
+                pending.add(pool.submit(self._run_item, index, item))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._emit(future)
@@ -0,0 +1,234 @@
+"""Local stand-ins for the OpenAI, Ollama and Gemini chat APIs.
+
+One threaded HTTP server answers all three protocols, streaming and not:
+
+- ``POST /v1/chat/completions`` (OpenAI, SSE when ``"stream": true``)
+- ``POST /api/chat`` (Ollama, NDJSON when ``"stream": true``)
+- ``POST /v1beta/models/<model>:generateContent`` and ``:streamGenerateContent?alt=sse`` (Gemini)
+- ``POST /v1beta/cachedContents`` (Gemini context caching; unknown ``cachedContent`` names get a 404)
+
+Latency, jitter, error rate and streaming chunk timing are set per server
+with ``FakeConfig``. Run it standalone to point a real ``aih`` at it::
+
+    python bench/fake_providers.py --port 18555 --latency 0.3 --error-rate 0.05
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List, Optional, Set
+
+DEFAULT_LINES = ["ls -la", "find . -type f -size +100M", "du -ah . | sort -rh | head -n 10"]
+
+
+class FakeConfig:
+    """Behaviour of a fake provider server."""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        chunk_delay: float = 0.0,
+        chunk_size: int = 8,
+        lines: Optional[List[str]] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.latency = latency  # Seconds before the first byte of the answer
+        self.jitter = jitter  # Uniform +/- seconds added to latency
+        self.error_rate = error_rate  # Share of requests answered with error_status
+        self.error_status = error_status
+        self.chunk_delay = chunk_delay  # Seconds between streamed chunks
+        self.chunk_size = chunk_size  # Characters of completion text per streamed chunk
+        self.lines = lines or DEFAULT_LINES
+        self.random = random.Random(seed)
+
+    @property
+    def text(self) -> str:
+        # Answer the way the system prompt asks: a JSON array of commands
+        return json.dumps(self.lines)
+
+    def chunks(self) -> Iterator[str]:
+        text = self.text
+        for start in range(0, len(text), self.chunk_size):
+            yield text[start:start + self.chunk_size]
+
+    def delay(self) -> float:
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeProviderServer"
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        config = self.server.config
+        self.server.count_request()
+        time.sleep(config.delay())
+
+        if config.random.random() < config.error_rate:
+            self._send_json({"error": {"message": "fake provider error"}}, config.error_status)
+            return
+
+        if self.path.startswith("/v1beta/cachedContents"):
+            self._send_json({"name": self.server.add_cached_content(), "model": body.get("model")})
+        elif "cachedContent" in body and not self.server.has_cached_content(body["cachedContent"]):
+            self._send_json({"error": {"code": 404, "message": "CachedContent not found"}}, 404)
+        elif self.path.startswith("/api/chat"):
+            self._ollama(body, config)
+        elif "chat/completions" in self.path:
+            self._openai(body, config)
+        elif ":streamGenerateContent" in self.path:
+            self._stream(("data: " + json.dumps(_gemini_payload(chunk)) + "\n\n" for chunk in config.chunks()),
+                         "text/event-stream", config)
+        elif ":generateContent" in self.path:
+            self._send_json(_gemini_payload(config.text))
+        else:
+            self._send_json({"error": "unknown endpoint"}, 404)
+
+    def _openai(self, body: dict, config: FakeConfig) -> None:
+        if not body.get("stream"):
+            self._send_json({
+                "choices": [{"message": {"role": "assistant", "content": config.text}}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+            })
+            return
+        events = ("data: " + json.dumps({"choices": [{"delta": {"content": chunk}}]}) + "\n\n"
+                  for chunk in config.chunks())
+        tail = "data: [DONE]\n\n"
+        if (body.get("stream_options") or {}).get("include_usage"):
+            usage = {"choices": [], "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120}}
+            tail = "data: " + json.dumps(usage) + "\n\n" + tail
+        self._stream(_then(events, tail), "text/event-stream", config)
+
+    def _ollama(self, body: dict, config: FakeConfig) -> None:
+        done = {"message": {"role": "assistant", "content": ""}, "done": True,
+                "prompt_eval_count": 100, "eval_count": 20}
+        if not body.get("stream", True):
+            self._send_json(dict(done, message={"role": "assistant", "content": config.text}))
+            return
+        events = (json.dumps({"message": {"role": "assistant", "content": chunk}, "done": False}) + "\n"
+                  for chunk in config.chunks())
+        self._stream(_then(events, json.dumps(done) + "\n"), "application/x-ndjson", config)
+
+    def _send_json(self, payload: dict, status: int = 200) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, events: Iterator[str], content_type: str, config: FakeConfig) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for idx, event in enumerate(events):
+            if idx and config.chunk_delay:
+                time.sleep(config.chunk_delay)
+            self._write_chunk(event.encode("utf-8"))
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def _then(events: Iterator[str], last: str) -> Iterator[str]:
+    yield from events
+    yield last
+
+
+def _gemini_payload(text: str) -> dict:
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}],
+        "usageMetadata": {"promptTokenCount": 100, "candidatesTokenCount": 20, "totalTokenCount": 120},
+    }
+
+
+class FakeProviderServer(ThreadingHTTPServer):
+    """Fake provider server; start() serves it from a daemon thread."""
+
+    daemon_threads = True
+
+    def __init__(self, config: Optional[FakeConfig] = None, port: int = 0) -> None:
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.config = config or FakeConfig()
+        self.requests = 0
+        self.cached_contents: Set[str] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def handle_error(self, request, client_address) -> None:
+        """Clients dropping pooled keep-alive connections is expected, not worth a traceback."""
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def add_cached_content(self) -> str:
+        with self._lock:
+            name = f"cachedContents/fake-{len(self.cached_contents) + 1}"
+            self.cached_contents.add(name)
+        return name
+
+    def has_cached_content(self, name: str) -> bool:
+        return name in self.cached_contents
+
+    def start(self) -> "FakeProviderServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def point_providers_at(base_url: str) -> None:
+    """Send every provider call of this process to base_url."""
+    import model
+
+    model._API_URL = f"{base_url}/v1/chat/completions"
+    model._GEMINI_API_URL = f"{base_url}/v1beta/models"
+    os.environ["OLLAMA_API_URL"] = f"{base_url}/api/chat"
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("GOOGLE_API_KEY", "fake")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve fake OpenAI, Ollama and Gemini endpoints.")
+    parser.add_argument("--port", type=int, default=18555)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- seconds added to latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument("--chunk-size", type=int, default=8, help="Characters per streamed chunk")
+    args = parser.parse_args()
+
+    config = FakeConfig(args.latency, args.jitter, args.error_rate, args.error_status, args.chunk_delay, args.chunk_size)
+    server = FakeProviderServer(config, args.port)
+    print(f"Fake providers on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""End-to-end latency benchmark against local fake provider servers.
+
+Every provider call of this process goes to a FakeProviderServer (see
+fake_providers.py). The suite then drives ``main.get_command_suggestions``
+for each provider, with and without streaming and from a warm cache, and
+runs the full ``main()`` loop with scripted input (regenerate once, then
+quit). It reports p50/p95/p99 latency, errors, peak and retained memory
+from tracemalloc, and the cold-start time of ``aih --history``/``--help``.
+
+    python bench/latency.py --latency 0.05 --jitter 0.02 --save baseline
+    python bench/latency.py --latency 0.05 --jitter 0.02 --compare baseline
+
+Baselines are JSON files in bench/baselines/. Comparing fails (exit code 1)
+when a percentile grew by more than --threshold.
+"""
+import argparse
+import builtins
+import contextlib
+import datetime
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+BENCH_DIR = Path(__file__).resolve().parent
+PROJECT_DIR = BENCH_DIR.parent
+BASELINE_DIR = BENCH_DIR / "baselines"
+sys.path.insert(0, str(PROJECT_DIR))
+
+from fake_providers import FakeConfig, FakeProviderServer, point_providers_at  # noqa: E402
+from startup import time_runs  # noqa: E402
+
+PROMPT = "find the largest files in this directory"
+CONTEXT = "User preferences: prefer GNU coreutils, never use sudo."
+PROVIDER_MODELS = {"openai": "openai/gpt-4o-mini", "ollama": "ollama/llama3", "gemini": "gemini/gemini-2.0-flash"}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def _suggest(model_name: str, stream: bool, use_cache: bool) -> Callable[[], None]:
+    import main
+
+    def run() -> None:
+        main.get_command_suggestions(
+            PROMPT, CONTEXT, model_name, 3, use_cache=use_cache, stream=stream, local=[],
+        )
+    return run
+
+
+def _main_loop(model_name: str) -> Callable[[], None]:
+    """One aih session: suggestions, 'r' to regenerate, then 'q'."""
+    import main
+
+    def run() -> None:
+        answers = iter(["r", "q"])
+        argv = sys.argv
+        real_input = builtins.input
+        sys.argv = ["aih", "--model", model_name, "--no-cache", *PROMPT.split()]
+        builtins.input = lambda prompt="": next(answers)
+        try:
+            main.main()
+        finally:
+            sys.argv = argv
+            builtins.input = real_input
+    return run
+
+
+def scenarios(providers: List[str]) -> Dict[str, Callable[[], None]]:
+    result: Dict[str, Callable[[], None]] = {}
+    for provider in providers:
+        model_name = PROVIDER_MODELS[provider]
+        result[provider] = _suggest(model_name, stream=False, use_cache=False)
+        result[f"{provider}-stream"] = _suggest(model_name, stream=True, use_cache=False)
+    first = PROVIDER_MODELS[providers[0]]
+    result["cached"] = _suggest(first, stream=False, use_cache=True)
+    result["main-loop"] = _main_loop(first)
+    return result
+
+
+def measure(run: Callable[[], None], iterations: int, alloc_iterations: int) -> Dict[str, float]:
+    """Time iterations calls of run, then measure memory over a few more under tracemalloc."""
+    times: List[float] = []
+    errors = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Untimed first call: fills the cache and opens the pooled connection
+        try:
+            run()
+        except RuntimeError:
+            pass
+        for _ in range(iterations):
+            started = time.perf_counter()
+            try:
+                run()
+            except RuntimeError:
+                errors += 1
+                continue
+            times.append((time.perf_counter() - started) * 1000)
+
+        # Separate pass, tracing allocations would distort the timings
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for _ in range(alloc_iterations):
+            try:
+                run()
+            except RuntimeError:
+                pass
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    stats = {"errors": errors, "peak_kib": (peak - before) / 1024, "retained_kib": (current - before) / 1024}
+    if times:
+        stats.update(
+            p50=percentile(times, 50), p95=percentile(times, 95), p99=percentile(times, 99),
+            mean=statistics.fmean(times),
+        )
+    return stats
+
+
+def startup_times(runs: int) -> Dict[str, float]:
+    results = {"python": statistics.median(time_runs([sys.executable, "-c", "pass"], runs))}
+    for flag in ("--history", "--help"):
+        results[flag] = statistics.median(time_runs([sys.executable, "-m", "main", flag], runs))
+    return results
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> bool:
+    """Print percentile changes against baseline; return True when one regressed beyond threshold."""
+    regressed = False
+    print(f"\nCompared with baseline from {baseline['meta']['date']}:")
+    for name, stats in current["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if not old:
+            continue
+        changes = []
+        for key in ("p50", "p95", "p99"):
+            if key not in stats or key not in old or not old[key]:
+                continue
+            change = stats[key] / old[key] - 1
+            flag = " !" if change > threshold else ""
+            regressed = regressed or bool(flag)
+            changes.append(f"{key} {change:+6.1%}{flag}")
+        print(f"  {name:<16} {'  '.join(changes)}")
+    for name, value in current.get("startup", {}).items():
+        old = baseline.get("startup", {}).get(name)
+        if old:
+            print(f"  startup {name:<8} {value / old - 1:+6.1%}")
+    return regressed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark aih against local fake providers.")
+    parser.add_argument("--iterations", type=int, default=30, help="Timed calls per scenario (default 30)")
+    parser.add_argument("--alloc-iterations", type=int, default=5, help="Calls traced for memory (default 5)")
+    parser.add_argument("--providers", default="openai,ollama,gemini", help="Comma separated providers to run")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake time to first byte in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Uniform +/- seconds added to latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake requests that fail")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="Seconds between streamed chunks")
+    parser.add_argument("--chunk-size", type=int, default=8, help="Characters per streamed chunk")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for jitter and errors")
+    parser.add_argument("--startup-runs", type=int, default=10, help="Cold starts per command, 0 to skip")
+    parser.add_argument("--save", metavar="NAME", help="Save the results as bench/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="Compare with bench/baselines/NAME.json")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative slowdown (default 0.2)")
+    args = parser.parse_args()
+
+    providers = [p.strip() for p in args.providers.split(",") if p.strip() in PROVIDER_MODELS]
+    if not providers:
+        parser.error(f"--providers must name some of {', '.join(PROVIDER_MODELS)}")
+
+    config = FakeConfig(args.latency, args.jitter, args.error_rate, chunk_delay=args.chunk_delay,
+                        chunk_size=args.chunk_size, seed=args.seed)
+    server = FakeProviderServer(config).start()
+    point_providers_at(server.base_url)
+
+    import main
+    import session
+    import usage
+    from cache import SuggestionCache
+
+    # Keep the user's cache and history out of the measurements, and the fake answers out of the
+    # user's sessions, usage stats and journal; these are still written, their cost is part of a round
+    tmp = tempfile.TemporaryDirectory()
+    main._cache = SuggestionCache(Path(tmp.name) / "cache.sqlite")
+    main.HISTORY_SUGGESTIONS = 0
+    session.SESSIONS_FILE = Path(tmp.name) / "sessions.json"
+    usage._stats = usage.UsageStats(Path(tmp.name) / "usage.json")
+    os.environ["JOURNAL_FILE"] = str(Path(tmp.name) / "journal.jsonl")
+
+    results: Dict = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "fake": {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate,
+                     "chunk_delay": args.chunk_delay, "chunk_size": args.chunk_size},
+        },
+        "scenarios": {},
+    }
+
+    print(f"{'scenario':<16} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7} {'peak KiB':>9} {'kept KiB':>9}")
+    for name, run in scenarios(providers).items():
+        stats = measure(run, args.iterations, args.alloc_iterations)
+        results["scenarios"][name] = stats
+        if "p50" in stats:
+            timing = f"{stats['p50']:8.1f} {stats['p95']:8.1f} {stats['p99']:8.1f}"
+        else:
+            timing = f"{'-':>8} {'-':>8} {'-':>8}"
+        print(f"{name:<16} {timing} {stats['errors']:7d} {stats['peak_kib']:9.1f} {stats['retained_kib']:9.1f}")
+    print("(latencies in ms)")
+
+    if args.startup_runs > 0:
+        results["startup"] = startup_times(args.startup_runs)
+        print("\nStartup (median ms): " + "  ".join(f"{k} {v:.1f}" for k, v in results["startup"].items()))
+
+    server.stop()
+    tmp.cleanup()
+
+    regressed = False
+    if args.compare:
+        baseline = json.loads((BASELINE_DIR / f"{args.compare}.json").read_text())
+        regressed = compare(results, baseline, args.threshold)
+    if args.save:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        path = BASELINE_DIR / f"{args.save}.json"
+        path.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nSaved baseline to {path.relative_to(PROJECT_DIR)}")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Measure aih cold-start time for commands that should never touch the network.
+
+Runs ``python -m main`` for each command several times from the project
+directory and reports the median and worst wall time next to the bare
+interpreter's start time. It fails when a median exceeds the target or when
+one of the network modules is imported.
+
+    python bench/startup.py                 # --history and --help, 50 ms target
+    python bench/startup.py --relative      # target applies to time over the bare interpreter
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Set
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+# Modules a local-only command must not load
+FORBIDDEN_MODULES = {"requests", "urllib3", "charset_normalizer", "idna", "model", "transport", "sqlite3"}
+
+COMMANDS = [["--history"], ["--help"]]
+
+
+def time_runs(args: List[str], runs: int) -> List[float]:
+    """Wall time in ms of each of runs executions of args from the project directory."""
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(args, cwd=PROJECT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+
+def imported_modules(command: List[str]) -> Set[str]:
+    """Names of all modules imported while running command, from -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "main", *command],
+        cwd=PROJECT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=False,
+    )
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            name = line.rsplit("|", 1)[1].strip()
+            modules.add(name.split(".")[0])
+    return modules
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=15, help="Runs per command (default 15)")
+    parser.add_argument("--target", type=float, default=50.0, help="Maximum median in ms (default 50)")
+    parser.add_argument("--relative", action="store_true", help="Apply the target to the time over the bare interpreter")
+    args = parser.parse_args()
+
+    # Keep local state out of the picture: an empty command log is enough for --history
+    os.environ.setdefault("AIH_CWD", str(PROJECT_DIR))
+    # One untimed run warms the bytecode and .env caches
+    subprocess.run([sys.executable, "-m", "main", "--help"], cwd=PROJECT_DIR, stdout=subprocess.DEVNULL, check=False)
+
+    baseline = statistics.median(time_runs([sys.executable, "-c", "pass"], args.runs))
+    print(f"{'python -c pass':<20} median {baseline:6.1f} ms")
+
+    failed = False
+    for command in COMMANDS:
+        times = time_runs([sys.executable, "-m", "main", *command], args.runs)
+        median = statistics.median(times)
+        measured = median - baseline if args.relative else median
+        status = "ok" if measured <= args.target else "SLOW"
+        print(f"{'aih ' + ' '.join(command):<20} median {median:6.1f} ms  max {max(times):6.1f} ms  "
+              f"over interpreter {median - baseline:6.1f} ms  [{status}]")
+        leaked = sorted(imported_modules(command) & FORBIDDEN_MODULES)
+        if leaked:
+            print(f"  imports {', '.join(leaked)}, which local-only commands must not load")
+        failed = failed or status != "ok" or bool(leaked)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
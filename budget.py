@@ -0,0 +1,148 @@
+"""Token-budgeted context assembly.
+
+Context parts are estimated with a local tokenizer approximation, shrunk with
+truncation strategies and packed by priority so the prompt stays within
+CONTEXT_TOKEN_BUDGET whatever the environment produces.
+"""
+import re
+from typing import List, Optional, Tuple
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_DIGITS_RE = re.compile(r"\d+")
+
+# Parts smaller than this after truncation are dropped rather than sent as a stub
+MIN_PART_TOKENS = 16
+
+# Separates the stable context (same on every call) from the volatile rest
+STABLE_PREFIX_END = "\n\n[end of stable context]\n\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate BPE token count: one per word or symbol, plus one per extra 6 chars of long words."""
+    count = 0
+    for piece in _TOKEN_RE.findall(text):
+        count += 1 + (len(piece) - 1) // 6
+    return count
+
+
+def collapse_repeats(text: str, keep: int = 2) -> str:
+    """Summarize runs of similar lines (equal once digits are ignored), keeping the first few of each run."""
+    lines = text.splitlines()
+    out: List[str] = []
+    idx = 0
+    while idx < len(lines):
+        shape = _DIGITS_RE.sub("0", lines[idx])
+        end = idx + 1
+        while end < len(lines) and _DIGITS_RE.sub("0", lines[end]) == shape:
+            end += 1
+        run = end - idx
+        out.extend(lines[idx:idx + min(run, keep)])
+        if run > keep + 1:
+            out.append(f"[... {run - keep} similar lines ...]")
+        elif run == keep + 1:
+            out.append(lines[end - 1])
+        idx = end
+    return "\n".join(out)
+
+
+def head_tail(text: str, max_tokens: int, head_share: float = 0.6) -> str:
+    """Keep whole lines from the start and the end of text within max_tokens."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lines = text.splitlines()
+    head: List[str] = []
+    tail: List[str] = []
+    used = 0
+    head_budget = int(max_tokens * head_share)
+
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > head_budget:
+            break
+        head.append(line)
+        used += cost
+    for line in reversed(lines[len(head):]):
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        tail.insert(0, line)
+        used += cost
+
+    omitted = len(lines) - len(head) - len(tail)
+    if not head and not tail:
+        # A single huge line: cut by characters at roughly four per token
+        return text[:max_tokens * 4] + " [... truncated ...]"
+    return "\n".join(head + [f"[... {omitted} lines omitted ...]"] + tail)
+
+
+def shrink(text: str, max_tokens: int) -> str:
+    """Fit text into max_tokens, first collapsing repeated lines, then cutting the middle."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return head_tail(collapse_repeats(text), max_tokens)
+
+
+class ContextPart:
+    """A named piece of context with a priority (higher is kept first) and an optional token cap.
+
+    Stable parts (the same on every call, like commands.md) are fitted before
+    all others, so their shrunk text never depends on the volatile parts.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        text: str,
+        priority: int,
+        max_tokens: Optional[int] = None,
+        stable: bool = False,
+    ) -> None:
+        self.name = name
+        self.text = text
+        self.priority = priority
+        self.max_tokens = max_tokens
+        self.stable = stable
+
+
+def _fit(parts: List[ContextPart], budget: int) -> List[Optional[str]]:
+    fitted: List[Optional[str]] = [None] * len(parts)
+    remaining = budget
+    for idx in sorted(range(len(parts)), key=lambda i: (parts[i].stable, parts[i].priority), reverse=True):
+        part = parts[idx]
+        if not part.text:
+            continue
+        allowance = min(remaining, part.max_tokens) if part.max_tokens else remaining
+        if allowance < MIN_PART_TOKENS:
+            continue
+        text = shrink(part.text, allowance)
+        fitted[idx] = text
+        remaining -= estimate_tokens(text)
+    return fitted
+
+
+def assemble(parts: List[ContextPart], budget: int) -> List[str]:
+    """Return the texts of parts in their original order, shrunk to fit budget by priority."""
+    return [text for text in _fit(parts, budget) if text]
+
+
+def assemble_context(parts: List[ContextPart], budget: int) -> Optional[str]:
+    """Fit parts into budget and join them: stable parts, then STABLE_PREFIX_END, then the volatile ones.
+
+    Keeping the stable prefix byte-identical between calls lets providers reuse
+    their cached evaluation of it.
+    """
+    fitted = _fit(parts, budget)
+    stable = "\n\n".join(text for part, text in zip(parts, fitted) if text and part.stable)
+    volatile = "\n\n".join(text for part, text in zip(parts, fitted) if text and not part.stable)
+    if not volatile:
+        return stable or None
+    return stable + STABLE_PREFIX_END + volatile
+
+
+def split_context(context: Optional[str]) -> Tuple[str, str]:
+    """Split a context from assemble_context into its stable prefix and volatile rest.
+
+    A context without the separator (e.g. one given in a batch file) is all stable.
+    """
+    stable, _, volatile = (context or "").partition(STABLE_PREFIX_END)
+    return stable, volatile
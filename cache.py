@@ -0,0 +1,96 @@
+"""Persistent on-disk cache for model suggestions."""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+CACHE_FILE = Path(__file__).with_name(".aih_cache.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS suggestions (
+    key TEXT PRIMARY KEY,
+    suggestions TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase the prompt and collapse whitespace so trivial variations share a key."""
+    return " ".join(prompt.lower().split())
+
+
+def cache_key(model_name: str, prompt: str, context: Optional[str], max_suggestions: int) -> str:
+    """Return the cache key for a request: model, normalized prompt and context hash."""
+    context_hash = hashlib.sha256((context or "").encode("utf-8")).hexdigest()
+    raw = "\0".join([model_name, normalize_prompt(prompt), context_hash, str(max_suggestions)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SuggestionCache:
+    """SQLite backed suggestion cache with TTL expiry and LRU eviction."""
+
+    def __init__(self, path: Path = CACHE_FILE, ttl: float = 86400, max_entries: int = 500) -> None:
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=2, check_same_thread=False)
+            self._conn.execute(_SCHEMA)
+        return self._conn
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """Return cached suggestions for key, or None when missing or expired."""
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT suggestions, created FROM suggestions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            now = time.time()
+            if self.ttl > 0 and now - row[1] > self.ttl:
+                with conn:
+                    conn.execute("DELETE FROM suggestions WHERE key = ?", (key,))
+                return None
+
+            with conn:
+                conn.execute("UPDATE suggestions SET last_used = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+
+    def put(self, key: str, suggestions: List[str]) -> None:
+        """Store suggestions under key and evict least recently used entries."""
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO suggestions (key, suggestions, created, last_used) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(suggestions), now, now),
+                )
+                if self.ttl > 0:
+                    conn.execute("DELETE FROM suggestions WHERE created < ?", (now - self.ttl,))
+                conn.execute(
+                    "DELETE FROM suggestions WHERE key NOT IN "
+                    "(SELECT key FROM suggestions ORDER BY last_used DESC LIMIT ?)",
+                    (self.max_entries,),
+                )
+
+    def clear(self) -> int:
+        """Remove every cached entry and return how many were removed."""
+        with self._lock:
+            if not self.path.exists():
+                return 0
+            conn = self._connect()
+            with conn:
+                removed = conn.execute("DELETE FROM suggestions").rowcount
+            return removed
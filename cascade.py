@@ -0,0 +1,162 @@
+"""Local-first cascade: a small local model answers, a cloud model only when it has to.
+
+``--model cascade/<cloud model>`` first asks CASCADE_LOCAL (an Ollama model)
+and waits at most CASCADE_LOCAL_TIMEOUT seconds. Its answer is scored with
+the local checks of validate.py: the share of suggestions that parse with
+``bash -n``, only run programs found on $PATH and are more than an ``echo``
+of a literal string. Below CASCADE_MIN_SCORE, on timeout or on error the
+cloud model is asked instead.
+
+The outcome and latency of each tier for the last CASCADE_WINDOW requests
+are kept in CASCADE_STATS_FILE; ``python cascade.py stats`` prints the
+escalation rate and latency percentiles for tuning the thresholds.
+"""
+import functools
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import time_budget
+import timings
+from router import SuggestFn, percentile
+from validate import PathIndex, Validator, command_names
+
+CASCADE_STATS_FILE = Path(__file__).with_name(".aih_cascade.json")
+DEFAULT_LOCAL_MODEL = "ollama/phi4-mini:latest"
+
+# Outcomes of the local tier; everything but "local" means the cloud model was asked
+OUTCOMES = ("local", "rejected", "timeout", "error")
+
+
+class CascadeStats:
+    """Rolling outcomes and per-tier latencies persisted between invocations."""
+
+    def __init__(self, path: Path = CASCADE_STATS_FILE, window: int = 200) -> None:
+        self.path = Path(path)
+        self.window = window
+        self._data: Dict[str, list] = {"outcomes": [], "local": [], "cloud": []}
+        try:
+            self._data.update(json.loads(self.path.read_text()))
+        except (OSError, ValueError, TypeError):
+            pass
+
+    def record(self, tier: str, latency: float, outcome: Optional[str] = None) -> None:
+        """Add the latency of tier and, for the local tier, its outcome."""
+        self._data[tier] = (self._data[tier] + [round(latency, 3)])[-self.window:]
+        if outcome:
+            self._data["outcomes"] = (self._data["outcomes"] + [outcome])[-self.window:]
+
+    def escalation_rate(self) -> Optional[float]:
+        outcomes = self._data["outcomes"]
+        return sum(1 for o in outcomes if o != "local") / len(outcomes) if outcomes else None
+
+    def summary(self) -> str:
+        outcomes = self._data["outcomes"]
+        if not outcomes:
+            return "No cascaded requests recorded yet."
+        counts = ", ".join(f"{o} {outcomes.count(o)}" for o in OUTCOMES)
+        lines = [f"Requests: {len(outcomes)} ({counts})",
+                 f"Escalation rate: {self.escalation_rate():.0%}"]
+        for tier in ("local", "cloud"):
+            latencies = self._data[tier]
+            if latencies:
+                lines.append(f"{tier.capitalize()} latency: p50 {percentile(latencies, 50):.2f}s, "
+                             f"p90 {percentile(latencies, 90):.2f}s ({len(latencies)} calls)")
+        return "\n".join(lines)
+
+    def save(self) -> None:
+        tmp = self.path.with_suffix(".tmp")
+        try:
+            tmp.write_text(json.dumps(self._data))
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+
+@functools.lru_cache(maxsize=1)
+def _validator() -> Validator:
+    # No blacklist here: main screens the final answer against commands.md anyway
+    return Validator(path_index=PathIndex.load())
+
+
+def _trivial(cmd: str) -> bool:
+    """An echo or printf of a literal string, what small models answer when they don't know."""
+    return command_names(cmd) in (["echo"], ["printf"]) and "$" not in cmd and "`" not in cmd
+
+
+def score(suggestions: List[str], validator: Optional[Validator] = None) -> float:
+    """Share of suggestions that pass every local check."""
+    if not suggestions:
+        return 0.0
+    validator = validator or _validator()
+    verdicts = validator.check_all(suggestions)
+    good = sum(1 for v in verdicts if not v.drop and not v.reason and not _trivial(v.cmd))
+    return good / len(suggestions)
+
+
+def _ask_local(prompt: str, context: Optional[str], max_suggestions: int, suggest: SuggestFn, model: str,
+               timeout: float) -> Tuple[str, Optional[List[str]], float]:
+    """(outcome, suggestions, latency) of the local model, giving up after timeout seconds."""
+    results: "queue.Queue[Tuple[Optional[List[str]], Optional[Exception]]]" = queue.Queue()
+
+    def attempt() -> None:
+        try:
+            results.put((suggest(prompt, context, model, max_suggestions), None))
+        except Exception as e:
+            results.put((None, e))
+
+    started = time.monotonic()
+    # Daemon thread so a local model that is still thinking never delays exit
+    threading.Thread(target=time_budget.propagate(attempt), daemon=True).start()
+    try:
+        suggestions, error = results.get(timeout=timeout)
+    except queue.Empty:
+        return "timeout", None, time.monotonic() - started
+    latency = time.monotonic() - started
+    if error is not None:
+        return "error", None, latency
+    return "local", suggestions, latency
+
+
+def local_model() -> str:
+    return os.environ.get("CASCADE_LOCAL", DEFAULT_LOCAL_MODEL)
+
+
+def cascade(prompt: str, context: Optional[str], max_suggestions: int, cloud_model: str,
+            suggest: SuggestFn) -> List[str]:
+    """Answer with CASCADE_LOCAL when its suggestions pass the local checks, else with cloud_model."""
+    if not cloud_model:
+        raise RuntimeError("cascade needs a cloud model, e.g. cascade/openai/gpt-4o-mini")
+    timeout = time_budget.cap(float(os.environ.get("CASCADE_LOCAL_TIMEOUT", 2.0)))
+    min_score = float(os.environ.get("CASCADE_MIN_SCORE", 0.5))
+    stats = CascadeStats(window=int(os.environ.get("CASCADE_WINDOW", 200)))
+
+    try:
+        with timings.phase("cascade local"):
+            outcome, suggestions, latency = _ask_local(prompt, context, max_suggestions, suggest, local_model(),
+                                                       timeout)
+        if outcome == "local":
+            with timings.phase("cascade scoring"):
+                if score(suggestions or []) >= min_score:
+                    stats.record("local", latency, "local")
+                    return suggestions or []
+            outcome = "rejected"
+        stats.record("local", latency, outcome)
+
+        started = time.monotonic()
+        with timings.phase("cascade cloud"):
+            try:
+                return suggest(prompt, context, cloud_model, max_suggestions)
+            finally:
+                stats.record("cloud", time.monotonic() - started)
+    finally:
+        stats.save()
+
+
+if __name__ == "__main__" and sys.argv[1:] == ["stats"]:
+    print(CascadeStats().summary())
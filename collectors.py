@@ -0,0 +1,269 @@
+"""Built-in context collectors that read system state without forking shell tools.
+
+Each collector takes the user's working directory and returns a short text
+block (or None when it has nothing to say). They read what ``ls``, ``git``,
+``uname``, ``df``, ``free`` and ``ps`` would print straight from
+``os.scandir``, ``.git`` files, ``os.uname``, ``os.statvfs`` and ``/proc``, so
+all of them together take a few milliseconds. CONTEXT_COLLECTORS selects the
+ones that run; ``.aih_context.sh`` stays available for anything else.
+"""
+import os
+import re
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import time_budget
+import timings
+
+MAX_LISTING_ENTRIES = 40
+MAX_BRANCHES = 10
+TOP_PROCESSES = 5
+
+_SHA_RE = re.compile(r"^[0-9a-f]{40}([0-9a-f]{24})?$")
+
+
+def _size(num: float) -> str:
+    """Human readable size like ls -h and df -h."""
+    for unit in ("B", "K", "M", "G", "T"):
+        if num < 1024 or unit == "T":
+            return f"{num:.0f}{unit}" if unit == "B" or num >= 10 else f"{num:.1f}{unit}"
+        num /= 1024
+    return f"{num:.1f}P"
+
+
+def listing(cwd: str) -> Optional[str]:
+    """Entries of cwd, directories first, files with their size."""
+    dirs: List[str] = []
+    files: List[str] = []
+    try:
+        with os.scandir(cwd) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        dirs.append(entry.name + "/")
+                    else:
+                        files.append(f"{entry.name} {_size(entry.stat().st_size)}")
+                except OSError:
+                    files.append(entry.name)
+    except OSError:
+        return None
+    names = sorted(dirs) + sorted(files)
+    shown = names[:MAX_LISTING_ENTRIES]
+    more = f", … {len(names) - len(shown)} more" if len(names) > len(shown) else ""
+    return f"# Directory listing ({len(names)} entries)\n" + ", ".join(shown) + more
+
+
+def _find_git_dir(cwd: str) -> Optional[Tuple[Path, Path]]:
+    """(repository root, git dir) of the repository containing cwd."""
+    path = Path(cwd).resolve()
+    for root in [path, *path.parents]:
+        dot_git = root / ".git"
+        if dot_git.is_dir():
+            return root, dot_git
+        if dot_git.is_file():
+            # Worktrees and submodules: ".git" holds "gitdir: <path>"
+            try:
+                content = dot_git.read_text().strip()
+            except OSError:
+                return None
+            if content.startswith("gitdir:"):
+                return root, (root / content[7:].strip()).resolve()
+    return None
+
+
+def _read(path: Path) -> Optional[str]:
+    try:
+        return path.read_text().strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _packed_refs(common_dir: Path) -> Dict[str, str]:
+    refs: Dict[str, str] = {}
+    for line in (_read(common_dir / "packed-refs") or "").splitlines():
+        sha, _, name = line.partition(" ")
+        if _SHA_RE.match(sha) and name:
+            refs[name] = sha
+    return refs
+
+
+def _resolve_ref(common_dir: Path, packed: Dict[str, str], ref: str) -> Optional[str]:
+    loose = _read(common_dir / ref)
+    if loose and _SHA_RE.match(loose):
+        return loose
+    return packed.get(ref)
+
+
+def _upstream(common_dir: Path, branch: str) -> Optional[Tuple[str, str]]:
+    """(remote, branch) configured as upstream of branch in .git/config."""
+    section = None
+    remote = merge = None
+    for line in (_read(common_dir / "config") or "").splitlines():
+        line = line.strip()
+        if line.startswith("["):
+            section = line
+        elif section == f'[branch "{branch}"]':
+            key, _, value = (part.strip() for part in line.partition("="))
+            if key == "remote":
+                remote = value
+            elif key == "merge":
+                merge = value
+    if remote and merge and merge.startswith("refs/heads/"):
+        return remote, merge[len("refs/heads/"):]
+    return None
+
+
+def git(cwd: str) -> Optional[str]:
+    """Branch, HEAD commit, upstream, local branches and any operation in progress, from .git files."""
+    found = _find_git_dir(cwd)
+    if not found:
+        return None
+    root, git_dir = found
+    common = _read(git_dir / "commondir")
+    common_dir = (git_dir / common).resolve() if common else git_dir
+    packed = _packed_refs(common_dir)
+
+    head = _read(git_dir / "HEAD") or ""
+    lines = [f"# Git repository {root}"]
+    if head.startswith("ref:"):
+        ref = head[4:].strip()
+        branch = ref[len("refs/heads/"):] if ref.startswith("refs/heads/") else ref
+        sha = _resolve_ref(common_dir, packed, ref)
+        lines.append(f"Branch: {branch} at {sha[:10] if sha else '(no commits yet)'}")
+        upstream = _upstream(common_dir, branch)
+        if upstream:
+            remote_sha = _resolve_ref(common_dir, packed, f"refs/remotes/{upstream[0]}/{upstream[1]}")
+            state = "same commit" if remote_sha == sha else f"at {remote_sha[:10]}" if remote_sha else "not fetched"
+            lines.append(f"Upstream: {upstream[0]}/{upstream[1]} ({state})")
+    else:
+        lines.append(f"Detached HEAD at {head[:10]}")
+
+    branches = {name[len("refs/heads/"):] for name in packed if name.startswith("refs/heads/")}
+    heads_dir = common_dir / "refs" / "heads"
+    for dirpath, _, filenames in os.walk(heads_dir):
+        for filename in filenames:
+            branches.add(str((Path(dirpath) / filename).relative_to(heads_dir)))
+    if branches:
+        names = sorted(branches)
+        more = f", … {len(names) - MAX_BRANCHES} more" if len(names) > MAX_BRANCHES else ""
+        lines.append(f"Local branches: {', '.join(names[:MAX_BRANCHES])}{more}")
+
+    in_progress = [label for marker, label in (
+        ("MERGE_HEAD", "merge"), ("rebase-merge", "rebase"), ("rebase-apply", "rebase"),
+        ("CHERRY_PICK_HEAD", "cherry-pick"), ("REVERT_HEAD", "revert"), ("BISECT_LOG", "bisect"),
+    ) if (git_dir / marker).exists()]
+    if in_progress:
+        lines.append(f"In progress: {', '.join(dict.fromkeys(in_progress))}")
+    if (common_dir / "refs" / "stash").exists() or "refs/stash" in packed:
+        lines.append("Has stashed changes")
+    return "\n".join(lines)
+
+
+def system(cwd: str) -> Optional[str]:
+    """Kernel, machine and distribution."""
+    uname = os.uname()
+    line = f"{uname.sysname} {uname.release} {uname.machine} (host {uname.nodename})"
+    for entry in (_read(Path("/etc/os-release")) or "").splitlines():
+        if entry.startswith("PRETTY_NAME="):
+            line += ", " + entry.split("=", 1)[1].strip('"')
+            break
+    return f"# System\n{line}"
+
+
+def disk(cwd: str) -> Optional[str]:
+    """Size and free space of the filesystem holding cwd."""
+    try:
+        st = os.statvfs(cwd)
+    except OSError:
+        return None
+    total = st.f_blocks * st.f_frsize
+    free = st.f_bavail * st.f_frsize
+    used_pct = 100 * (1 - st.f_bavail / st.f_blocks) if st.f_blocks else 0
+    return f"# Disk space\n{_size(free)} free of {_size(total)} ({used_pct:.0f}% used)"
+
+
+def _meminfo() -> Dict[str, int]:
+    info: Dict[str, int] = {}
+    for line in (_read(Path("/proc/meminfo")) or "").splitlines():
+        key, _, value = line.partition(":")
+        fields = value.split()
+        if fields and fields[0].isdigit():
+            info[key] = int(fields[0]) * 1024
+    return info
+
+
+def memory(cwd: str) -> Optional[str]:
+    """Total and available memory and swap, from /proc/meminfo."""
+    info = _meminfo()
+    if "MemTotal" not in info:
+        return None
+    line = f"{_size(info.get('MemAvailable', info.get('MemFree', 0)))} available of {_size(info['MemTotal'])}"
+    if info.get("SwapTotal"):
+        line += f", swap {_size(info.get('SwapFree', 0))} free of {_size(info['SwapTotal'])}"
+    return f"# Memory\n{line}"
+
+
+def load(cwd: str) -> Optional[str]:
+    """Load averages and CPU count, from /proc/loadavg."""
+    fields = (_read(Path("/proc/loadavg")) or "").split()
+    if len(fields) < 3:
+        return None
+    return f"# Load\n{' '.join(fields[:3])} (1, 5, 15 min) on {os.cpu_count()} CPUs"
+
+
+def processes(cwd: str) -> Optional[str]:
+    """Processes using the most CPU, computed from /proc/<pid>/stat like ps %CPU."""
+    try:
+        uptime = float((_read(Path("/proc/uptime")) or "").split()[0])
+        pids = [name for name in os.listdir("/proc") if name.isdigit()]
+    except (OSError, IndexError, ValueError):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    usage: List[Tuple[float, str, str]] = []
+    for pid in pids:
+        stat = _read(Path("/proc") / pid / "stat")
+        if not stat:
+            continue
+        # The command name is in parentheses and may itself contain spaces or parentheses
+        name = stat[stat.find("(") + 1:stat.rfind(")")]
+        fields = stat[stat.rfind(")") + 2:].split()
+        try:
+            cpu_seconds = (int(fields[11]) + int(fields[12])) / ticks
+            elapsed = uptime - int(fields[19]) / ticks
+        except (IndexError, ValueError):
+            continue
+        usage.append((100 * cpu_seconds / elapsed if elapsed > 0 else 0.0, pid, name))
+    usage.sort(reverse=True)
+    lines = [f"{name} (pid {pid}) {pct:.1f}%" for pct, pid, name in usage[:TOP_PROCESSES]]
+    return f"# Top processes by CPU ({len(pids)} running)\n" + "\n".join(lines)
+
+
+COLLECTORS: Dict[str, Callable[[str], Optional[str]]] = {
+    "listing": listing,
+    "git": git,
+    "system": system,
+    "disk": disk,
+    "memory": memory,
+    "load": load,
+    "processes": processes,
+}
+
+
+def collect(names: Sequence[str], cwd: str) -> List[str]:
+    """Output of the named collectors, in the given order; unknown names and failures are skipped."""
+    outputs = []
+    for name in names:
+        collector = COLLECTORS.get(name.strip())
+        if collector is None:
+            continue
+        if time_budget.expired():
+            time_budget.cut(f"collector {name.strip()}")
+            continue
+        with timings.phase(f"collector {name.strip()}"):
+            try:
+                output = collector(cwd)
+            except Exception:
+                output = None  # Context is best effort, never worth failing the request
+        if output:
+            outputs.append(output)
+    return outputs
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""Append-only log of executed commands.
+
+Each execution appends one line, ``TIMESTAMP [CWD] $ COMMAND``, under an
+exclusive lock on a side lock file, so concurrent terminals never lose
+entries. Once the file has grown well past the history limit a detached
+process compacts it back to the newest entries. Reads walk the file
+backwards from the end, so filtered, paginated history stays fast however
+long the log is.
+"""
+import datetime
+import fcntl
+import os
+import re
+import subprocess
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+# Lines written before cwd was recorded have no [CWD] part
+_LINE_RE = re.compile(r"^(?P<ts>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?: \[(?P<cwd>.*?)\])? \$ (?P<cmd>.*)$")
+
+# Rough size of one entry: below 2 * max_entries * _ENTRY_BYTES bytes compaction is not even considered
+_ENTRY_BYTES = 120
+_BLOCK_SIZE = 65536
+
+
+class LogEntry:
+    """One parsed command log line."""
+
+    def __init__(self, line: str, timestamp: str, cwd: Optional[str], cmd: str) -> None:
+        self.line = line
+        self.timestamp = timestamp
+        self.cwd = cwd
+        self.cmd = cmd
+
+
+def parse_line(line: str) -> Optional[LogEntry]:
+    match = _LINE_RE.match(line)
+    if not match:
+        return None
+    return LogEntry(line, match["ts"], match["cwd"], match["cmd"])
+
+
+@contextmanager
+def _locked(path: Path) -> Iterator[None]:
+    with open(path.with_name(path.name + ".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def append(path: Path, cmd: str, cwd: str, max_entries: int) -> None:
+    """Append one entry and start a background compaction when the file is far over max_entries."""
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    line = f"{timestamp} [{cwd}] $ {cmd.replace(chr(10), chr(92) + 'n')}\n"
+    with _locked(path):
+        with open(path, "a") as f:
+            f.write(line)
+            size = f.tell()
+
+    if size > 2 * max_entries * _ENTRY_BYTES and _estimated_entries(path, size) > 2 * max_entries:
+        subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve()), "compact", str(path), str(max_entries)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+
+def _estimated_entries(path: Path, size: int) -> float:
+    """Number of entries in the log, from the average length of the lines in its last block.
+
+    Logs of long commands stay over the size threshold even right after a
+    compaction; counting entries keeps them from being compacted on every append.
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(max(0, size - _BLOCK_SIZE))
+            block = f.read(_BLOCK_SIZE)
+    except OSError:
+        return 0.0
+    lines = block.count(b"\n")
+    return size * lines / len(block) if lines else 0.0
+
+
+def compact(path: Path, max_entries: int) -> None:
+    """Rewrite the log keeping only the newest max_entries lines."""
+    with _locked(path):
+        lines = []
+        for line in iter_lines_reversed(path):
+            lines.append(line)
+            if len(lines) >= max_entries:
+                break
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w") as f:
+            f.writelines(line + "\n" for line in reversed(lines))
+        os.replace(tmp, path)
+
+
+def iter_lines_reversed(path: Path) -> Iterator[str]:
+    """Yield the lines of path from last to first, reading it backwards in blocks."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b""
+        while position > 0:
+            step = min(_BLOCK_SIZE, position)
+            position -= step
+            f.seek(position)
+            block = f.read(step) + remainder
+            lines = block.split(b"\n")
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line.decode("utf-8", errors="replace")
+        if remainder:
+            yield remainder.decode("utf-8", errors="replace")
+
+
+def search(
+    path: Path,
+    text: Optional[str] = None,
+    regex: bool = False,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    cwd: Optional[str] = None,
+    limit: int = 50,
+    page: int = 1,
+) -> List[LogEntry]:
+    """Return one page of matching entries, oldest first; page 1 holds the newest matches.
+
+    since and until are "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS" prefixes compared
+    against the timestamp, so a bare date covers the whole day.
+    """
+    pattern = re.compile(text) if text and regex else None
+    skip = (page - 1) * limit
+    matches: List[LogEntry] = []
+    for line in iter_lines_reversed(path):
+        entry = parse_line(line)
+        if entry is None:
+            continue
+        if since and entry.timestamp < since:
+            break  # Entries are chronological, nothing older can match
+        if until and entry.timestamp[:len(until)] > until:
+            continue
+        if cwd and entry.cwd != cwd:
+            continue
+        if pattern is not None and not pattern.search(entry.cmd):
+            continue
+        if text and pattern is None and text.lower() not in entry.cmd.lower():
+            continue
+        if skip:
+            skip -= 1
+            continue
+        matches.append(entry)
+        if len(matches) >= limit:
+            break
+    return list(reversed(matches))
+
+
+if __name__ == "__main__" and len(sys.argv) == 4 and sys.argv[1] == "compact":
+    compact(Path(sys.argv[2]), int(sys.argv[3]))
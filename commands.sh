@@ -6,19 +6,82 @@ readonly AIH_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 AIH_FILE="$AIH_DIR/.aih_command"
 trap 'rm -f "$AIH_FILE"' EXIT
 
+# True when the setting named $1 is enabled in the environment or, failing that, in .env
+_aih_enabled() {
+  local value="${!1}"
+  case "${value,,}" in
+    true|yes|1) return 0 ;;
+    false|no|0) return 1 ;;
+  esac
+  grep -qsiE "^$1=(true|yes|1)\s*$" "$AIH_DIR/.env"
+}
+
+# In daemon mode skip `uv run` and call the project interpreter directly,
+# the resident server already holds the loaded environment
+_aih_use_daemon() {
+  _aih_enabled AIH_DAEMON
+}
+
+# --history and --help never reach a provider, so they skip `uv run` as well
+_aih_local_only() {
+  case "$1" in
+    --history|--help|-h) return 0 ;;
+  esac
+  return 1
+}
+
 aih() {
   rm -f "$AIH_FILE"
 
   trap 'rm -f "$AIH_FILE"' RETURN
 
-  ( cd "$AIH_DIR" && uv run python3 main.py "$@" )
+  # `-m main` instead of `main.py` lets Python reuse the compiled bytecode
+  if _aih_use_daemon && [[ -x "$AIH_DIR/.venv/bin/python3" ]]; then
+    ( export AIH_CWD="$PWD"; cd "$AIH_DIR" && "$AIH_DIR/.venv/bin/python3" -m main --daemon "$@" )
+  elif _aih_local_only "$@" && [[ -x "$AIH_DIR/.venv/bin/python3" ]]; then
+    ( export AIH_CWD="$PWD"; cd "$AIH_DIR" && "$AIH_DIR/.venv/bin/python3" -m main "$@" )
+  else
+    ( export AIH_CWD="$PWD"; cd "$AIH_DIR" && uv run python3 -m main "$@" )
+  fi
 
   if [[ -s "$AIH_FILE" ]]; then
     cmd=$(<"$AIH_FILE")
 
     history -s -- "$cmd"
     eval "$cmd"
-  else
+  elif [[ " $* " != *" --batch "* ]]; then
+    # Batch output is JSON lines, keep it clean
     echo "No command found."
   fi
 }
+
+# Warm-up: load the local model, build the indexes and, in daemon mode, open
+# provider connections in a detached background process, so it never delays the prompt
+_aih_warmup() {
+  if [[ -x "$AIH_DIR/.venv/bin/python3" ]]; then
+    ( cd "$AIH_DIR" && "$AIH_DIR/.venv/bin/python3" -m main --warmup >/dev/null 2>&1 & )
+  else
+    ( cd "$AIH_DIR" && uv run python3 -m main --warmup >/dev/null 2>&1 & )
+  fi
+}
+
+# Runs before each prompt; after AIH_WARMUP_IDLE seconds without one the
+# daemon, the local model and the connections have likely gone cold
+_aih_idle_warmup() {
+  local status=$?
+  if (( SECONDS - _AIH_LAST_PROMPT >= _AIH_WARMUP_IDLE )); then
+    _aih_warmup
+  fi
+  _AIH_LAST_PROMPT=$SECONDS
+  return $status
+}
+
+if [[ $- == *i* ]] && _aih_enabled AIH_WARMUP; then
+  _AIH_WARMUP_IDLE="${AIH_WARMUP_IDLE:-$(sed -n 's/^AIH_WARMUP_IDLE=\([0-9]*\).*/\1/p' "$AIH_DIR/.env" 2>/dev/null)}"
+  _AIH_WARMUP_IDLE="${_AIH_WARMUP_IDLE:-900}"
+  _AIH_LAST_PROMPT=$SECONDS
+  _aih_warmup
+  if [[ "$PROMPT_COMMAND" != *_aih_idle_warmup* ]]; then
+    PROMPT_COMMAND="${PROMPT_COMMAND:+$PROMPT_COMMAND$'\n'}_aih_idle_warmup"
+  fi
+fi
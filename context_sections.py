@@ -0,0 +1,241 @@
+"""Parallel, cached execution of sectioned .aih_context.sh scripts.
+
+A context script can be split into sections with marker comments::
+
+    # @section git timeout=2 cache=git ttl=300
+    git status -s
+
+Sections run concurrently, each with its own timeout (default 5 s). A section
+that times out is dropped instead of losing the whole context. Lines before
+the first marker (shebang, helper functions) are prepended to every section.
+
+``cache`` lists what a cached result depends on: ``cwd`` (the directory aih
+was started from) and ``git`` (the repository's HEAD and index). ``ttl`` caps
+the age of a cached result in seconds. Sections with neither always run.
+"""
+import hashlib
+import json
+import os
+import selectors
+import shlex
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import time_budget
+import timings
+
+SECTION_CACHE_FILE = Path(__file__).with_name(".aih_context_cache.json")
+SECTION_MARKER = "# @section"
+DEFAULT_TIMEOUT = 5.0
+
+
+class Section:
+    """One independently executed part of the context script."""
+
+    def __init__(self, name: str, body: str, timeout: float = DEFAULT_TIMEOUT,
+                 cache: Optional[List[str]] = None, ttl: Optional[float] = None) -> None:
+        self.name = name
+        self.body = body
+        self.timeout = timeout
+        self.cache: List[str] = cache or []
+        self.ttl = ttl
+
+    @property
+    def cacheable(self) -> bool:
+        return bool(self.cache) or self.ttl is not None
+
+
+def _parse_marker(line: str) -> Section:
+    fields = line[len(SECTION_MARKER):].split()
+    section = Section(fields[0] if fields else "section", "")
+    for field in fields[1:]:
+        key, _, value = field.partition("=")
+        try:
+            if key == "timeout":
+                section.timeout = float(value)
+            elif key == "ttl":
+                section.ttl = float(value)
+            elif key == "cache":
+                section.cache = [part for part in value.split(",") if part]
+        except ValueError:
+            print(f"Warning: Ignoring invalid '{field}' in context section '{section.name}'", file=sys.stderr)
+    return section
+
+
+def parse_sections(script: str) -> Tuple[str, List[Section]]:
+    """Split a script into its preamble and sections. No markers means no sections."""
+    preamble: List[str] = []
+    sections: List[Section] = []
+    for line in script.splitlines(keepends=True):
+        if line.lstrip().startswith(SECTION_MARKER):
+            sections.append(_parse_marker(line.strip()))
+        elif sections:
+            sections[-1].body += line
+        else:
+            preamble.append(line)
+    return "".join(preamble), sections
+
+
+def _git_dir(cwd: str) -> Optional[Path]:
+    """Locate the .git directory for cwd, following gitdir files of worktrees."""
+    for directory in [Path(cwd), *Path(cwd).parents]:
+        candidate = directory / ".git"
+        if candidate.is_dir():
+            return candidate
+        if candidate.is_file():
+            content = candidate.read_text().strip()
+            if content.startswith("gitdir:"):
+                return (directory / content[len("gitdir:"):].strip()).resolve()
+    return None
+
+
+def _cache_key(section: Section, preamble: str, cwd: str) -> str:
+    parts = [section.name, preamble, section.body]
+    if "cwd" in section.cache:
+        parts.append(cwd)
+    if "git" in section.cache:
+        git_dir = _git_dir(cwd)
+        parts.append(str(git_dir))
+        if git_dir is not None:
+            for name in ("HEAD", "index"):
+                try:
+                    parts.append(str((git_dir / name).stat().st_mtime_ns))
+                except OSError:
+                    parts.append("-")
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def _interpreter(preamble: str) -> List[str]:
+    """Return the shebang interpreter of the script, bash when there is none."""
+    first = preamble.splitlines()[0] if preamble else ""
+    return shlex.split(first[2:]) if first.startswith("#!") else ["/bin/bash"]
+
+
+def _kill(proc: subprocess.Popen) -> None:
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    proc.wait()
+
+
+def run_capped(args: List[str], timeout: float, max_bytes: int, cwd: Optional[str] = None) -> Tuple[Optional[int], str]:
+    """Run args and read its stdout as it is produced, killing it once max_bytes have arrived.
+
+    Returns the exit code (None when the output cap stopped the command) and the
+    decoded output. Raises subprocess.TimeoutExpired after timeout seconds.
+    """
+    # Own process group so killing it also stops whatever the command started
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=cwd, start_new_session=True)
+    deadline = time.monotonic() + timeout
+    chunks: List[bytes] = []
+    size = 0
+    truncated = False
+    with proc.stdout, selectors.DefaultSelector() as selector:
+        selector.register(proc.stdout, selectors.EVENT_READ)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                _kill(proc)
+                raise subprocess.TimeoutExpired(args, timeout)
+            if not selector.select(remaining):
+                continue
+            data = os.read(proc.stdout.fileno(), 65536)
+            if not data:
+                break
+            chunks.append(data)
+            size += len(data)
+            if size >= max_bytes:
+                truncated = True
+                _kill(proc)
+                break
+
+    output = b"".join(chunks)[:max_bytes].decode("utf-8", errors="replace")
+    if truncated:
+        output = output[:output.rfind("\n") + 1] + f"[... output truncated at {max_bytes} bytes ...]"
+        return None, output
+    try:
+        return proc.wait(max(0.0, deadline - time.monotonic())), output
+    except subprocess.TimeoutExpired:
+        _kill(proc)
+        raise
+
+
+def _run(section: Section, interpreter: List[str], preamble: str, cwd: str, max_bytes: int) -> Optional[str]:
+    if time_budget.expired():
+        time_budget.cut(f"context section {section.name}")
+        return None
+    try:
+        with timings.phase(f"context section {section.name}"):
+            _, output = run_capped([*interpreter, "-c", preamble + section.body], time_budget.cap(section.timeout),
+                                   max_bytes, cwd)
+    except subprocess.TimeoutExpired:
+        if time_budget.expired():
+            time_budget.cut(f"context section {section.name}")
+            return None
+        print(f"Warning: Context section '{section.name}' timed out after {section.timeout:g}s, skipped", file=sys.stderr)
+        return None
+    except OSError as e:
+        print(f"Warning: Error executing context section '{section.name}': {e}", file=sys.stderr)
+        return None
+    return output.strip()
+
+
+def _load_cache() -> Dict[str, Dict]:
+    try:
+        return json.loads(SECTION_CACHE_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache: Dict[str, Dict]) -> None:
+    tmp = SECTION_CACHE_FILE.with_suffix(".tmp")
+    try:
+        tmp.write_text(json.dumps(cache))
+        os.replace(tmp, SECTION_CACHE_FILE)
+    except OSError:
+        pass
+
+
+def run_sections(preamble: str, sections: List[Section], cwd: str, max_bytes: int = 32768) -> str:
+    """Run sections concurrently, serving cacheable ones from the cache, and join their output in order.
+
+    Each section's output is capped at max_bytes.
+    """
+    cache = _load_cache()
+    now = time.time()
+    outputs: List[Optional[str]] = [None] * len(sections)
+    keys: Dict[int, str] = {}
+    pending: List[int] = []
+
+    for idx, section in enumerate(sections):
+        if section.cacheable:
+            keys[idx] = _cache_key(section, preamble, cwd)
+            entry = cache.get(keys[idx])
+            if entry and (section.ttl is None or now - entry["time"] <= section.ttl):
+                outputs[idx] = entry["output"]
+                continue
+        pending.append(idx)
+
+    if pending:
+        interpreter = _interpreter(preamble)
+        with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+            futures = {idx: pool.submit(time_budget.propagate(_run), sections[idx], interpreter, preamble, cwd, max_bytes)
+                       for idx in pending}
+        for idx, future in futures.items():
+            outputs[idx] = future.result()
+            if idx in keys and outputs[idx] is not None:
+                cache[keys[idx]] = {"output": outputs[idx], "time": now}
+
+        if any(idx in keys for idx in pending):
+            # Forget entries older than a day or the longest ttl, whichever is longer
+            max_age = max([86400.0] + [s.ttl for s in sections if s.ttl is not None])
+            cache = {k: v for k, v in cache.items() if now - v["time"] <= max_age}
+            _save_cache(cache)
+
+    return "\n\n".join(output for output in outputs if output)
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""Resident background server answering suggestion requests over a Unix socket.
+
+The server keeps the loaded configuration, the pooled HTTP session and the
+suggestion cache warm between ``aih`` calls. It is started on demand by
+``request`` and exits on its own after an idle period.
+"""
+import json
+import os
+import socket
+import socketserver
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, Optional
+
+import time_budget
+from utils import load_env
+
+ENV_FILE = Path(__file__).with_name(".env")
+DAEMON_LOG_FILE = Path(__file__).with_name(".aih_daemon.log")
+STARTUP_WAIT = 3.0
+
+
+class DaemonUnavailable(RuntimeError):
+    """The daemon could not be started or reached."""
+
+
+def _private_dir() -> str:
+    """A directory in the temp dir that only this user can enter, for when XDG_RUNTIME_DIR is unset.
+
+    A socket directly in /tmp could be created first by another user, who
+    would then answer with commands of their choosing.
+    """
+    path = os.path.join(tempfile.gettempdir(), f"aih-{os.getuid()}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise DaemonUnavailable(f"{path} is not a private directory of this user")
+    return path
+
+
+def socket_path() -> str:
+    """Return the Unix socket path, from AIH_DAEMON_SOCKET or a per-user default."""
+    if os.environ.get("AIH_DAEMON_SOCKET"):
+        return os.environ["AIH_DAEMON_SOCKET"]
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], f"aih-{os.getuid()}.sock")
+    return os.path.join(_private_dir(), "aih.sock")
+
+
+def _env_mtime() -> float:
+    try:
+        return ENV_FILE.stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, idle_timeout: float) -> None:
+        super().__init__(path, _Handler)
+        self.idle_timeout = idle_timeout
+        self.last_activity = time.monotonic()
+        self.env_mtime = _env_mtime()
+
+    def touch(self) -> None:
+        self.last_activity = time.monotonic()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: _Server
+
+    def handle(self) -> None:
+        self.server.touch()
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            response = self._dispatch(json.loads(line))
+        except Exception as e:
+            response = {"ok": False, "error": str(e)}
+        self._write(response)
+        self.server.touch()
+
+    def _write(self, message: Dict[str, Any]) -> None:
+        self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def _dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid()}
+        if op == "shutdown":
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return {"ok": True}
+        if op == "warmup":
+            # Connections opened here stay in this process's pool for the next requests
+            from model import warm_up
+            warm_up(request.get("model_name", ""))
+            return {"ok": True}
+        if op != "suggest":
+            return {"ok": False, "error": f"Unknown op: {op}"}
+
+        # Configuration is loaded once; an edited .env means this process is stale
+        if _env_mtime() != self.server.env_mtime:
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return {"ok": False, "restart": True, "error": "Configuration changed"}
+
+        # The client's --deadline, as seconds left when it sent the request
+        with time_budget.limit(request.get("deadline")) as cuts:
+            try:
+                response = self._suggest(request)
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+        if cuts:
+            response["cut"] = cuts
+        return response
+
+    def _suggest(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        from main import iter_suggestions, lookup_suggestions
+
+        options = dict(
+            prompt=request["prompt"],
+            context=request.get("context"),
+            model_name=request["model_name"],
+            max_suggestions=int(request["max_suggestions"]),
+            use_cache=bool(request.get("use_cache", True)),
+            refresh=bool(request.get("refresh", False)),
+        )
+        if not request.get("stream"):
+            return {"ok": True, "suggestions": lookup_suggestions(**options)}
+
+        # Relay each line as soon as the provider produces it
+        suggestions = []
+        for cmd in iter_suggestions(**options):
+            suggestions.append(cmd)
+            self._write({"line": cmd})
+        return {"ok": True, "suggestions": suggestions}
+
+
+def _watch_idle(server: _Server) -> None:
+    while True:
+        time.sleep(min(5.0, server.idle_timeout))
+        if time.monotonic() - server.last_activity > server.idle_timeout:
+            server.shutdown()
+            return
+
+
+def serve(idle_timeout: Optional[float] = None) -> None:
+    """Run the server in the foreground until shut down or idle for too long."""
+    cfg = load_env()
+    idle_timeout = idle_timeout or float(cfg.get("AIH_DAEMON_IDLE", 900))
+    path = socket_path()
+
+    if os.path.exists(path):
+        try:
+            _send(path, {"op": "ping"}, timeout=1)
+            return  # Another server is already answering
+        except OSError:
+            os.unlink(path)
+
+    # Import the heavy modules up front so the first request is already warm
+    import main  # noqa: F401
+    import model  # noqa: F401
+    import requests  # noqa: F401
+
+    server = _Server(path, idle_timeout)
+    os.chmod(path, 0o600)
+    inode = os.stat(path).st_ino
+    threading.Thread(target=_watch_idle, args=(server,), daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        try:
+            # A replacement server may already own the path
+            if os.stat(path).st_ino == inode:
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+def _open(path: str, payload: Dict[str, Any], timeout: Optional[float]) -> BinaryIO:
+    """Connect to the server, send payload and return the reply stream."""
+    # Its answers end up in eval, so only a server of this user is trusted
+    if os.stat(path).st_uid != os.getuid():
+        raise DaemonUnavailable(f"{path} belongs to another user, not connecting")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+        return sock.makefile("rb")
+    finally:
+        # The file object keeps its own reference to the connection
+        sock.close()
+
+
+def _read(reply: BinaryIO) -> Dict[str, Any]:
+    line = reply.readline()
+    if not line:
+        raise ConnectionError("Daemon closed the connection")
+    return json.loads(line)
+
+
+def _send(path: str, payload: Dict[str, Any], timeout: Optional[float]) -> Dict[str, Any]:
+    with _open(path, payload, timeout) as reply:
+        return _read(reply)
+
+
+def _spawn() -> None:
+    """Start the server detached from the calling terminal."""
+    with open(DAEMON_LOG_FILE, "ab") as log:
+        subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve())],
+            cwd=str(Path(__file__).resolve().parent),
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            start_new_session=True,
+        )
+
+
+def _open_with_autostart(payload: Dict[str, Any], timeout: Optional[float]) -> BinaryIO:
+    path = socket_path()
+    try:
+        return _open(path, payload, timeout)
+    except (FileNotFoundError, ConnectionRefusedError):
+        pass
+
+    _spawn()
+    deadline = time.monotonic() + STARTUP_WAIT
+    while True:
+        try:
+            return _open(path, payload, timeout)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if time.monotonic() > deadline:
+                raise DaemonUnavailable("Could not start aih daemon")
+            time.sleep(0.05)
+
+
+def _wait_stopped(limit: float = 2.0) -> None:
+    """Wait until the server at socket_path() no longer answers pings."""
+    deadline = time.monotonic() + limit
+    while time.monotonic() < deadline:
+        try:
+            _send(socket_path(), {"op": "ping"}, timeout=0.2)
+        except (OSError, ValueError):
+            return
+        time.sleep(0.05)
+
+
+def request(payload: Dict[str, Any], timeout: Optional[float] = 60) -> Dict[str, Any]:
+    """Send a request to the daemon, starting it first if it is not running."""
+    try:
+        with _open_with_autostart(payload, timeout) as reply:
+            response = _read(reply)
+        if response.get("restart"):
+            _wait_stopped()
+            with _open_with_autostart(payload, timeout) as reply:
+                response = _read(reply)
+    except OSError as e:
+        raise DaemonUnavailable(f"aih daemon unreachable: {e}")
+    return response
+
+
+def stream(payload: Dict[str, Any], timeout: Optional[float] = 60) -> Iterator[str]:
+    """Send a streaming request and yield each suggestion line the daemon relays."""
+    payload = dict(payload, stream=True)
+    try:
+        reply = _open_with_autostart(payload, timeout)
+        with reply:
+            response = _read(reply)
+            if response.get("restart"):
+                _wait_stopped()
+                reply = _open_with_autostart(payload, timeout)
+                response = _read(reply)
+            with reply:
+                while "line" in response:
+                    yield response["line"]
+                    response = _read(reply)
+    except OSError as e:
+        raise DaemonUnavailable(f"aih daemon unreachable: {e}")
+    for stage in response.get("cut", []):
+        time_budget.cut(stage)
+    if not response.get("ok"):
+        raise RuntimeError(response.get("error", "aih daemon request failed"))
+
+
+def stop() -> bool:
+    """Ask a running server to shut down. Return False if none was running."""
+    try:
+        _send(socket_path(), {"op": "shutdown"}, timeout=2)
+    except (OSError, DaemonUnavailable):
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,114 @@
+"""Gemini cachedContents for the stable prompt prefix.
+
+The system prompt plus commands.md is the same on every call. When it is
+large enough for Gemini's context caching, it is uploaded once as a cachedContents resource and later requests only refer to
+it by name, so Gemini does not process the prefix again. Resource names and
+expiry times are kept in GEMINI_CACHE_FILE, keyed on a hash of model and
+prefix, so separate aih invocations share them until the TTL runs out.
+
+The size needed is Gemini's minimum for the model (MIN_TOKENS), unless
+GEMINI_CACHE_MIN_TOKENS sets one. With the default context budgets the
+prefix stays below the 4096 tokens of the 2.0 and 1.5 models, so there the
+cache is only used once CONTEXT_PREFERENCES_TOKENS is raised.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import time_budget
+from budget import estimate_tokens
+from transport import TransportError, get_transport
+
+GEMINI_CACHE_FILE = Path(__file__).with_name(".aih_gemini_cache.json")
+
+# Stop using a cache entry this many seconds before Gemini expires it
+_EXPIRY_MARGIN = 60
+
+# Smallest prefix in tokens that Gemini caches, by model name prefix; others need DEFAULT_MIN_TOKENS
+MIN_TOKENS = {
+    "gemini-2.5-flash": 1024,
+    "gemini-2.5-pro": 2048,
+}
+DEFAULT_MIN_TOKENS = 4096
+
+
+def _key(model: str, system_message: str) -> str:
+    return hashlib.sha256(f"{model}\0{system_message}".encode("utf-8")).hexdigest()
+
+
+def min_tokens(model: str) -> int:
+    """Gemini's minimum size of a cached prefix for model."""
+    for name in sorted(MIN_TOKENS, key=len, reverse=True):
+        if model.startswith(name):
+            return MIN_TOKENS[name]
+    return DEFAULT_MIN_TOKENS
+
+
+class PrefixCache:
+    """Maps (model, system message) to a live Gemini cachedContents name."""
+
+    def __init__(self, path: Path = GEMINI_CACHE_FILE, min_tokens: Optional[int] = None, ttl: int = 3600) -> None:
+        self.path = Path(path)
+        self.min_tokens = min_tokens
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: Dict[str, dict] = {}
+        try:
+            self._data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            pass
+
+    def _save(self) -> None:
+        now = time.time()
+        self._data = {k: v for k, v in self._data.items() if v.get("expires", 0) > now}
+        tmp = self.path.with_suffix(".tmp")
+        try:
+            tmp.write_text(json.dumps(self._data))
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def lookup(self, base_url: str, api_key: str, model: str, system_message: str) -> Optional[str]:
+        """Return the cachedContents name for the prefix, creating it if worthwhile; None to send it inline."""
+        if estimate_tokens(system_message) < (self.min_tokens or min_tokens(model)):
+            return None
+        key = _key(model, system_message)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry["expires"] - _EXPIRY_MARGIN > time.time():
+                return entry["name"]  # None when creating it failed recently
+
+            name = self._create(base_url, api_key, model, system_message)
+            if name is None and time_budget.expired():
+                return None  # Cut short by --deadline, which says nothing about the model
+            # A failed creation (model without caching, quota) is not retried until the TTL has passed
+            self._data[key] = {"name": name, "expires": time.time() + self.ttl}
+            self._save()
+            return name
+
+    def _create(self, base_url: str, api_key: str, model: str, system_message: str) -> Optional[str]:
+        payload = {
+            "model": f"models/{model}",
+            "systemInstruction": {"parts": [{"text": system_message}]},
+            "ttl": f"{self.ttl}s",
+        }
+        try:
+            response = get_transport().post(f"{base_url}/cachedContents?key={api_key}", json=payload)
+        except TransportError:
+            return None
+        if response.status != 200:
+            return None
+        return (response.data or {}).get("name")
+
+    def forget(self, name: str) -> None:
+        """Drop a cachedContents name that Gemini no longer knows (deleted or expired early)."""
+        with self._lock:
+            stale = [key for key, entry in self._data.items() if entry["name"] == name]
+            for key in stale:
+                del self._data[key]
+            if stale:
+                self._save()
@@ -0,0 +1,145 @@
+"""Indexed history of accepted (prompt, context, command) triples.
+
+Every executed suggestion is stored in HISTORY_DB, one row per distinct
+(prompt, command) pair with a use count, the directories it was used in and
+the fingerprint of its last context. Rows live in an SQLite FTS5 table with
+the trigram tokenizer, so a lookup is a BM25-ranked trigram query that stays
+in the low milliseconds even for thousands of entries. Builds of SQLite
+without FTS5 fall back to ranking in Python.
+"""
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from search import BM25Index, similarity, trigrams
+
+HISTORY_DB = Path(__file__).with_name(".aih_history.sqlite")
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS history USING fts5(
+    prompt, command, norm UNINDEXED, cwds UNINDEXED, context UNINDEXED,
+    count UNINDEXED, last_used UNINDEXED, tokenize='trigram'
+)
+"""
+_PLAIN_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    prompt TEXT, command TEXT, norm TEXT, cwds TEXT, context TEXT,
+    count INTEGER, last_used REAL
+)
+"""
+
+# (prompt, command, cwds, count) rows that matched a query
+Row = Tuple[str, str, str, int]
+
+
+def context_fingerprint(context: Optional[str]) -> str:
+    """Short stable hash of the context a command was suggested in."""
+    return hashlib.sha256((context or "").encode("utf-8")).hexdigest()[:16]
+
+
+def _normalize(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+
+class CommandHistory:
+    """Trigram/BM25 searchable store of accepted commands."""
+
+    def __init__(self, path: Path = HISTORY_DB) -> None:
+        self.path = Path(path)
+        self._conn = sqlite3.connect(self.path, timeout=2)
+        try:
+            self._conn.execute(_FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            self._conn.execute(_PLAIN_SCHEMA)
+            self.fts = False
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _candidates(self, prompt: str, limit: int) -> List[Row]:
+        grams = trigrams(prompt)
+        if not grams:
+            return []
+        if not self.fts:
+            rows = self._conn.execute("SELECT prompt, command, cwds, count FROM history").fetchall()
+            index = BM25Index([f"{p} {c}" for p, c, _, _ in rows])
+            return [rows[doc_id] for doc_id, _ in index.search(prompt, limit)]
+
+        query = " OR ".join(f'"{gram}"' for gram in sorted(grams))
+        return self._conn.execute(
+            "SELECT prompt, command, cwds, count FROM history WHERE history MATCH ? "
+            "ORDER BY bm25(history, 2.0, 1.0) LIMIT ?",
+            (query, limit),
+        ).fetchall()
+
+    def search(self, prompt: str, cwd: Optional[str] = None, limit: int = 3,
+               min_similarity: float = 0.55) -> List[str]:
+        """Return up to limit past commands for prompt, preferring ones used in cwd and used often."""
+        ranked = []
+        candidates = self._candidates(prompt, limit * 10)
+        for rank, (past_prompt, command, cwds, count) in enumerate(candidates):
+            match = similarity(prompt, past_prompt)
+            if match < min_similarity:
+                continue
+            score = match * (1 + math.log(count)) / (1 + rank * 0.1)
+            if cwd and cwd in json.loads(cwds):
+                score *= 1.5
+            ranked.append((score, command))
+
+        commands: List[str] = []
+        for _, cmd in sorted(ranked, key=lambda item: item[0], reverse=True):
+            if cmd not in commands:
+                commands.append(cmd)
+        return commands[:limit]
+
+    def record(self, prompt: str, context: Optional[str], command: str, cwd: str, max_entries: int = 2000) -> None:
+        """Add an accepted command, or bump the count of an existing (prompt, command) pair."""
+        norm = _normalize(prompt)
+        now = time.time()
+        with self._conn:
+            row = self._conn.execute(
+                "SELECT rowid, cwds, count FROM history WHERE norm = ? AND command = ?", (norm, command)
+            ).fetchone()
+            if row is None:
+                self._conn.execute(
+                    "INSERT INTO history (prompt, command, norm, cwds, context, count, last_used) VALUES (?, ?, ?, ?, ?, 1, ?)",
+                    (prompt, command, norm, json.dumps([cwd]), context_fingerprint(context), now),
+                )
+            else:
+                rowid, cwds, count = row
+                cwds = [c for c in json.loads(cwds) if c != cwd][-19:] + [cwd]
+                self._conn.execute(
+                    "UPDATE history SET cwds = ?, context = ?, count = ?, last_used = ? WHERE rowid = ?",
+                    (json.dumps(cwds), context_fingerprint(context), int(count) + 1, now, rowid),
+                )
+            self._conn.execute(
+                "DELETE FROM history WHERE rowid NOT IN "
+                "(SELECT rowid FROM history ORDER BY last_used DESC LIMIT ?)",
+                (max_entries,),
+            )
+
+
+def lookup(prompt: str, cwd: Optional[str] = None, limit: int = 3, path: Path = HISTORY_DB) -> List[str]:
+    """Return past commands matching prompt, best first."""
+    if not Path(path).exists():
+        return []
+    store = CommandHistory(path)
+    try:
+        return store.search(prompt, cwd, limit, float(os.environ.get("HISTORY_MIN_MATCH", 0.55)))
+    finally:
+        store.close()
+
+
+def record(prompt: str, context: Optional[str], command: str, cwd: str, path: Path = HISTORY_DB) -> None:
+    """Remember an accepted command, keeping at most HISTORY_MAX_ENTRIES distinct pairs."""
+    store = CommandHistory(path)
+    try:
+        store.record(prompt, context, command, cwd, int(os.environ.get("HISTORY_MAX_ENTRIES", 2000)))
+    finally:
+        store.close()
@@ -0,0 +1,206 @@
+"""Journal of provider exchanges and offline replay.
+
+With ``JOURNAL=true`` every provider call made by model.py is appended to
+JOURNAL_FILE (default ``.aih_journal.jsonl``) as one JSON line::
+
+    {"time": 1718000000.0, "model": "openai/gpt-4o-mini", "prompt": "...",
+     "context_hash": "3f2a...", "max_suggestions": 3, "stream": false,
+     "request_bytes": 2210, "max_tokens": 260, "status": 200, "latency_ms": 812.4,
+     "first_chunk_ms": null, "usage": {"prompt_tokens": 610, "completion_tokens": 41},
+     "text": "[\\"ls -la\\", ...]", "error": null}
+
+Lines are queued and written by a background thread in batches, so a call
+never waits for the disk. The context itself is not stored, only its hash.
+
+Replay (``aih --replay [FILE]`` or ``AIH_REPLAY=FILE``) answers provider
+calls from a journal instead of the network: the entry with the same model,
+prompt, context hash and number of suggestions, else the same model and
+prompt. Several matching entries are served in journal order, the last one
+repeatedly. Recorded errors are raised again, and with ``REPLAY_REALTIME=true``
+each answer takes as long as it did when it was recorded.
+"""
+import atexit
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_JOURNAL_FILE = Path(__file__).with_name(".aih_journal.jsonl")
+
+# Written once this many lines are queued, or when no new line came for FLUSH_INTERVAL seconds
+BATCH_LINES = 64
+FLUSH_INTERVAL = 1.0
+
+_STOP = object()
+
+
+def _enabled(name: str) -> bool:
+    return os.environ.get(name, "").lower() in ("true", "yes", "1")
+
+
+def context_hash(context: Optional[str]) -> str:
+    """Short stable hash of a context, so exchanges can be matched without storing it."""
+    return hashlib.sha256((context or "").encode("utf-8")).hexdigest()[:16]
+
+
+class Exchange:
+    """One provider call: filled in by the provider functions, then recorded."""
+
+    def __init__(self, model_name: str, prompt: str, context: Optional[str], max_suggestions: int,
+                 stream: bool = False) -> None:
+        self.model_name = model_name
+        self.prompt = prompt
+        self.context_hash = context_hash(context)
+        self.max_suggestions = max_suggestions
+        self.stream = stream
+        self.request_bytes = 0
+        self.max_tokens: Optional[int] = None
+        self.status: Optional[int] = None
+        self.text = ""
+        self.usage: Dict[str, int] = {}
+        self.error: Optional[str] = None
+        self.replayed = False
+        self.started = time.perf_counter()
+        self.first_chunk: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "time": time.time(),
+            "model": self.model_name,
+            "prompt": self.prompt,
+            "context_hash": self.context_hash,
+            "max_suggestions": self.max_suggestions,
+            "stream": self.stream,
+            "request_bytes": self.request_bytes,
+            "max_tokens": self.max_tokens,
+            "status": self.status,
+            "latency_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "first_chunk_ms": round((self.first_chunk - self.started) * 1000, 1) if self.first_chunk else None,
+            "usage": self.usage,
+            "text": self.text,
+            "error": self.error,
+        }
+
+
+class JournalWriter:
+    """Appends JSON lines to a file from a background thread."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._queue: "queue.Queue[object]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="aih-journal", daemon=True)
+        self._thread.start()
+
+    def write(self, entry: dict) -> None:
+        self._queue.put(json.dumps(entry) + "\n")
+
+    def _flush(self, lines: List[str]) -> None:
+        try:
+            with open(self.path, "a") as f:
+                f.write("".join(lines))
+        except OSError:
+            pass  # The journal is diagnostics, losing it must not break a request
+        lines.clear()
+
+    def _run(self) -> None:
+        lines: List[str] = []
+        while True:
+            try:
+                item = self._queue.get(timeout=FLUSH_INTERVAL if lines else None)
+            except queue.Empty:
+                self._flush(lines)
+                continue
+            if item is _STOP:
+                if lines:
+                    self._flush(lines)
+                return
+            lines.append(item)  # type: ignore[arg-type]
+            if len(lines) >= BATCH_LINES:
+                self._flush(lines)
+
+    def close(self, timeout: float = 2.0) -> None:
+        """Write what is queued and stop the thread."""
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+
+class Replay:
+    """Answers from a journal file, see the module docstring for how entries are matched."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._entries: Dict[Tuple, List[dict]] = {}
+        self._served: Dict[Tuple, int] = {}
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    for key in self._keys(entry["model"], entry["prompt"], entry.get("context_hash"),
+                                          entry.get("max_suggestions")):
+                        self._entries.setdefault(key, []).append(entry)
+        except OSError as e:
+            raise RuntimeError(f"Cannot read replay journal {self.path}: {e}")
+
+    @staticmethod
+    def _keys(model_name: str, prompt: str, ctx_hash: Optional[str], max_suggestions: Optional[int]) -> List[Tuple]:
+        return [("exact", model_name, prompt, ctx_hash, max_suggestions), ("prompt", model_name, prompt)]
+
+    def answer(self, exchange: Exchange) -> str:
+        """Recorded text for exchange; raises the recorded error, or RuntimeError when nothing matches."""
+        with self._lock:
+            for key in self._keys(exchange.model_name, exchange.prompt, exchange.context_hash,
+                                  exchange.max_suggestions):
+                entries = self._entries.get(key)
+                if entries:
+                    served = self._served.get(key, 0)
+                    self._served[key] = served + 1
+                    entry = entries[min(served, len(entries) - 1)]
+                    break
+            else:
+                raise RuntimeError(f"No recorded answer for {exchange.model_name} '{exchange.prompt}' in {self.path}")
+
+        exchange.replayed = True
+        exchange.status = entry.get("status")
+        exchange.usage = entry.get("usage") or {}
+        if _enabled("REPLAY_REALTIME") and entry.get("latency_ms"):
+            time.sleep(entry["latency_ms"] / 1000)
+        if entry.get("error"):
+            raise RuntimeError(entry["error"])
+        return entry.get("text") or ""
+
+
+_writer: Optional[JournalWriter] = None
+_replay: Optional[Replay] = None
+_lock = threading.Lock()
+
+
+def record(exchange: Exchange) -> None:
+    """Queue exchange for the journal when JOURNAL is enabled; replayed answers are not recorded again."""
+    global _writer
+    if exchange.replayed or not _enabled("JOURNAL"):
+        return
+    with _lock:
+        if _writer is None:
+            _writer = JournalWriter(Path(os.environ.get("JOURNAL_FILE") or DEFAULT_JOURNAL_FILE))
+            atexit.register(_writer.close)
+    _writer.write(exchange.to_dict())
+
+
+def replay() -> Optional[Replay]:
+    """The journal named by AIH_REPLAY, None when replay is off."""
+    global _replay
+    path = os.environ.get("AIH_REPLAY")
+    if not path:
+        return None
+    with _lock:
+        if _replay is None or _replay.path != Path(path):
+            _replay = Replay(Path(path))
+    return _replay
@@ -1,22 +1,67 @@
 #!/usr/bin/env python3
 """Entry point for Command Helper."""
 import argparse
+import os
 import subprocess
-import datetime
-from typing import List, Optional
+import functools
+import itertools
+import queue
+import re
+import sys
+import threading
+import time
+from collections import ChainMap
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
 from pathlib import Path
 
 from utils import (
     load_env,
     build_context,
-    spinner
+    spinner,
+    user_cwd
 )
-from model import get_suggestions
+from budget import ContextPart, assemble_context
+import command_log
+import time_budget
+import timings
+from journal import DEFAULT_JOURNAL_FILE
+from prefetch import Speculation
+
+# cache, daemon, history and the provider modules are imported where they are
+# first needed, so --help and --history start without sqlite or the HTTP stack
+if TYPE_CHECKING:
+    from cache import SuggestionCache
+    from validate import Screen, Validator
 
 PROJECT_DIR = Path(__file__).resolve().parent
 COMMAND_LOG_FILE = PROJECT_DIR / "commands.log"
+_ENV_STARTED = time.perf_counter()
 cfg = load_env()
+_ENV_SECONDS = time.perf_counter() - _ENV_STARTED
 MAX_COMMAND_HISTORY = int(cfg.get("MAX_COMMAND_HISTORY", 100))
+HISTORY_PAGE_SIZE = int(cfg.get("HISTORY_PAGE_SIZE", 50))
+CACHE_TTL = float(cfg.get("CACHE_TTL", 86400))
+CACHE_MAX_ENTRIES = int(cfg.get("CACHE_MAX_ENTRIES", 500))
+HISTORY_SUGGESTIONS = int(cfg.get("HISTORY_SUGGESTIONS", 2))
+CONTEXT_TOKEN_BUDGET = int(cfg.get("CONTEXT_TOKEN_BUDGET", 4000))
+CONTEXT_PREFERENCES_TOKENS = int(cfg.get("CONTEXT_PREFERENCES_TOKENS", 2500))
+CONTEXT_ENVIRONMENT_TOKENS = int(cfg.get("CONTEXT_ENVIRONMENT_TOKENS", 1500))
+CONTEXT_MAX_BYTES = int(cfg.get("CONTEXT_MAX_BYTES", 32768))
+CONTEXT_COLLECTORS = [name.strip() for name in cfg.get("CONTEXT_COLLECTORS", "listing,git").split(",") if name.strip()]
+COMMANDS_FULL_TOKENS = int(cfg.get("COMMANDS_FULL_TOKENS", 1000))
+COMMANDS_TOP_K = int(cfg.get("COMMANDS_TOP_K", 5))
+COMMANDS_RETRIEVAL_TOKENS = int(cfg.get("COMMANDS_RETRIEVAL_TOKENS", 1000))
+COMMANDS_PINNED = [name for name in cfg.get("COMMANDS_PINNED", "General Info,Blacklist").split(",") if name.strip()]
+PREFERENCES_HEADER = "IMPORTANT USER PREFERENCES - This document shows what the user might want. Use this information whenever relevant:\n\n"
+RELEVANT_PREFERENCES_HEADER = "USER PREFERENCES RELEVANT TO THIS REQUEST - Excerpts from the user's notes:\n\n"
+HISTORY_NOTE = "from history"
+PREFETCH_BUDGET = float(cfg.get("PREFETCH_BUDGET", 20))
+PREFETCH_COMMENT = "Suggest different commands than these, for example other tools or approaches."
+SESSION_TOKENS = int(cfg.get("SESSION_TOKENS", 600))
+SESSION_TTL = float(cfg.get("SESSION_TTL", 3600))
+
+_cache: Optional["SuggestionCache"] = None
 
 
 def parse_args() -> argparse.Namespace:
@@ -55,6 +100,144 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="Display command history and exit"
     )
+    parser.add_argument(
+        "--search",
+        metavar="TEXT",
+        help="With --history, only show commands containing TEXT (case-insensitive)"
+    )
+    parser.add_argument(
+        "--regex",
+        action="store_true",
+        help="With --history, treat --search as a regular expression"
+    )
+    parser.add_argument(
+        "--since",
+        metavar="DATE",
+        help="With --history, only show commands run at or after DATE (YYYY-MM-DD[ HH:MM:SS])"
+    )
+    parser.add_argument(
+        "--until",
+        metavar="DATE",
+        help="With --history, only show commands run up to DATE (YYYY-MM-DD[ HH:MM:SS])"
+    )
+    parser.add_argument(
+        "--cwd",
+        metavar="DIR",
+        help="With --history, only show commands run in DIR"
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=HISTORY_PAGE_SIZE,
+        help="With --history, number of commands per page (default from HISTORY_PAGE_SIZE in .env)"
+    )
+    parser.add_argument(
+        "--page",
+        type=int,
+        default=1,
+        help="With --history, page to show counting back from the newest (default 1)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=cfg.get("CACHE_ENABLED", "true").lower() not in ("true", "yes", "1"),
+        help="Always ask the model, bypassing the suggestion cache (default from CACHE_ENABLED in .env)"
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Remove all cached suggestions and exit"
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        default=cfg.get("AIH_DAEMON", "").lower() in ("true", "yes", "1"),
+        help="Send requests through the resident background server, starting it if needed (default from AIH_DAEMON in .env)"
+    )
+    parser.add_argument(
+        "--daemon-stop",
+        action="store_true",
+        help="Stop the resident background server and exit"
+    )
+    parser.add_argument(
+        "--continue",
+        dest="continue_session",
+        action="store_true",
+        help="Continue the previous exchange of this terminal and directory instead of starting a new one"
+    )
+    parser.add_argument(
+        "--warmup",
+        action="store_true",
+        help="Build the local indexes and load the local model, with --daemon also open provider connections, then exit"
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print token usage, cost and latency percentiles per model, then exit"
+    )
+    parser.add_argument(
+        "--prefetch",
+        dest="no_prefetch",
+        action="store_false",
+        default=cfg.get("PREFETCH", "false").lower() not in ("true", "yes", "1"),
+        help="Prepare alternative suggestions in the background while you choose, at the cost of a second request per round (default from PREFETCH in .env)"
+    )
+    parser.add_argument(
+        "--no-prefetch",
+        dest="no_prefetch",
+        action="store_true",
+        help="Don't prepare alternative suggestions in the background"
+    )
+    parser.add_argument(
+        "--no-validate",
+        action="store_true",
+        default=cfg.get("VALIDATE", "true").lower() not in ("true", "yes", "1"),
+        help="Show suggestions without the blacklist, syntax and installed-binary checks (default from VALIDATE in .env)"
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="Answer every prompt in FILE ('-' for stdin, one prompt or JSON object per line) and print JSON lines"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(cfg.get("BATCH_CONCURRENCY", 4)),
+        help="With --batch, prompts processed at once (default from BATCH_CONCURRENCY in .env)"
+    )
+    parser.add_argument(
+        "--rate-limit",
+        metavar="PROVIDER=RPS,...",
+        default=cfg.get("BATCH_RATE_LIMITS", ""),
+        help="With --batch, requests per second per provider, e.g. openai=5,gemini=2 (default from BATCH_RATE_LIMITS in .env)"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        default=cfg.get("STREAM", "").lower() in ("true", "yes", "1"),
+        help="Show each suggestion as soon as the model produces it (default from STREAM in .env)"
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="FILE",
+        nargs="?",
+        const=str(DEFAULT_JOURNAL_FILE),
+        default=cfg.get("AIH_REPLAY") or None,
+        help="Answer from a journal recorded with JOURNAL=true instead of calling the model (default FILE is .aih_journal.jsonl)"
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        metavar="SECONDS",
+        default=float(cfg.get("DEADLINE", 0)),
+        help="Show the best suggestions available after SECONDS, cutting slow stages short (default from DEADLINE in .env, 0 for none)"
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        default=cfg.get("AIH_TIMINGS", "").lower() in ("true", "yes", "1"),
+        help="Print how long each phase took (default from AIH_TIMINGS in .env)"
+    )
     return parser.parse_args()
 
 
@@ -72,25 +255,42 @@ class ChoiceResult:
         self.comment: Optional[str] = comment  # User comment if action is 'comment'
 
 
-def display_suggestions(suggestions: List[str]) -> None:
-    """Display the command suggestions."""
+def display_suggestions(suggestions: Iterable[str], notes: Optional[Mapping[str, str]] = None) -> List[str]:
+    """Display the command suggestions, each one as soon as it is available.
+
+    Commands found in notes are marked with their note. Returns the suggestions that were shown.
+    """
+    notes = notes if notes is not None else {}
+    shown = []
     print("\nSuggestions:")
     for idx, cmd in enumerate(suggestions, start=1):
-        print(f"  {idx}. {cmd}")
+        note = f"  ({notes[cmd]})" if cmd in notes else ""
+        print(f"  {idx}. {cmd}{note}", flush=True)
+        shown.append(cmd)
     
     print("\nOptions:")
     print("  Enter a number to select a command")
     print("  r - Regenerate suggestions")
     print("  c - Add a comment or clarification")
     print("  q or 0 or empty - Quit")
+    return shown
+
 
+def choose(
+    suggestions: List[str],
+    displayed: bool = False,
+    notes: Optional[Dict[str, str]] = None,
+) -> ChoiceResult:
+    """Present suggestions and get user choice, including regenerate and comment options.
 
-def choose(suggestions: List[str]) -> ChoiceResult:
-    """Present suggestions and get user choice, including regenerate and comment options."""
+    With displayed set the suggestions are already on screen and are not printed again.
+    """
     result = ChoiceResult()
     
     while True:
-        display_suggestions(suggestions)
+        if not displayed:
+            display_suggestions(suggestions, notes)
+        displayed = False
         
         choice = input("\nYour choice: ").strip().lower()
         
@@ -130,44 +330,105 @@ def confirm(cmd: str) -> bool:
     return ans in {"y", "yes"}
 
 
+@functools.lru_cache(maxsize=1)
+def environment_context() -> str:
+    """Build the environment context once per run; regenerate and comment rounds reuse it."""
+    return build_context(CONTEXT_MAX_BYTES, CONTEXT_COLLECTORS)
+
+
+def preference_parts(query: str) -> List[ContextPart]:
+    """Context parts from commands.md: all of it when small, else pinned sections plus snippets relevant to query."""
+    from preferences import load_index
+
+    index = load_index(PROJECT_DIR / "commands.md")
+    if index is None or not index.text:
+        return []
+    if index.tokens <= COMMANDS_FULL_TOKENS:
+        return [ContextPart("preferences", PREFERENCES_HEADER + index.text, priority=2,
+                            max_tokens=CONTEXT_PREFERENCES_TOKENS, stable=True)]
+
+    pinned, relevant = index.select(query, COMMANDS_TOP_K, COMMANDS_RETRIEVAL_TOKENS, COMMANDS_PINNED)
+    parts = []
+    if pinned:
+        # Same on every call, so it stays in the cacheable prompt prefix
+        parts.append(ContextPart("preferences", PREFERENCES_HEADER + pinned, priority=2,
+                                 max_tokens=CONTEXT_PREFERENCES_TOKENS, stable=True))
+    if relevant:
+        parts.append(ContextPart("relevant preferences", RELEVANT_PREFERENCES_HEADER + relevant, priority=2,
+                                 max_tokens=COMMANDS_RETRIEVAL_TOKENS))
+    return parts
+
+
 def build_full_context(
     args: argparse.Namespace,
     prev_suggestions: Optional[List[str]] = None,
     user_comment: Optional[str] = None,
+    prompt: Optional[str] = None,
+    conversation: Optional[str] = None,
 ) -> Optional[str]:
-    """Build the full context including commands.md, environment context, and user feedback."""
+    """Build the full context including commands.md, environment context, and user feedback.
+
+    prompt (default: the prompt in args) selects which parts of a large commands.md are sent.
+    conversation holds the earlier turns of the session.
+    """
     # Get commands.md content regardless of context flag
-    cmd_md_path = PROJECT_DIR / "commands.md"
-    commands_content = ""
-    if cmd_md_path.is_file():
-        try:
-            with open(cmd_md_path, 'r') as f:
-                commands_content = f.read().strip()
-        except Exception:
-            pass
+    query = " ".join(args.prompt) if prompt is None else prompt
+    if user_comment:
+        query += f" {user_comment}"
+    if time_budget.expired():
+        time_budget.cut("commands.md")
+        parts = []
+    else:
+        with timings.phase("commands.md"):
+            parts = preference_parts(query)
     
     # Get additional context info if context flag is set
-    additional_ctx = build_context() if args.context else None
-    
-    # Combine contexts
-    context_parts = []
-    
-    if commands_content:
-        context_parts.append("IMPORTANT USER PREFERENCES - This document shows what the user might want. Use this information whenever relevant:\n\n" + commands_content)
+    with timings.phase("environment context"):
+        additional_ctx = environment_context() if args.context else None
     
+    # Combine contexts; stable preferences are the prompt prefix and fitted first,
+    # then feedback, then relevant preferences, then environment
     if additional_ctx:
-        context_parts.append(additional_ctx)
+        parts.append(ContextPart("environment", additional_ctx, priority=1, max_tokens=CONTEXT_ENVIRONMENT_TOKENS))
         
+    if conversation:
+        parts.append(ContextPart("conversation", conversation, priority=2, max_tokens=SESSION_TOKENS))
+
     # Add previous suggestions and user comment if available
     if prev_suggestions and user_comment:
         feedback = "Previous suggestions:\n"
         for idx, sugg in enumerate(prev_suggestions, start=1):
             feedback += f"{idx}. {sugg}\n"
         feedback += f"\nUser comment: {user_comment}"
-        context_parts.append(feedback)
+        parts.append(ContextPart("feedback", feedback, priority=3))
     
-    # Join all context parts with double newlines
-    return "\n\n".join(context_parts) if context_parts else None
+    with timings.phase("assemble context"):
+        return assemble_context(parts, CONTEXT_TOKEN_BUDGET)
+
+
+@functools.lru_cache(maxsize=1)
+def get_validator() -> "Validator":
+    """Validator with the Blacklist sections of commands.md and the executables on PATH."""
+    from preferences import load_index
+    from validate import PathIndex, Validator, blacklist_entries
+
+    blacklist = []
+    index = load_index(PROJECT_DIR / "commands.md")
+    for snippet in index.snippets if index else []:
+        if "blacklist" in (name.strip().lower() for name in snippet.title.split(" > ")):
+            blacklist.extend(blacklist_entries(snippet.body))
+    with timings.phase("path index"):
+        path_index = PathIndex.load()
+    return Validator(blacklist, path_index)
+
+
+def new_screen(args: argparse.Namespace) -> Optional["Screen"]:
+    """Screen for one round of suggestions, None when validation is off."""
+    if args.no_validate:
+        return None
+    from validate import Screen
+
+    return Screen(get_validator())
 
 
 def execute_command(cmd: str, skip_confirm: bool = False) -> None:
@@ -185,63 +446,393 @@ def execute_command(cmd: str, skip_confirm: bool = False) -> None:
         print("Aborted.")
 
 
-def get_command_suggestions(prompt: str, context: Optional[str], model_name: str, max_suggestions: int) -> List[str]:
-    """Get command suggestions from the model with a spinner."""
-    with spinner("Thinking..."):
-        suggestions = get_suggestions(
-            prompt=prompt,
-            context=context,
-            model_name=model_name,
-            max_suggestions=max_suggestions,
+def _get_cache() -> "SuggestionCache":
+    """Return the process-wide suggestion cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        from cache import SuggestionCache
+
+        _cache = SuggestionCache(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+    return _cache
+
+
+def _cache_get(cache: "SuggestionCache", key: str) -> Optional[List[str]]:
+    try:
+        return cache.get(key)
+    except Exception as e:
+        print(f"Warning: Could not read suggestion cache: {e}", file=sys.stderr)
+        return None
+
+
+def _cache_put(cache: "SuggestionCache", key: str, suggestions: List[str]) -> None:
+    try:
+        cache.put(key, suggestions)
+    except Exception as e:
+        print(f"Warning: Could not write suggestion cache: {e}", file=sys.stderr)
+
+
+def _answer_cut_short() -> bool:
+    """Whether the --deadline may have stopped the model's answer before it was complete."""
+    return time_budget.expired() or any(stage in ("model", "model stream") for stage in time_budget.cuts())
+
+
+def lookup_suggestions(
+    prompt: str,
+    context: Optional[str],
+    model_name: str,
+    max_suggestions: int,
+    use_cache: bool = True,
+    refresh: bool = False,
+    wait_msg: Optional[str] = None,
+) -> List[str]:
+    """Get command suggestions from the cache or from the model.
+
+    With refresh set the cached entry is ignored and replaced by a fresh answer.
+    A spinner showing wait_msg runs while the model is asked, if given.
+    """
+    from cache import cache_key
+
+    cache = _get_cache() if use_cache else None
+    key = cache_key(model_name, prompt, context, max_suggestions)
+
+    with timings.phase("cache lookup"):
+        suggestions = _cache_get(cache, key) if cache and not refresh else None
+
+    if suggestions is None:
+        # Imported here so daemon clients never load the HTTP stack
+        with timings.phase("import model"):
+            from model import get_suggestions
+
+        with spinner(wait_msg) if wait_msg else nullcontext(), timings.phase("model"):
+            suggestions = get_suggestions(
+                prompt=prompt,
+                context=context,
+                model_name=model_name,
+                max_suggestions=max_suggestions,
+            )
+        # A partial answer would be served for the whole CACHE_TTL, also without a deadline
+        if cache and suggestions and not _answer_cut_short():
+            _cache_put(cache, key, suggestions)
+
+    return suggestions
+
+
+def iter_suggestions(
+    prompt: str,
+    context: Optional[str],
+    model_name: str,
+    max_suggestions: int,
+    use_cache: bool = True,
+    refresh: bool = False,
+) -> Iterator[str]:
+    """Yield suggestions from the cache, or stream them from the model as they arrive."""
+    from cache import cache_key
+
+    cache = _get_cache() if use_cache else None
+    key = cache_key(model_name, prompt, context, max_suggestions)
+
+    with timings.phase("cache lookup"):
+        cached = _cache_get(cache, key) if cache and not refresh else None
+    if cached is not None:
+        yield from cached
+        return
+
+    with timings.phase("import model"):
+        from model import stream_suggestions
+
+    suggestions = []
+    started = time.perf_counter()
+    for cmd in stream_suggestions(
+        prompt=prompt,
+        context=context,
+        model_name=model_name,
+        max_suggestions=max_suggestions,
+    ):
+        if not suggestions:
+            timings.record("model: first suggestion", time.perf_counter() - started, started)
+        suggestions.append(cmd)
+        yield cmd
+    timings.record("model: stream", time.perf_counter() - started, started)
+
+    if cache and suggestions and not _answer_cut_short():
+        _cache_put(cache, key, suggestions)
+
+
+def get_command_suggestions(
+    prompt: str,
+    context: Optional[str],
+    model_name: str,
+    max_suggestions: int,
+    use_cache: bool = True,
+    refresh: bool = False,
+    use_daemon: bool = False,
+    stream: bool = False,
+    local: Optional[List[str]] = None,
+    screen: Optional["Screen"] = None,
+) -> List[str]:
+    """Get command suggestions, through the resident daemon if requested.
+
+    local holds commands matched from history: they are shown right away, appended
+    after the model's suggestions and used on their own when no provider answers.
+    With stream set the suggestions are displayed while they arrive. The model's
+    suggestions pass through screen, if given, which drops the invalid ones.
+    """
+    local = local or []
+    if local:
+        print("\nFrom history:")
+        for cmd in local:
+            print(f"  - {cmd}", flush=True)
+
+    if stream:
+        return _stream_command_suggestions(
+            prompt, context, model_name, max_suggestions, use_cache, refresh, use_daemon, local, screen,
         )
+
+    try:
+        suggestions = _fetch_command_suggestions(prompt, context, model_name, max_suggestions, use_cache, refresh, use_daemon)
+    except RuntimeError as e:
+        if not local and not time_budget.expired():
+            raise
+        print(f"Warning: {e}" + ("\nUsing history matches instead." if local else ""))
+        suggestions = []
+
+    return _with_history(prompt, suggestions, local, screen)
+
+
+def _with_history(prompt: str, suggestions: List[str], local: List[str], screen: Optional["Screen"]) -> List[str]:
+    """The model's suggestions that pass screen, followed by the history matches."""
+    if local and suggestions == [f"echo '{prompt}'"]:
+        suggestions = []  # Unknown provider, history beats the echo fallback
+    if screen is not None:
+        with timings.phase("validate"):
+            suggestions = list(screen.filter(suggestions))
+    suggestions = suggestions + [cmd for cmd in local if cmd not in suggestions]
     
-    if not suggestions:
+    # When the checks dropped everything, run_prompt asks again or reports it
+    if not suggestions and not (screen is not None and screen.dropped):
         print("No suggestions.\n")
     
     return suggestions
 
 
+def history_first(
+    args: argparse.Namespace,
+    prompt: str,
+    context: Optional[str],
+    local: List[str],
+    screen: Optional["Screen"] = None,
+) -> Tuple[Optional[ChoiceResult], List[str]]:
+    """Offer the history matches while the model is asked in the background.
+
+    Returns the user's choice if they ran a history match or quit right away,
+    else the model's suggestions followed by the history matches, like
+    get_command_suggestions.
+    """
+    results: "queue.Queue[Tuple[List[str], Optional[Exception]]]" = queue.Queue()
+
+    def fetch() -> None:
+        try:
+            results.put((_fetch_command_suggestions(
+                prompt, context, args.model, args.max_suggestions,
+                use_cache=not args.no_cache, refresh=False, use_daemon=args.daemon, quiet=True,
+            ), None))
+        except Exception as e:
+            results.put(([], e))
+
+    # Daemon thread so running a history match never waits for the model
+    threading.Thread(target=time_budget.propagate(fetch), daemon=True).start()
+
+    print("\nFrom history (asking the model meanwhile):")
+    for idx, cmd in enumerate(local, start=1):
+        print(f"  {idx}. {cmd}")
+    while True:
+        choice = input("\nEnter a number to run it now, empty to see the model's suggestions, q to quit: ").strip().lower()
+        if choice in ("q", "0"):
+            return ChoiceResult(), []
+        if not choice:
+            break
+        if choice.isdigit() and 1 <= int(choice) <= len(local):
+            return ChoiceResult(cmd=local[int(choice) - 1], action="execute"), []
+        print("Invalid choice. Please try again.")
+
+    with nullcontext() if not results.empty() else spinner("Thinking..."):
+        suggestions, error = results.get()
+    if error is not None:
+        print(f"Warning: {error}\nUsing history matches instead.")
+    return None, _with_history(prompt, suggestions, local, screen)
+
+
+def _fetch_command_suggestions(
+    prompt: str,
+    context: Optional[str],
+    model_name: str,
+    max_suggestions: int,
+    use_cache: bool,
+    refresh: bool,
+    use_daemon: bool,
+    quiet: bool = False,
+) -> List[str]:
+    """Ask the daemon, or this process when the daemon is off or unavailable.
+
+    quiet suppresses the spinner and warnings, for requests made in the background.
+    """
+    import daemon
+
+    if use_daemon:
+        with nullcontext() if quiet else spinner("Thinking..."), timings.phase("daemon request"):
+            try:
+                response = daemon.request({
+                    "op": "suggest",
+                    "prompt": prompt,
+                    "context": context,
+                    "model_name": model_name,
+                    "max_suggestions": max_suggestions,
+                    "use_cache": use_cache,
+                    "refresh": refresh,
+                    "deadline": time_budget.remaining(),
+                })
+            except daemon.DaemonUnavailable as e:
+                if not quiet:
+                    print(f"\rWarning: {e}, continuing without it.")
+                response = None
+        if response is not None:
+            for stage in response.get("cut", []):
+                time_budget.cut(stage)
+            if not response.get("ok"):
+                raise RuntimeError(response.get("error", "aih daemon request failed"))
+            return response["suggestions"]
+
+    return lookup_suggestions(
+        prompt=prompt,
+        context=context,
+        model_name=model_name,
+        max_suggestions=max_suggestions,
+        use_cache=use_cache,
+        refresh=refresh,
+        wait_msg=None if quiet else "Thinking...",
+    )
+
+
+def _stream_command_suggestions(
+    prompt: str,
+    context: Optional[str],
+    model_name: str,
+    max_suggestions: int,
+    use_cache: bool,
+    refresh: bool,
+    use_daemon: bool,
+    local: List[str],
+    screen: Optional["Screen"] = None,
+) -> List[str]:
+    """Display suggestions line by line as the model streams them and return them."""
+    import daemon
+
+    options = dict(
+        prompt=prompt,
+        context=context,
+        model_name=model_name,
+        max_suggestions=max_suggestions,
+        use_cache=use_cache,
+        refresh=refresh,
+    )
+    payload = dict(options, op="suggest", deadline=time_budget.remaining())
+    lines = daemon.stream(payload) if use_daemon else iter_suggestions(**options)
+
+    checked = screen.filter(lines) if screen is not None else lines
+
+    with spinner("Thinking..."):
+        try:
+            try:
+                first = next(checked, None)
+            except daemon.DaemonUnavailable as e:
+                print(f"\rWarning: {e}, continuing without it.")
+                lines = iter_suggestions(**options)
+                checked = screen.filter(lines) if screen is not None else lines
+                first = next(checked, None)
+        except RuntimeError as e:
+            if not local and not time_budget.expired():
+                raise
+            print(f"\rWarning: {e}" + ("\nUsing history matches instead." if local else ""))
+            first = None
+
+    if local and first == f"echo '{prompt}'":
+        first = None  # Unknown provider, history beats the echo fallback
+    if first is None and not local:
+        if not (screen is not None and screen.dropped):
+            print("No suggestions.\n")
+        return []
+
+    def with_local() -> Iterator[str]:
+        streamed = []
+        if first is not None:
+            for cmd in itertools.chain([first], checked):
+                streamed.append(cmd)
+                yield cmd
+        yield from (cmd for cmd in local if cmd not in streamed)
+
+    # Reads the screen's notes as the stream adds them, without writing the history notes into them
+    notes = ChainMap({cmd: HISTORY_NOTE for cmd in local}, screen.notes if screen is not None else {})
+    return display_suggestions(with_local(), notes)
+
+
 def log_command(cmd: str) -> None:
-    """Log a command with datetime to the commands.log file."""
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    new_log_entry = f"{timestamp} $ {cmd}\n"
-    
+    """Append a command with datetime and working directory to the commands.log file."""
     try:
-        # Read existing log entries if the file exists
-        existing_entries = []
-        if COMMAND_LOG_FILE.exists():
-            with open(COMMAND_LOG_FILE, "r") as f:
-                existing_entries = f.readlines()
-        
-        # Add the new entry
-        entries = existing_entries + [new_log_entry]
-        
-        # Keep only the most recent entries up to MAX_COMMAND_HISTORY
-        if len(entries) > MAX_COMMAND_HISTORY:
-            entries = entries[-MAX_COMMAND_HISTORY:]
-        
-        # Write back all entries
-        with open(COMMAND_LOG_FILE, "w") as f:
-            f.writelines(entries)
+        command_log.append(COMMAND_LOG_FILE, cmd, user_cwd(), MAX_COMMAND_HISTORY)
     except Exception as e:
         print(f"Warning: Could not log command: {e}")
 
 
-def display_command_history() -> None:
-    """Display the command history from the log file and exit."""
+def find_history_matches(prompt: str) -> List[str]:
+    """Return up to HISTORY_SUGGESTIONS past commands accepted for similar prompts."""
+    if HISTORY_SUGGESTIONS <= 0:
+        return []
+    try:
+        import history
+
+        return history.lookup(prompt, user_cwd(), HISTORY_SUGGESTIONS)
+    except Exception as e:
+        print(f"Warning: Could not search history: {e}")
+        return []
+
+
+def record_history(prompt: str, context: Optional[str], cmd: str) -> None:
+    """Remember the accepted command for prompt so it can be offered again."""
+    try:
+        import history
+
+        history.record(prompt, context, cmd, user_cwd())
+    except Exception as e:
+        print(f"Warning: Could not record history: {e}")
+
+
+def display_command_history(args: argparse.Namespace) -> None:
+    """Display one page of the command history, filtered by the --history options."""
     try:
         if not COMMAND_LOG_FILE.exists():
             print("No command history found.")
             return
-            
-        with open(COMMAND_LOG_FILE, "r") as f:
-            history = f.read().strip()
-            
-        if not history:
-            print("Command history is empty.")
+
+        cwd = str(Path(user_cwd(), args.cwd).resolve()) if args.cwd else None
+        entries = command_log.search(
+            COMMAND_LOG_FILE,
+            text=args.search,
+            regex=args.regex,
+            since=args.since,
+            until=args.until,
+            cwd=cwd,
+            limit=max(1, args.limit),
+            page=max(1, args.page),
+        )
+        if not entries:
+            filtered = args.search or args.since or args.until or args.cwd or args.page > 1
+            print("No matching commands." if filtered else "Command history is empty.")
         else:
             print("Command History:")
-            print(history)
+            for entry in entries:
+                print(entry.line)
+    except re.error as e:
+        print(f"Invalid --search pattern: {e}")
     except Exception as e:
         print(f"Error reading command history: {e}")
 
@@ -249,41 +840,260 @@ def display_command_history() -> None:
 def main() -> None:
     """Main program logic."""
     args = parse_args()
+
+    if args.replay:
+        # Replayed answers must come from the journal, not from the cache or a daemon with its own environment
+        os.environ["AIH_REPLAY"] = args.replay
+        args.no_cache = True
+        args.daemon = False
     
     # Check for history flag and display history if requested
     if args.history:
-        display_command_history()
+        display_command_history(args)
+        return
+
+    if args.daemon_stop:
+        import daemon
+
+        print("Daemon stopped." if daemon.stop() else "Daemon is not running.")
+        return
+
+    if args.warmup:
+        run_warmup(args)
+        return
+
+    if args.stats:
+        print_stats(args)
+        return
+
+    if args.clear_cache:
+        from cache import SuggestionCache
+
+        removed = SuggestionCache().clear()
+        print(f"Cleared {removed} cached suggestion(s).")
+        return
+
+    if args.batch:
+        run_batch(args)
         return
         
     # Require at least one prompt word unless showing history
     if not args.prompt:
         print("Error: Please provide a prompt describing what you want to do.")
         return
-        
+
+    if not args.timings:
+        run_prompt(args)
+        return
+
+    timings.enable()
+    timings.record("load_env", _ENV_SECONDS, _ENV_STARTED)
+    try:
+        run_prompt(args)
+    finally:
+        print(timings.report())
+        trace_file = cfg.get("AIH_TIMINGS_FILE")
+        if trace_file:
+            try:
+                timings.export(trace_file, model=args.model, stream=args.stream, daemon=args.daemon)
+            except OSError as e:
+                print(f"Warning: Could not write timings trace: {e}")
+
+
+def run_warmup(args: argparse.Namespace) -> None:
+    """Prepare what the first request would otherwise wait for; commands.sh runs this in the background."""
+    # Builds the on-disk $PATH and commands.md indexes
+    get_validator()
+    if args.daemon:
+        # The daemon keeps its connection pool, so it opens the connections itself
+        import daemon
+
+        try:
+            daemon.request({"op": "warmup", "model_name": args.model}, timeout=300)
+        except daemon.DaemonUnavailable:
+            pass
+    else:
+        from model import warm_up
+
+        # Connections opened here would close when this process exits; Ollama keeps its models loaded
+        warm_up(args.model, preconnect=False)
+
+
+def print_stats(args: argparse.Namespace) -> None:
+    """Print the usage report, followed by the cascade summary once cascaded requests were made."""
+    from cascade import CascadeStats
+    from model import usage_report
+
+    print(usage_report(args.max_suggestions))
+    cascade_stats = CascadeStats()
+    if cascade_stats.escalation_rate() is not None:
+        print("\nCascade:\n" + cascade_stats.summary())
+
+
+def run_batch(args: argparse.Namespace) -> None:
+    """Answer the prompts of --batch concurrently, writing one JSON result per line to stdout."""
+    from batch import BatchRunner, parse_rate_limits, read_items
+
+    def suggest(prompt: str, context: Optional[str], model_name: str, max_suggestions: int) -> List[str]:
+        with time_budget.limit(args.deadline):
+            if context is None:
+                # The relevant parts of commands.md differ per prompt
+                context = build_full_context(args, prompt=prompt)
+            return lookup_suggestions(prompt, context, model_name, max_suggestions, use_cache=not args.no_cache)
+
+    runner = BatchRunner(
+        suggest,
+        model_name=args.model,
+        max_suggestions=args.max_suggestions,
+        concurrency=args.concurrency,
+        rate_limits=parse_rate_limits(args.rate_limit),
+    )
+    started = time.perf_counter()
+    try:
+        if args.batch == "-":
+            runner.run(read_items(sys.stdin))
+        else:
+            with open(args.batch) as f:
+                runner.run(read_items(f))
+    except OSError as e:
+        print(f"Error reading batch input: {e}", file=sys.stderr)
+        return
+    print(
+        f"Batch done: {runner.succeeded} ok, {runner.failed} failed in {time.perf_counter() - started:.1f}s",
+        file=sys.stderr,
+    )
+
+
+def prefetch_alternatives(args: argparse.Namespace, prompt: str, shown: List[str],
+                          conversation: Optional[str] = None) -> Optional[Speculation]:
+    """Start asking for suggestions that differ from shown, so pressing 'r' needs no round trip.
+
+    The speculation's result is the context it used and the suggestions.
+    """
+    if args.no_prefetch or PREFETCH_BUDGET <= 0:
+        return None
+    context = build_full_context(args, shown, PREFETCH_COMMENT, conversation=conversation)
+
+    def fetch() -> Tuple[Optional[str], List[str]]:
+        return context, _fetch_command_suggestions(
+            prompt, context, args.model, args.max_suggestions,
+            use_cache=not args.no_cache, refresh=True, use_daemon=args.daemon, quiet=True,
+        )
+
+    return Speculation(fetch, PREFETCH_BUDGET)
+
+
+def run_prompt(args: argparse.Namespace) -> None:
+    """Suggest commands for the prompt in args until the user executes one or quits."""
+    from session import Session, session_key
+
     user_prompt = " ".join(args.prompt)
+    with timings.phase("history lookup"):
+        local = find_history_matches(user_prompt)
+    key = session_key(user_cwd())
+    session = Session.load(key, SESSION_TTL) if args.continue_session else Session(key)
     prev_suggestions = []
     user_comment = None
+    refresh = False
+    speculation: Optional[Speculation] = None
+    failed_checks: Optional["Screen"] = None  # Set for the automatic retry after nothing passed validation
+    # The first round offers history matches while the model is still being asked
+    offer_history = bool(local)
     
     while True:
-        # Build context for the model
-        ctx = build_full_context(args, prev_suggestions, user_comment)
-        
-        # Get suggestions
-        suggestions = get_command_suggestions(
-            prompt=user_prompt,
-            context=ctx,
-            model_name=args.model,
-            max_suggestions=args.max_suggestions,
-        )
+        screen = new_screen(args)
+        early_choice: Optional[ChoiceResult] = None
+
+        # Alternatives prefetched while the user was reading make 'r' instant
+        prefetched = None
+        if refresh and speculation is not None:
+            with nullcontext() if speculation.ready() else spinner("Thinking..."), timings.phase("prefetch wait"):
+                prefetched = speculation.result()
+
+        if prefetched and prefetched[1]:
+            ctx, alternatives = prefetched
+            if screen is not None:
+                with timings.phase("validate"):
+                    alternatives = list(screen.filter(alternatives))
+            suggestions = alternatives + [cmd for cmd in local if cmd not in alternatives]
+            displayed = False
+        else:
+            # A --deadline bounds context building and the provider call of each round
+            with time_budget.limit(args.deadline) as cuts:
+                # Build context for the model; the last turn is described by the feedback, if any
+                with timings.phase("build context"):
+                    conversation = session.render(SESSION_TOKENS, skip_last=bool(prev_suggestions))
+                    if failed_checks is not None:
+                        comment = failed_checks.feedback()
+                        if user_comment:
+                            comment = f"{user_comment}\n{comment}"
+                        ctx = build_full_context(args, list(failed_checks.rejected), comment,
+                                                 conversation=conversation)
+                    else:
+                        ctx = build_full_context(args, prev_suggestions, user_comment, conversation=conversation)
+            
+                # Get suggestions
+                with timings.phase("suggestions"):
+                    if offer_history:
+                        early_choice, suggestions = history_first(args, user_prompt, ctx, local, screen)
+                    else:
+                        suggestions = get_command_suggestions(
+                            prompt=user_prompt,
+                            context=ctx,
+                            model_name=args.model,
+                            max_suggestions=args.max_suggestions,
+                            use_cache=not args.no_cache,
+                            refresh=refresh,
+                            use_daemon=args.daemon,
+                            stream=args.stream,
+                            local=local,
+                            screen=screen,
+                        )
+            if cuts and early_choice is None:
+                print(f"Deadline of {args.deadline:g}s reached, cut short: {', '.join(cuts)}")
+            displayed = args.stream and not offer_history
+            offer_history = False
+        refresh = False
+        if early_choice is not None:
+            suggestions = list(local)  # What the user chose from
+
+        # Only when every suggestion was dropped; flagged ones are kept, they may be aliases
+        all_dropped = screen is not None and bool(screen.dropped) and not screen.passed and not screen.notes
+        if all_dropped and not local and failed_checks is None:
+            # Nothing passed the local checks: ask once more, telling the model why
+            print(f"None of the {len(screen.dropped)} suggestions passed local checks, asking again...")
+            for cmd, reason in screen.dropped.items():
+                print(f"  dropped: {cmd}  ({reason})")
+            failed_checks = screen
+            speculation = None
+            refresh = True
+            continue
+        failed_checks = None
 
         if not suggestions:
+            if all_dropped:
+                print("No suggestions.\n")
             return
 
         # Save suggestions for potential regeneration
         prev_suggestions = suggestions.copy()
+        with timings.phase("session"):
+            turn = session.add(user_prompt, suggestions)
+        if early_choice is not None:
+            choice_result = early_choice
+        else:
+            with timings.phase("start prefetch"):
+                speculation = prefetch_alternatives(args, user_prompt, suggestions,
+                                                    session.render(SESSION_TOKENS, skip_last=True))
         
-        # Get user choice
-        choice_result = choose(suggestions)
+            # Get user choice
+            with timings.phase("choose"):
+                notes = dict(screen.notes) if screen is not None else {}
+                notes.update({cmd: HISTORY_NOTE for cmd in local})
+                choice_result = choose(suggestions, displayed=displayed, notes=notes)
+
+        if speculation is not None and (not choice_result or choice_result.action != "regenerate"):
+            speculation.cancel()
         
         # Handle the different actions
         if not choice_result or not choice_result.action:
@@ -292,16 +1102,23 @@ def main() -> None:
             
         if choice_result.action == "regenerate":
             print("Regenerating suggestions...")
+            refresh = True
             continue
             
         if choice_result.action == "comment":
             user_comment = choice_result.comment
+            turn.comment = user_comment
+            session.save()
             print("Adding your comment and regenerating...")
             continue
             
         if choice_result.action == "execute":
             # Log command before execution
-            log_command(choice_result.cmd)
+            with timings.phase("log command"):
+                log_command(choice_result.cmd)
+                record_history(user_prompt, ctx, choice_result.cmd)
+                turn.executed = choice_result.cmd
+                session.save()
             execute_command(choice_result.cmd, args.no_confirm)
             return
 
@@ -1,112 +1,433 @@
 import os
-import requests
-from typing import List, Optional
+import re
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 import json
 
+import journal
+import time_budget
+import timings
+import usage
+from budget import split_context
+from gemini_cache import PrefixCache
+from journal import Exchange
 from utils import load_env
+from transport import StreamResponse, TransportError, get_transport
 
 load_env()
 
 _API_URL = "https://api.openai.com/v1/chat/completions"
-_HEADERS  = {"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}",
-             "Content-Type": "application/json"}
 
 _GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models"
 
+_gemini_prefix_cache: Optional[PrefixCache] = None
+
+
+def _openai_headers() -> dict:
+    """Headers for OpenAI calls, built per request so the key is read after .env is loaded."""
+    return {"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}",
+            "Content-Type": "application/json"}
+
+
 # System prompt used for all models
 _SYSTEM_PROMPT = """
 You are a Bash expert.
 
-— Output exactly one valid Bash command, no code fences.
-— No explanations, no extra text, no blank lines.
-— If you are uncertain, output an empty string instead.
+— Answer with a JSON array of distinct, valid Bash commands, best first.
+— Each command is one line. No code fences, no explanations, nothing after the array.
+— Make the alternatives genuinely different (other tools, flags or approaches).
+— If you are uncertain, answer [].
 — If the additional *context* already contains a single-line Bash command
-  that directly satisfies the request, return that command verbatim.
-— Otherwise translate the user's pseudo command into a real command.
+  that directly satisfies the request, put that command first, verbatim.
+— Otherwise translate the user's pseudo command into real commands.
 
 Example
-User: list the ten largest files here
-Assistant: du -ah . | sort -rh | head -n 10
+User: list the ten largest files here (up to 3 commands)
+Assistant: ["du -ah . | sort -rh | head -n 10", "find . -type f -printf '%s %p\\n' | sort -nr | head -n 10", "ls -lS | head -n 11"]
 """
 
+# Output tokens allowed per requested command, plus the array's own overhead
+_TOKENS_PER_SUGGESTION = 80
+_TOKENS_OVERHEAD = 20
+
+_LIST_MARKER_RE = re.compile(r"^(?:[-*•]|\d+[.)]|\$)\s+")
+# Start of a JSON array of strings at the beginning of a line, prose or a code fence may precede it
+_ARRAY_START_RE = re.compile(r"^[ \t]*(\[)\s*[\"\]]", re.MULTILINE)
+
+
 def _format_system_message(context: Optional[str]) -> str:
-    """Return the system prompt, optionally extended with additional context."""
+    """Return the system prompt, optionally extended with the stable part of the context.
+
+    Nothing that changes between calls may go in here: providers reuse their
+    evaluation of a prompt prefix only while it stays byte-identical.
+    """
     system_message = _SYSTEM_PROMPT
     
     # If context is provided, add it to the system message
     if context:
         system_message += f"\n\nAdditional context: \n{context}"
     
-    # User message is now just the prompt/request
     return system_message
 
+
+def _format_volatile_context(context: str) -> str:
+    """Return the per-call context (environment, feedback), sent after the stable prefix."""
+    return f"Current context:\n{context}"
+
+
+def _format_user_message(prompt: str, max_suggestions: int) -> str:
+    """Return the user's request with the number of commands wanted."""
+    return f"{prompt} (up to {max_suggestions} commands)"
+
+
+def _chat_messages(prompt: str, context: Optional[str], max_suggestions: int) -> List[dict]:
+    """Chat messages with the stable prefix first and everything volatile after it."""
+    stable, volatile = split_context(context)
+    messages = [{"role": "system", "content": _format_system_message(stable)}]
+    if volatile:
+        messages.append({"role": "system", "content": _format_volatile_context(volatile)})
+    messages.append({"role": "user", "content": _format_user_message(prompt, max_suggestions)})
+    return messages
+
+
+def _max_tokens(max_suggestions: int) -> int:
+    """Output token cap sized to the number of commands requested."""
+    return _TOKENS_PER_SUGGESTION * max_suggestions + _TOKENS_OVERHEAD
+
+
+def _output_limit(model_name: str, max_suggestions: int) -> int:
+    """Output token cap for model_name, sized by its earlier answers unless ADAPTIVE_OUTPUT is off."""
+    default = _max_tokens(max_suggestions)
+    if not usage.adaptive():
+        return default
+    return usage.stats().output_limit(model_name, max_suggestions, default)
+
+
+def usage_report(max_suggestions: int) -> str:
+    """The --stats report: tokens, cost, latency and output limit per model."""
+    prices = usage.parse_prices(os.environ.get("USAGE_PRICES", ""))
+    return usage.stats().report(max_suggestions, _max_tokens(max_suggestions), prices)
+
+
+def _stop_sequences(model_name: str) -> List[str]:
+    """None by default: a stop on prose would end the answer before the array that follows it."""
+    if not usage.adaptive():
+        return []
+    return usage.stats().stop_sequences(model_name, [])
+
+
+def _clean_line(line: str) -> str:
+    """Strip list markers, prompts and backticks from a plain-text suggestion line."""
+    line = _LIST_MARKER_RE.sub("", line.strip())
+    return line.strip("`").strip()
+
+
+class _ArrayParser:
+    """Incrementally extracts the strings of a JSON array of strings from streamed text.
+
+    Strings are returned as soon as their closing quote arrives, so a truncated
+    array (cut by max_tokens) still yields every complete command.
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self.done = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = 0
+
+    def feed(self, chunk: str) -> List[str]:
+        self.text += chunk
+        found: List[str] = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            if self.done:
+                break
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        try:
+                            found.append(json.loads(text[self._start:i + 1]))
+                        except ValueError:
+                            pass
+            elif ch == "[":
+                self._depth += 1
+            elif self._depth == 0:
+                continue  # Before the array, e.g. a code fence
+            elif ch == '"':
+                self._in_string = True
+                self._start = i
+            elif ch == "]":
+                self._depth -= 1
+                self.done = self._depth == 0
+        self._pos = len(text)
+        return found
+
+
+def _accept(cmd: object, seen: List[str]) -> Optional[str]:
+    """Return cmd normalized if it is a new, non-empty suggestion, recording it in seen."""
+    if not isinstance(cmd, str):
+        return None
+    cmd = cmd.strip()
+    if not cmd or "\n" in cmd or cmd in seen:
+        return None
+    seen.append(cmd)
+    return cmd
+
+
+def _iter_suggestions(chunks: Iterable[str], max_suggestions: int) -> Iterator[str]:
+    """Yield distinct suggestions from a (streamed) completion as soon as each is complete.
+
+    The answer is expected to be a JSON array of commands, possibly after some
+    prose or a code fence. An answer without an array anywhere is taken as
+    plain lines, once it is complete; lines ending with a colon introduce
+    commands rather than being one.
+    """
+    seen: List[str] = []
+    parser = _ArrayParser()
+    text = ""
+    found = False
+    for chunk in chunks:
+        text += chunk
+        if not found:
+            match = _ARRAY_START_RE.search(text)
+            if match is None:
+                continue  # No array yet: prose before it, or a plain lines answer
+            found = True
+            candidates = parser.feed(text[match.start(1):])
+        else:
+            candidates = parser.feed(chunk)
+        for cmd in candidates:
+            if _accept(cmd, seen):
+                yield cmd
+                if len(seen) >= max_suggestions:
+                    return
+        if parser.done:
+            return
+
+    if not found:
+        for line in text.split("\n"):
+            cmd = _clean_line(line)
+            if not line.strip().startswith("```") and not cmd.endswith(":") and _accept(cmd, seen):
+                yield cmd
+                if len(seen) >= max_suggestions:
+                    return
+
+
+def _parse_suggestions(text: str, max_suggestions: int) -> List[str]:
+    """Return up to max_suggestions distinct commands from a complete answer."""
+    return list(_iter_suggestions([text], max_suggestions))
+
+
+def _note_request(exchange: Optional[Exchange], payload: dict) -> None:
+    if exchange is not None:
+        exchange.request_bytes = len(json.dumps(payload))
+        exchange.max_tokens = (payload.get("max_tokens") or payload.get("options", {}).get("num_predict")
+                               or payload.get("generationConfig", {}).get("maxOutputTokens"))
+
+
+def _openai_usage(usage: Optional[dict]) -> dict:
+    """Token counts of an OpenAI usage object."""
+    usage = usage or {}
+    counts = {"prompt_tokens": usage.get("prompt_tokens"), "completion_tokens": usage.get("completion_tokens"),
+              "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens")}
+    return {k: v for k, v in counts.items() if v is not None}
+
+
+def _ollama_usage(result: dict) -> dict:
+    """Token counts of a (final) Ollama chat response."""
+    counts = {"prompt_tokens": result.get("prompt_eval_count"), "completion_tokens": result.get("eval_count")}
+    return {k: v for k, v in counts.items() if v is not None}
+
+
+def _gemini_usage(result: dict) -> dict:
+    """Token counts of a Gemini usageMetadata object."""
+    usage = result.get("usageMetadata") or {}
+    counts = {"prompt_tokens": usage.get("promptTokenCount"), "completion_tokens": usage.get("candidatesTokenCount"),
+              "cached_tokens": usage.get("cachedContentTokenCount")}
+    return {k: v for k, v in counts.items() if v is not None}
+
+
+def _sse_data(response: StreamResponse) -> Iterator[str]:
+    """Yield the data payloads of a server-sent events response."""
+    for line in response.iter_lines():
+        if line and line.startswith("data:"):
+            yield line[5:].strip()
+
+
+def _openai_body(prompt: str, context: Optional[str], max_suggestions: int, model_name: str) -> dict:
+    return {
+        "model": model_name,
+        "messages": _chat_messages(prompt, context, max_suggestions),
+        "max_tokens": _output_limit(f"openai/{model_name}", max_suggestions),
+        "temperature": 0.2,
+        "stop": _stop_sequences(f"openai/{model_name}") or None,
+    }
+
+
 def _openai_chat(prompt: str,
                  context: Optional[str],
                  max_suggestions: int,
-                 model_name: str) -> List[str]:
-    system_message = _format_system_message(context)
-    
-    body = {
-        "model": model_name,
-        "messages": [
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": prompt},
-        ],
-        "max_tokens": 150,
-        "temperature": 0.2
-    }
+                 model_name: str,
+                 exchange: Optional[Exchange] = None) -> List[str]:
+    body = _openai_body(prompt, context, max_suggestions, model_name)
+    _note_request(exchange, body)
 
-    r = requests.post(_API_URL, headers=_HEADERS, data=json.dumps(body), timeout=30)
+    r = get_transport().post(_API_URL, headers=_openai_headers(), json=body)
 
-    if r.status_code != 200:
-        raise RuntimeError(f"OpenAI API request failed: {r.status_code} {r.text}")
+    if exchange is not None:
+        exchange.status = r.status
+    if r.status != 200:
+        raise RuntimeError(f"OpenAI API request failed: {r.status} {r.text}")
 
-    r.raise_for_status()
-    text = r.json()["choices"][0]["message"]["content"].strip()
-    return [line.strip() for line in text.splitlines() if line.strip()][:max_suggestions]
+    text = r.data["choices"][0]["message"]["content"].strip()
+    if exchange is not None:
+        exchange.text = text
+        exchange.usage = _openai_usage(r.data.get("usage"))
+    return _parse_suggestions(text, max_suggestions)
 
 
-def _ollama(prompt: str, context: Optional[str], max_suggestions: int, model_name: str) -> List[str]:
-    """Call ollama via HTTP API using the chat endpoint."""
+def _openai_chat_stream(prompt: str,
+                        context: Optional[str],
+                        max_suggestions: int,
+                        model_name: str,
+                        exchange: Optional[Exchange] = None) -> Iterator[str]:
+    """Stream completion text from OpenAI chat completions (server-sent events)."""
+    body = _openai_body(prompt, context, max_suggestions, model_name)
+    body["stream"] = True
+    # The last event then carries the token counts
+    body["stream_options"] = {"include_usage": True}
+    _note_request(exchange, body)
+
+    with get_transport().stream(_API_URL, headers=_openai_headers(), json=body) as r:
+        if exchange is not None:
+            exchange.status = r.status
+        if r.status != 200:
+            raise RuntimeError(f"OpenAI API request failed: {r.status} {r.text}")
+
+        for data in _sse_data(r):
+            if data == "[DONE]":
+                return
+            event = json.loads(data)
+            if exchange is not None and event.get("usage"):
+                exchange.usage = _openai_usage(event["usage"])
+            choices = event.get("choices") or [{}]
+            content = choices[0].get("delta", {}).get("content")
+            if content:
+                yield content
+
+
+def _ollama_request(prompt: str, context: Optional[str], max_suggestions: int, model_name: str,
+                    stream: bool) -> Tuple[str, dict]:
+    """Return the Ollama chat endpoint and payload for a request."""
     
     ollama_api_url = os.environ.get("OLLAMA_API_URL", "http://localhost:11434/api/chat")
     
     # Extract model name from ollama/model-name format
     model = model_name.split("/", 1)[-1] if "/" in model_name else model_name
     
-    # Use the same format_prompt function as OpenAI
-    system_message = _format_system_message(context)
-    
-    # Create messages array with system and user messages
-    messages = [
-        {"role": "system", "content": system_message},
-        {"role": "user", "content": prompt},
-    ]
+    # Same message layout as OpenAI: stable system prompt first, so Ollama reuses its cached prefix
+    messages = _chat_messages(prompt, context, max_suggestions)
     
     payload = {
         "model": model,
         "messages": messages,
-        "stream": False,
-        "options": {"temperature": 0.15, "top_p": 0.9, "stop": ["\n"]} # For now hard stop to reduce chattiness
+        "stream": stream,
+        # Keep the model (and its prompt cache) loaded between invocations
+        "keep_alive": os.environ.get("OLLAMA_KEEP_ALIVE", "30m"),
+        "options": {
+            "temperature": 0.15,
+            "top_p": 0.9,
+            "num_predict": _output_limit(model_name, max_suggestions),
+            "stop": _stop_sequences(model_name),
+        }
     }
+    # A fixed context size; changing it between requests makes Ollama reload the model
+    num_ctx = os.environ.get("OLLAMA_NUM_CTX")
+    if num_ctx:
+        payload["options"]["num_ctx"] = int(num_ctx)
+    return ollama_api_url, payload
+
+
+def _ollama(prompt: str, context: Optional[str], max_suggestions: int, model_name: str,
+            exchange: Optional[Exchange] = None) -> List[str]:
+    """Call ollama via HTTP API using the chat endpoint."""
+    ollama_api_url, payload = _ollama_request(prompt, context, max_suggestions, model_name, stream=False)
+    _note_request(exchange, payload)
     
     try:
-        response = requests.post(ollama_api_url, json=payload, timeout=30)
+        response = get_transport().post(ollama_api_url, json=payload)
         
-        if response.status_code != 200:
-            raise RuntimeError(f"Ollama API request failed: {response.status_code} {response.text}")
+        if exchange is not None:
+            exchange.status = response.status
+        if response.status != 200:
+            raise RuntimeError(f"Ollama API request failed: {response.status} {response.text}")
             
-        response.raise_for_status()
-        result = response.json()
+        result = response.data or {}
         text = result.get("message", {}).get("content", "").strip()
-        return [line.strip() for line in text.splitlines() if line.strip()][:max_suggestions]
-    except requests.RequestException as e:
+        if exchange is not None:
+            exchange.text = text
+            exchange.usage = _ollama_usage(result)
+        return _parse_suggestions(text, max_suggestions)
+    except TransportError as e:
         raise RuntimeError(f"Ollama API request failed: {str(e)}")
 
 
-def _gemini(prompt: str, context: Optional[str], max_suggestions: int, model_name: str) -> List[str]:
-    """Call Gemini API using direct HTTP requests to generate command suggestions."""
+def _ollama_stream(prompt: str, context: Optional[str], max_suggestions: int, model_name: str,
+                   exchange: Optional[Exchange] = None) -> Iterator[str]:
+    """Stream completion text from the ollama chat endpoint (newline-delimited JSON)."""
+    ollama_api_url, payload = _ollama_request(prompt, context, max_suggestions, model_name, stream=True)
+    _note_request(exchange, payload)
+
+    try:
+        with get_transport().stream(ollama_api_url, json=payload) as response:
+            if exchange is not None:
+                exchange.status = response.status
+            if response.status != 200:
+                raise RuntimeError(f"Ollama API request failed: {response.status} {response.text}")
+
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                result = json.loads(line)
+                content = result.get("message", {}).get("content")
+                if content:
+                    yield content
+                if result.get("done"):
+                    if exchange is not None:
+                        exchange.usage = _ollama_usage(result)
+                    return
+    except TransportError as e:
+        raise RuntimeError(f"Ollama API request failed: {str(e)}")
+
+
+def _gemini_cache() -> PrefixCache:
+    global _gemini_prefix_cache
+    if _gemini_prefix_cache is None:
+        _gemini_prefix_cache = PrefixCache(
+            min_tokens=int(os.environ.get("GEMINI_CACHE_MIN_TOKENS") or 0) or None,
+            ttl=int(os.environ.get("GEMINI_CACHE_TTL", "3600")),
+        )
+    return _gemini_prefix_cache
+
+
+def _gemini_request(prompt: str, context: Optional[str], max_suggestions: int, model_name: str,
+                    method: str, use_cache: bool = True) -> Tuple[str, dict]:
+    """Return the Gemini API URL for method and the request payload.
+
+    The stable system message goes in systemInstruction, or is referred to as
+    cachedContent when it is big enough to be cached on Gemini's side.
+    """
     
     # Check if API key is configured
     api_key = os.getenv('GOOGLE_API_KEY')
@@ -116,11 +437,15 @@ def _gemini(prompt: str, context: Optional[str], max_suggestions: int, model_nam
     # Extract model name from gemini/model-name format
     model = model_name.split("/", 1)[-1] if "/" in model_name else model_name
     
-    # Format the system message and prompt
-    system_message = _format_system_message(context)
+    # Format the system message and prompt; the volatile context goes with the prompt
+    stable, volatile = split_context(context)
+    system_message = _format_system_message(stable)
+    user_message = _format_user_message(prompt, max_suggestions)
+    if volatile:
+        user_message = f"{_format_volatile_context(volatile)}\n\nUser: {user_message}"
     
     # Build the API URL with the model name
-    api_url = f"{_GEMINI_API_URL}/{model}:generateContent?key={api_key}"
+    api_url = f"{_GEMINI_API_URL}/{model}:{method}?key={api_key}"
     
     # Build the request payload
     payload = {
@@ -129,7 +454,7 @@ def _gemini(prompt: str, context: Optional[str], max_suggestions: int, model_nam
                 "role": "user",
                 "parts": [
                     {
-                        "text": f"{system_message}\n\nUser: {prompt}"
+                        "text": user_message
                     }
                 ]
             }
@@ -138,51 +463,260 @@ def _gemini(prompt: str, context: Optional[str], max_suggestions: int, model_nam
             "temperature": 0.2,
             "topP": 0.95,
             "topK": 40,
-            "maxOutputTokens": 300,
-            "stopSequences": []
+            "maxOutputTokens": _output_limit(model_name, max_suggestions),
+            "stopSequences": _stop_sequences(model_name)
         }
     }
+
+    cached = None
+    if use_cache and os.environ.get("GEMINI_CACHE", "true").lower() in ("true", "yes", "1"):
+        with timings.phase("gemini prefix cache"):
+            base_url = _GEMINI_API_URL.rsplit("/models", 1)[0]
+            cached = _gemini_cache().lookup(base_url, api_key, model, system_message)
+    if cached:
+        payload["cachedContent"] = cached
+    else:
+        payload["systemInstruction"] = {"parts": [{"text": system_message}]}
+    return api_url, payload
+
+
+def _gemini_text(result: dict) -> str:
+    """Extract the text from a Gemini response - handle Gemini's specific response structure."""
+    try:
+        # Navigate through the response structure to find the text
+        return result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+    except (KeyError, IndexError):
+        # If structure is unexpected, try to find text elsewhere or return empty
+        return str(result.get("text", ""))
+
+
+def _gemini(prompt: str, context: Optional[str], max_suggestions: int, model_name: str,
+            exchange: Optional[Exchange] = None) -> List[str]:
+    """Call Gemini API using direct HTTP requests to generate command suggestions."""
+    api_url, payload = _gemini_request(prompt, context, max_suggestions, model_name, "generateContent")
+    _note_request(exchange, payload)
     
     try:
         # Make the HTTP request
         headers = {"Content-Type": "application/json"}
-        response = requests.post(api_url, headers=headers, json=payload, timeout=30)
+        response = get_transport().post(api_url, headers=headers, json=payload)
         
-        if response.status_code != 200:
-            raise RuntimeError(f"Gemini API request failed: {response.status_code} {response.text}")
+        if response.status != 200 and "cachedContent" in payload:
+            # The cached prefix may have expired early; send it inline instead
+            _gemini_cache().forget(payload["cachedContent"])
+            api_url, payload = _gemini_request(prompt, context, max_suggestions, model_name, "generateContent",
+                                               use_cache=False)
+            _note_request(exchange, payload)
+            response = get_transport().post(api_url, headers=headers, json=payload)
         
-        response.raise_for_status()
-        result = response.json()
+        if exchange is not None:
+            exchange.status = response.status
+        if response.status != 200:
+            raise RuntimeError(f"Gemini API request failed: {response.status} {response.text}")
         
-        # Extract text from response - handle Gemini's specific response structure
-        text = ""
-        try:
-            # Navigate through the response structure to find the text
-            text = result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "").strip()
-        except (KeyError, IndexError):
-            # If structure is unexpected, try to find text elsewhere or return empty
-            text = str(result.get("text", "")).strip()
+        text = _gemini_text(response.data or {}).strip()
+        if exchange is not None:
+            exchange.text = text
+            exchange.usage = _gemini_usage(response.data or {})
         
-        # Split into lines and return the requested number
-        return [line.strip() for line in text.splitlines() if line.strip()][:max_suggestions]
+        # Parse the answer and return the requested number
+        return _parse_suggestions(text, max_suggestions)
     
     except Exception as e:
         raise RuntimeError(f"Gemini API request failed: {str(e)}")
 
 
+def _gemini_stream(prompt: str, context: Optional[str], max_suggestions: int, model_name: str,
+                   exchange: Optional[Exchange] = None) -> Iterator[str]:
+    """Stream completion text from Gemini streamGenerateContent (server-sent events)."""
+    api_url, payload = _gemini_request(prompt, context, max_suggestions, model_name, "streamGenerateContent")
+
+    try:
+        headers = {"Content-Type": "application/json"}
+        while True:
+            _note_request(exchange, payload)
+            with get_transport().stream(f"{api_url}&alt=sse", headers=headers, json=payload) as response:
+                if exchange is not None:
+                    exchange.status = response.status
+                if response.status == 200:
+                    for data in _sse_data(response):
+                        result = json.loads(data)
+                        if exchange is not None and result.get("usageMetadata"):
+                            exchange.usage = _gemini_usage(result)
+                        text = _gemini_text(result)
+                        if text:
+                            yield text
+                    return
+                if "cachedContent" not in payload:
+                    raise RuntimeError(f"Gemini API request failed: {response.status} {response.text}")
+
+            # The cached prefix may have expired early; send it inline instead
+            _gemini_cache().forget(payload["cachedContent"])
+            api_url, payload = _gemini_request(prompt, context, max_suggestions, model_name,
+                                               "streamGenerateContent", use_cache=False)
+    except TransportError as e:
+        raise RuntimeError(f"Gemini API request failed: {str(e)}")
+
+
+def _openai_model(model_name: str) -> str:
+    """Model part of openai/<model>, after checking that a key is configured."""
+    if not os.environ.get("OPENAI_API_KEY"):
+        raise RuntimeError("OPENAI_API_KEY not set")
+    return model_name.partition("/")[2]
+
+
+def _warm_up_model(model_name: str, preconnect: bool) -> None:
+    if model_name.startswith("ollama"):
+        # A chat request without messages only loads the model and keeps it loaded for keep_alive
+        ollama_api_url, payload = _ollama_request("", None, 1, model_name, stream=False)
+        payload["messages"] = []
+        get_transport().post(ollama_api_url, json=payload, read_timeout=300)
+    elif preconnect and model_name.startswith("openai"):
+        get_transport().preconnect(_API_URL)
+    elif preconnect and model_name.startswith("gemini"):
+        get_transport().preconnect(_GEMINI_API_URL)
+
+
+def warm_up(model_name: str, preconnect: bool = True) -> None:
+    """Load local models and, with preconnect, open provider connections that model_name will need, all at once.
+
+    Connections stay in this process's pool, so preconnect only pays off in a
+    process that serves the next requests. Errors are ignored; an unreachable
+    provider shows up on the real request.
+    """
+    model_name = model_name or "openai/gpt-4o-mini"
+    if model_name.startswith("router"):
+        from router import pool
+        models = pool()
+    elif model_name.startswith("cascade"):
+        from cascade import local_model
+        models = [local_model(), model_name.partition("/")[2]]
+    else:
+        models = [model_name]
+
+    def attempt(name: str) -> None:
+        try:
+            _warm_up_model(name, preconnect)
+        except Exception:
+            pass
+
+    threads = [threading.Thread(target=attempt, args=(name,), daemon=True) for name in models]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
 def get_suggestions(prompt: str, context: Optional[str], model_name: str, max_suggestions: int) -> List[str]:
     """Dispatch to provider based on model_name prefix."""
     model_name = model_name or "openai/gpt-4o-mini"
-    if model_name.startswith("openai"):
-        key = os.environ.get("OPENAI_API_KEY")
-        if not key:
-            raise RuntimeError("OPENAI_API_KEY not set")
-        _, _, m = model_name.partition("/")
-        return _openai_chat(prompt, context, max_suggestions, m)
-    elif model_name.startswith("ollama"):
-        return _ollama(prompt, context, max_suggestions, model_name)
-    elif model_name.startswith("gemini"):
-        return _gemini(prompt, context, max_suggestions, model_name)
-    else:
+    if model_name.startswith("router"):
+        from router import route
+        return route(prompt, context, max_suggestions, get_suggestions)
+    if model_name.startswith("cascade"):
+        from cascade import cascade
+        return cascade(prompt, context, max_suggestions, model_name.partition("/")[2], get_suggestions)
+    if not model_name.startswith(("openai", "ollama", "gemini")):
         # Fallback: naive echo
         return [f"echo '{prompt}'"][:max_suggestions]
+
+    exchange = Exchange(model_name, prompt, context, max_suggestions)
+    replay = journal.replay()
+    try:
+        with timings.phase(f"provider {model_name}"):
+            if replay is not None:
+                return _parse_suggestions(replay.answer(exchange), max_suggestions)
+            if model_name.startswith("openai"):
+                return _openai_chat(prompt, context, max_suggestions, _openai_model(model_name), exchange)
+            elif model_name.startswith("ollama"):
+                return _ollama(prompt, context, max_suggestions, model_name, exchange)
+            else:
+                return _gemini(prompt, context, max_suggestions, model_name, exchange)
+    except Exception as e:
+        exchange.error = str(e)
+        raise
+    finally:
+        journal.record(exchange)
+        _account(exchange)
+
+
+def _account(exchange: Exchange) -> None:
+    """Add a finished call to the usage stats behind --stats and the adaptive output limits."""
+    if exchange.replayed:
+        return
+    if exchange.error:
+        if not time_budget.expired():  # A call cut short by --deadline says nothing about the model
+            usage.stats().record(exchange.model_name, {"error": True})
+        return
+    if not exchange.usage.get("completion_tokens"):
+        return  # A stream closed early, its latency and length are not the model's
+    usage.stats().record(exchange.model_name, dict(
+        exchange.usage,
+        latency=round(time.perf_counter() - exchange.started, 3),
+        first_chunk=round(exchange.first_chunk - exchange.started, 3) if exchange.first_chunk else None,
+        suggestions=len(_parse_suggestions(exchange.text, exchange.max_suggestions)),
+        limit=exchange.max_tokens,
+        one_line=usage.one_line_array(exchange.text),
+    ))
+
+
+def _recorded(chunks: Iterator[str], exchange: Exchange) -> Iterator[str]:
+    """Pass chunks through, keeping the full text and the arrival of the first one for the journal."""
+    try:
+        for chunk in chunks:
+            if exchange.first_chunk is None:
+                exchange.first_chunk = time.perf_counter()
+            exchange.text += chunk
+            yield chunk
+    except Exception as e:
+        exchange.error = str(e)
+        raise
+
+
+def _until_deadline(chunks: Iterator[str]) -> Iterator[str]:
+    """Pass chunks through until the --deadline passes; a read cut short by it ends the stream quietly."""
+    try:
+        for chunk in chunks:
+            yield chunk
+            if time_budget.expired():
+                time_budget.cut("model stream")
+                return
+    except RuntimeError:
+        if not time_budget.expired():
+            raise
+        time_budget.cut("model stream")
+
+
+def stream_suggestions(prompt: str, context: Optional[str], model_name: str, max_suggestions: int) -> Iterator[str]:
+    """Like get_suggestions, but yield each suggestion as soon as the provider has produced it."""
+    model_name = model_name or "openai/gpt-4o-mini"
+    if model_name.startswith(("router", "cascade")):
+        # Hedged requests race whole answers and cascaded ones are scored whole, so neither is streamed
+        yield from get_suggestions(prompt, context, model_name, max_suggestions)
+        return
+    if not model_name.startswith(("openai", "ollama", "gemini")):
+        # Fallback: naive echo
+        yield from _iter_suggestions(iter([f"echo '{prompt}'"]), max_suggestions)
+        return
+
+    exchange = Exchange(model_name, prompt, context, max_suggestions, stream=True)
+    replay = journal.replay()
+    if replay is not None:
+        chunks: Iterator[str] = iter([replay.answer(exchange)])
+    elif model_name.startswith("openai"):
+        chunks = _openai_chat_stream(prompt, context, max_suggestions, _openai_model(model_name), exchange)
+    elif model_name.startswith("ollama"):
+        chunks = _ollama_stream(prompt, context, max_suggestions, model_name, exchange)
+    else:
+        chunks = _gemini_stream(prompt, context, max_suggestions, model_name, exchange)
+    recorded = _recorded(_until_deadline(chunks), exchange)
+    try:
+        yield from _iter_suggestions(recorded, max_suggestions)
+        # The answer is complete; the provider's last events with the token counts follow right away
+        for _ in recorded:
+            pass
+    finally:
+        # Close the provider stream when the caller stopped reading early
+        recorded.close()
+        journal.record(exchange)
+        _account(exchange)
@@ -0,0 +1,185 @@
+"""Retrieval over commands.md: only the snippets relevant to a prompt go into the context.
+
+commands.md is split into snippets at its markdown headings (long sections
+also at blank lines, never inside code fences) and indexed with BM25 over
+words and trigrams. The snippets and the index are kept in
+PREFERENCES_INDEX_FILE keyed on the file's path, size and mtime, so they are
+rebuilt only after commands.md changes.
+
+Small files are still sent whole. For large ones, pinned sections (such as
+the Blacklist) are always included and the top-k snippets for the prompt
+are added within a token cap.
+"""
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from budget import estimate_tokens
+from search import BM25Index
+
+PREFERENCES_INDEX_FILE = Path(__file__).with_name(".aih_commands_index.json")
+
+# Sections longer than this are split at blank lines into several snippets
+SNIPPET_TOKENS = 200
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+
+
+class Snippet:
+    """A piece of commands.md with the path of headings it sits under."""
+
+    def __init__(self, title: str, body: str) -> None:
+        self.title = title
+        self.body = body
+
+    def render(self) -> str:
+        return f"## {self.title}\n{self.body}" if self.title else self.body
+
+
+def _chunks(lines: List[str], max_tokens: int) -> List[str]:
+    """Group lines into chunks of about max_tokens, breaking only at blank lines outside code fences."""
+    chunks: List[str] = []
+    current: List[str] = []
+    used = 0
+    in_fence = False
+    for line in lines:
+        if _FENCE_RE.match(line):
+            in_fence = not in_fence
+        if not line.strip() and not in_fence and used >= max_tokens:
+            chunks.append("\n".join(current).strip())
+            current, used = [], 0
+            continue
+        current.append(line)
+        used += estimate_tokens(line) + 1
+    if current:
+        chunks.append("\n".join(current).strip())
+    return [chunk for chunk in chunks if chunk]
+
+
+def split_snippets(markdown: str, max_tokens: int = SNIPPET_TOKENS) -> List[Snippet]:
+    """Split markdown into snippets at headings, and long sections at blank lines."""
+    snippets: List[Snippet] = []
+    path: List[Tuple[int, str]] = []
+    lines: List[str] = []
+    in_fence = False
+
+    def flush() -> None:
+        title = " > ".join(name for _, name in path)
+        for chunk in _chunks(lines, max_tokens):
+            snippets.append(Snippet(title, chunk))
+        lines.clear()
+
+    for line in markdown.splitlines():
+        if _FENCE_RE.match(line):
+            in_fence = not in_fence
+        match = None if in_fence else _HEADING_RE.match(line)
+        if match:
+            flush()
+            level = len(match.group(1))
+            while path and path[-1][0] >= level:
+                path.pop()
+            path.append((level, match.group(2)))
+        else:
+            lines.append(line)
+    flush()
+    return snippets
+
+
+class PreferenceIndex:
+    """Snippets of commands.md and their BM25 index."""
+
+    def __init__(self, snippets: Sequence[Snippet], index: BM25Index, text: str, tokens: int) -> None:
+        self.snippets = list(snippets)
+        self.index = index
+        self.text = text
+        self.tokens = tokens
+
+    @classmethod
+    def build(cls, text: str) -> "PreferenceIndex":
+        snippets = split_snippets(text)
+        index = BM25Index([f"{s.title}\n{s.body}" for s in snippets])
+        return cls(snippets, index, text, estimate_tokens(text))
+
+    @classmethod
+    def load(cls, path: Path, cache_file: Path = PREFERENCES_INDEX_FILE) -> Optional["PreferenceIndex"]:
+        """Index of the file at path, from cache_file while the file is unchanged; None if unreadable."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp = [str(path), st.st_size, st.st_mtime_ns]
+        try:
+            with open(cache_file) as f:
+                cached = json.load(f)
+            if cached["stamp"] == stamp:
+                snippets = [Snippet(title, body) for title, body in cached["snippets"]]
+                return cls(snippets, BM25Index.from_dict(cached["index"]), cached["text"], cached["tokens"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        try:
+            text = Path(path).read_text().strip()
+        except (OSError, UnicodeDecodeError):
+            return None
+        built = cls.build(text)
+        try:
+            tmp = Path(cache_file).with_suffix(".tmp")
+            tmp.write_text(json.dumps({
+                "stamp": stamp,
+                "text": text,
+                "tokens": built.tokens,
+                "snippets": [[s.title, s.body] for s in built.snippets],
+                "index": built.index.to_dict(),
+            }))
+            os.replace(tmp, cache_file)
+        except OSError:
+            pass
+        return built
+
+    def _is_pinned(self, snippet: Snippet, pinned: Sequence[str]) -> bool:
+        names = {name.strip().lower() for name in snippet.title.split(" > ")}
+        return any(p.strip().lower() in names for p in pinned if p.strip())
+
+    def select(self, query: str, top_k: int, max_tokens: int, pinned: Sequence[str] = ()) -> Tuple[str, str]:
+        """Return (pinned text, text of the top_k snippets for query within max_tokens)."""
+        pinned_ids = [i for i, s in enumerate(self.snippets) if self._is_pinned(s, pinned)]
+        chosen: List[int] = []
+        used = 0
+        for doc_id, _ in self.index.search(query, limit=top_k * 2 + len(pinned_ids)):
+            if doc_id in pinned_ids:
+                continue
+            cost = estimate_tokens(self.snippets[doc_id].render())
+            if used + cost > max_tokens:
+                continue
+            chosen.append(doc_id)
+            used += cost
+            if len(chosen) >= top_k:
+                break
+        # In file order, which reads better than score order
+        return (
+            "\n\n".join(self.snippets[i].render() for i in pinned_ids),
+            "\n\n".join(self.snippets[i].render() for i in sorted(chosen)),
+        )
+
+
+_indexes: Dict[str, Tuple[List[int], Optional[PreferenceIndex]]] = {}
+_lock = threading.Lock()
+
+
+def load_index(path: Path) -> Optional[PreferenceIndex]:
+    """PreferenceIndex.load memoized per process while the file is unchanged (batch mode asks per prompt)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    stamp = [st.st_size, st.st_mtime_ns]
+    with _lock:
+        cached = _indexes.get(str(path))
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, PreferenceIndex.load(path))
+            _indexes[str(path)] = cached
+        return cached[1]
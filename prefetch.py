@@ -0,0 +1,51 @@
+"""Speculative background work whose result may never be needed.
+
+A Speculation starts its function at once in a daemon thread. The caller asks
+for the result only when it turns out to be useful (the user pressed "r"),
+and gets None once the budget has run out, the function failed or the
+speculation was cancelled. Because the thread is a daemon, an unfinished
+speculation never delays quitting or executing a command.
+"""
+import threading
+import time
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class Speculation(Generic[T]):
+    """Runs fn in the background; its result is usable until budget seconds have passed."""
+
+    def __init__(self, fn: Callable[[], T], budget: float) -> None:
+        self._fn = fn
+        self._done = threading.Event()
+        self._cancelled = threading.Event()
+        self._result: Optional[T] = None
+        self.deadline = time.monotonic() + budget
+        threading.Thread(target=self._run, name="aih-prefetch", daemon=True).start()
+
+    def _run(self) -> None:
+        try:
+            if not self._cancelled.is_set():
+                self._result = self._fn()
+        except Exception:
+            self._result = None  # A failed guess costs nothing, the caller falls back
+        finally:
+            self._done.set()
+
+    def ready(self) -> bool:
+        """True once the result can be taken without waiting."""
+        return self._done.is_set() or self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        """Give up on the result; a call already in flight finishes unobserved."""
+        self._cancelled.set()
+
+    def result(self) -> Optional[T]:
+        """Wait for the result within the remaining budget; None if it failed, was cancelled or is too late."""
+        if self._cancelled.is_set():
+            return None
+        if not self._done.wait(max(0.0, self.deadline - time.monotonic())):
+            self.cancel()
+            return None
+        return self._result
@@ -0,0 +1,172 @@
+"""Latency-aware routing across a pool of models with hedged requests.
+
+Each model in ROUTER_POOL keeps a rolling window of latencies and errors in
+ROUTER_STATS_FILE. Requests go to the fastest healthy model; when it has not
+answered by its p90 latency a second model is asked as well and whichever
+answers first wins.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import time_budget
+
+ROUTER_STATS_FILE = Path(__file__).with_name(".aih_router.json")
+
+SuggestFn = Callable[[str, Optional[str], str, int], List[str]]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class RouterStats:
+    """Rolling per-model latency and error profile persisted between invocations."""
+
+    def __init__(self, path: Path = ROUTER_STATS_FILE, window: int = 50) -> None:
+        self.path = Path(path)
+        self.window = window
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict[str, list]] = {}
+        try:
+            self._data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            pass
+
+    def _entry(self, model: str) -> Dict[str, list]:
+        return self._data.setdefault(model, {"latencies": [], "errors": []})
+
+    def record(self, model: str, latency: float, ok: bool) -> None:
+        """Add one observation for model, dropping the oldest beyond the window."""
+        with self._lock:
+            entry = self._entry(model)
+            entry["latencies"] = (entry["latencies"] + [round(latency, 3)])[-self.window:]
+            entry["errors"] = (entry["errors"] + [0 if ok else 1])[-self.window:]
+
+    def latency(self, model: str, pct: float) -> Optional[float]:
+        latencies = self._data.get(model, {}).get("latencies")
+        return percentile(latencies, pct) if latencies else None
+
+    def error_rate(self, model: str) -> float:
+        errors = self._data.get(model, {}).get("errors")
+        return sum(errors) / len(errors) if errors else 0.0
+
+    def recent_failures(self, model: str) -> int:
+        """Number of consecutive failures at the end of the window."""
+        count = 0
+        for failed in reversed(self._data.get(model, {}).get("errors", [])):
+            if not failed:
+                break
+            count += 1
+        return count
+
+    def rank(self, pool: List[str], max_error_rate: float = 0.5) -> List[str]:
+        """Order pool by health, then median latency. Unmeasured models are tried first."""
+        def key(model: str) -> Tuple[bool, float]:
+            unhealthy = self.error_rate(model) > max_error_rate or self.recent_failures(model) >= 3
+            return unhealthy, self.latency(model, 50) or 0.0
+
+        return sorted(pool, key=key)
+
+    def save(self) -> None:
+        with self._lock:
+            tmp = self.path.with_suffix(".tmp")
+            try:
+                tmp.write_text(json.dumps(self._data))
+                os.replace(tmp, self.path)
+            except OSError:
+                pass
+
+
+_stats: Optional[RouterStats] = None
+_stats_lock = threading.Lock()
+
+
+def _router_stats() -> RouterStats:
+    """The process-wide RouterStats; rounds share it so late-finishing losers don't overwrite each other."""
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = RouterStats(window=int(os.environ.get("ROUTER_WINDOW", 50)))
+        return _stats
+
+
+def pool() -> List[str]:
+    """Models listed in ROUTER_POOL."""
+    return [m.strip() for m in os.environ.get("ROUTER_POOL", "").split(",") if m.strip()]
+
+
+def route(prompt: str, context: Optional[str], max_suggestions: int, suggest: SuggestFn) -> List[str]:
+    """Ask the fastest healthy model in ROUTER_POOL, hedging with the next one on slow answers."""
+    models = pool()
+    if not models:
+        raise RuntimeError("ROUTER_POOL not set")
+
+    stats = _router_stats()
+    default_delay = float(os.environ.get("ROUTER_HEDGE_DELAY", 2.0))
+    min_delay = float(os.environ.get("ROUTER_HEDGE_MIN", 0.2))
+    candidates = stats.rank(models)
+
+    results: "queue.Queue[Tuple[str, Optional[List[str]], Optional[Exception]]]" = queue.Queue()
+    # Set once route returns; requests still running then save their own stats
+    finished = threading.Event()
+    stats_lock = threading.Lock()
+
+    def attempt(model: str) -> None:
+        started = time.monotonic()
+        suggestions: Optional[List[str]] = None
+        error: Optional[Exception] = None
+        try:
+            suggestions = suggest(prompt, context, model, max_suggestions)
+        except Exception as e:
+            error = e
+        # Every request, a hedging loser too, counts with its full latency
+        with stats_lock:
+            if error is None or not time_budget.expired():  # Cut by --deadline says nothing about the model
+                stats.record(model, time.monotonic() - started, error is None)
+            if finished.is_set():
+                stats.save()
+        results.put((model, suggestions, error))
+
+    in_flight: Set[str] = set()
+
+    def launch() -> float:
+        """Start the next candidate and return how long to wait before hedging."""
+        model = candidates.pop(0)
+        in_flight.add(model)
+        # Daemon threads so a losing request never delays exit
+        threading.Thread(target=time_budget.propagate(attempt), args=(model,), daemon=True).start()
+        p90 = stats.latency(model, 90)
+        return max(min_delay, p90) if p90 is not None else default_delay
+
+    last_error: Optional[Exception] = None
+    hedge_after = launch()
+    try:
+        while in_flight:
+            wait = hedge_after if candidates and len(in_flight) < 2 else None
+            try:
+                model, suggestions, error = results.get(timeout=wait)
+            except queue.Empty:
+                hedge_after = launch()
+                continue
+
+            in_flight.discard(model)
+            if error is None:
+                return suggestions or []
+
+            last_error = error
+            if candidates and len(in_flight) < 2:
+                hedge_after = launch()
+    finally:
+        # Losers are not cancelled: they run on in their daemon threads to record their real latency
+        with stats_lock:
+            finished.set()
+            stats.save()
+
+    raise RuntimeError(f"All routed models failed, last error: {last_error}")
@@ -0,0 +1,78 @@
+"""Small local text search: BM25 ranking over word tokens and character trigrams."""
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Sequence, Set, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens of text."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def trigrams(text: str) -> Set[str]:
+    """Character trigrams of each word of text that is at least three characters long."""
+    return {w[i:i + 3] for w in tokenize(text) for i in range(len(w) - 2)}
+
+
+def terms(text: str) -> List[str]:
+    """Index terms of text: its words plus the trigrams of each word, so typos still match."""
+    words = tokenize(text)
+    grams = [f"#{w[i:i + 3]}" for w in words if len(w) > 3 for i in range(len(w) - 2)]
+    return words + grams
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of documents."""
+
+    def __init__(self, documents: Sequence[str], k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths: List[int] = []
+        for doc_id, doc in enumerate(documents):
+            counts = Counter(terms(doc))
+            self._lengths.append(sum(counts.values()))
+            for term, freq in counts.items():
+                self._postings.setdefault(term, []).append((doc_id, freq))
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def to_dict(self) -> dict:
+        """JSON-serializable form of the index, see from_dict."""
+        return {"k1": self.k1, "b": self.b, "postings": self._postings, "lengths": self._lengths}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BM25Index":
+        """Rebuild an index saved with to_dict without re-tokenizing the documents."""
+        index = cls([], data["k1"], data["b"])
+        index._postings = data["postings"]
+        index._lengths = data["lengths"]
+        index._avg_length = (sum(index._lengths) / len(index._lengths)) if index._lengths else 0.0
+        return index
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[int, float]]:
+        """Return up to limit (document index, score) pairs, best first."""
+        n = len(self._lengths)
+        scores: Dict[int, float] = {}
+        for term in set(terms(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, freq in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / self._avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def similarity(a: str, b: str) -> float:
+    """Dice coefficient of the trigrams of a and b, tolerant of typos, inflections and extra words on either side."""
+    grams_a, grams_b = trigrams(a), trigrams(b)
+    if not grams_a or not grams_b:
+        return 0.0
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
@@ -0,0 +1,142 @@
+"""Conversation state per terminal and directory.
+
+Every round of suggestions is a turn: the request, the suggestions shown
+and what the user did with them (a comment, or the command that was run).
+Earlier turns are sent with the next request, as many of the newest ones as
+fit in a token cap, so feedback given a few rounds ago is not forgotten.
+
+Turns are kept in SESSIONS_FILE keyed on the terminal and working
+directory. ``aih --continue`` picks up the turns of the previous call in
+the same place if it is less than SESSION_TTL seconds old; without it a
+call starts a new session.
+"""
+import fcntl
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from budget import estimate_tokens
+
+SESSIONS_FILE = Path(__file__).with_name(".aih_sessions.json")
+
+# Stored turns per session; what is sent is capped by tokens
+MAX_TURNS = 20
+
+
+def session_key(cwd: str) -> str:
+    """Terminal and directory of this call; AIH_SESSION overrides the terminal."""
+    terminal = os.environ.get("AIH_SESSION")
+    if not terminal:
+        try:
+            terminal = os.ttyname(sys.stdin.fileno())
+        except (OSError, ValueError):
+            terminal = "no-tty"
+    return f"{terminal}:{cwd}"
+
+
+class Turn:
+    """One round: the request, the suggestions shown and the user's reaction."""
+
+    def __init__(self, prompt: str, suggestions: List[str], comment: Optional[str] = None,
+                 executed: Optional[str] = None) -> None:
+        self.prompt = prompt
+        self.suggestions = suggestions
+        self.comment = comment
+        self.executed = executed
+
+    def render(self) -> str:
+        lines = [f"Request: {self.prompt}"]
+        lines += [f"{idx}. {cmd}" for idx, cmd in enumerate(self.suggestions, start=1)]
+        if self.comment:
+            lines.append(f"User comment: {self.comment}")
+        if self.executed:
+            lines.append(f"Executed: {self.executed}")
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict:
+        return {"prompt": self.prompt, "suggestions": self.suggestions, "comment": self.comment,
+                "executed": self.executed}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Turn":
+        return cls(data["prompt"], list(data["suggestions"]), data.get("comment"), data.get("executed"))
+
+
+@contextmanager
+def _locked(path: Path) -> Iterator[None]:
+    with open(path.with_name(path.name + ".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _read(path: Path) -> dict:
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+class Session:
+    """Turns of one terminal and directory, saved after every change."""
+
+    def __init__(self, key: str, turns: Optional[List[Turn]] = None, path: Optional[Path] = None) -> None:
+        self.key = key
+        self.turns = turns or []
+        self.path = Path(path or SESSIONS_FILE)
+
+    @classmethod
+    def load(cls, key: str, ttl: float, path: Optional[Path] = None) -> "Session":
+        """The session stored for key, or an empty one when there is none younger than ttl seconds."""
+        entry = _read(Path(path or SESSIONS_FILE)).get(key)
+        if not entry or time.time() - entry.get("updated", 0) > ttl:
+            return cls(key, path=path)
+        try:
+            return cls(key, [Turn.from_dict(turn) for turn in entry["turns"]], path)
+        except (KeyError, TypeError):
+            return cls(key, path=path)
+
+    def add(self, prompt: str, suggestions: List[str]) -> Turn:
+        turn = Turn(prompt, list(suggestions))
+        self.turns = (self.turns + [turn])[-MAX_TURNS:]
+        self.save()
+        return turn
+
+    def render(self, max_tokens: int, skip_last: bool = False) -> Optional[str]:
+        """Earlier turns, oldest first, keeping only the newest ones that fit in max_tokens."""
+        turns = self.turns[:-1] if skip_last else self.turns
+        kept: List[str] = []
+        used = 0
+        for turn in reversed(turns):
+            text = turn.render()
+            cost = estimate_tokens(text) + 1
+            if used + cost > max_tokens:
+                break
+            kept.append(text)
+            used += cost
+        if not kept:
+            return None
+        return "Earlier in this session:\n\n" + "\n\n".join(reversed(kept))
+
+    def save(self) -> None:
+        """Store the turns, dropping sessions that have not changed for a day."""
+        try:
+            with _locked(self.path):
+                data = _read(self.path)
+                now = time.time()
+                data = {key: entry for key, entry in data.items()
+                        if isinstance(entry, dict) and now - entry.get("updated", 0) < 86400}
+                data[self.key] = {"updated": now, "turns": [turn.to_dict() for turn in self.turns]}
+                tmp = self.path.with_suffix(".tmp")
+                tmp.write_text(json.dumps(data))
+                os.replace(tmp, self.path)
+        except OSError:
+            pass
@@ -0,0 +1,34 @@
+"""Batch runs: one JSON result line per item, also for items that fail."""
+import io
+import json
+
+from batch import BatchRunner, read_items
+
+
+def run(lines, suggest=lambda prompt, context, model_name, max_suggestions: ["ls"]):
+    out = io.StringIO()
+    runner = BatchRunner(suggest, "openai/gpt-4o-mini", 3, rate_limits={"openai": 1000}, out=out)
+    runner.run(read_items(lines))
+    return sorted((json.loads(line) for line in out.getvalue().splitlines()), key=lambda r: r["index"])
+
+
+def test_malformed_items_fail_alone():
+    results = run([
+        '{"prompt": "list files", "model": 3}',
+        '{"prompt": "list files", "model": ["openai/gpt-4o"]}',
+        '{"model": "openai/gpt-4o"}',
+        "list files",
+    ])
+    assert [r["error"] for r in results] == [
+        "Invalid model", "Invalid model", "Missing prompt", None]
+    assert results[-1]["suggestions"] == ["ls"]
+
+
+def test_suggest_errors_are_reported_per_item():
+    def suggest(prompt, context, model_name, max_suggestions):
+        if prompt == "fail":
+            raise RuntimeError("provider down")
+        return [prompt]
+
+    results = run(["fail", "pwd"], suggest)
+    assert [(r["error"], r["suggestions"]) for r in results] == [("provider down", []), (None, ["pwd"])]
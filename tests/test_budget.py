@@ -0,0 +1,50 @@
+"""Fitting context parts into the token budget."""
+from budget import (
+    STABLE_PREFIX_END,
+    ContextPart,
+    assemble,
+    assemble_context,
+    collapse_repeats,
+    estimate_tokens,
+    shrink,
+    split_context,
+)
+
+
+def test_collapse_repeats_keeps_the_first_of_similar_lines():
+    text = "\n".join(f"file{idx}.log" for idx in range(10)) + "\nREADME.md"
+    assert collapse_repeats(text) == "file0.log\nfile1.log\n[... 8 similar lines ...]\nREADME.md"
+
+
+def test_shrink_keeps_head_and_tail_within_budget():
+    text = "\n".join(f"line {word} of the listing" for word in ("alpha", "beta", "gamma", "delta") * 50)
+    shrunk = shrink(text, 100)
+    assert estimate_tokens(shrunk) <= 100
+    assert shrunk.startswith("line alpha of the listing")
+    assert shrunk.endswith("line delta of the listing")
+    assert "lines omitted" in shrunk
+
+
+def test_low_priority_parts_are_trimmed_or_dropped_first():
+    parts = [
+        ContextPart("listing", "\n".join(f"{name}.txt" for name in ("alpha", "beta", "gamma") * 100), priority=1),
+        ContextPart("git", "branch main", priority=3),
+        ContextPart("system", "word " * 100, priority=2, max_tokens=50),
+    ]
+    texts = assemble(parts, 60)
+    assert len(texts) == 2  # The listing did not fit in what was left
+    assert texts[0] == "branch main"
+    assert estimate_tokens(texts[1]) <= 50
+
+    texts = assemble(parts, 200)
+    assert len(texts) == 3
+    assert "lines omitted" in texts[0]
+    assert sum(estimate_tokens(text) for text in texts) <= 200
+
+
+def test_stable_prefix_does_not_depend_on_volatile_parts():
+    preferences = ContextPart("commands.md", "prefer rg over grep\n" * 50, priority=1, stable=True)
+    small = assemble_context([preferences, ContextPart("listing", "a.txt", priority=5)], 300)
+    large = assemble_context([preferences, ContextPart("listing", "b.txt\n" * 500, priority=5)], 300)
+    assert STABLE_PREFIX_END in small
+    assert split_context(small)[0] == split_context(large)[0]
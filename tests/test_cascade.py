@@ -0,0 +1,63 @@
+"""When the cascade keeps the local answer and when it escalates to the cloud model."""
+import functools
+import json
+import time
+
+import pytest
+
+import cascade
+from cascade import CascadeStats
+from validate import Validator
+
+LOCAL = "ollama/small"
+CLOUD = "openai/gpt-4o-mini"
+
+
+@pytest.fixture
+def stats_file(tmp_path, monkeypatch):
+    path = tmp_path / "cascade.json"
+    monkeypatch.setattr(cascade, "CascadeStats", functools.partial(CascadeStats, path))
+    monkeypatch.setattr(cascade, "_validator", lambda: Validator())
+    monkeypatch.setenv("CASCADE_LOCAL", LOCAL)
+    monkeypatch.setenv("CASCADE_LOCAL_TIMEOUT", "0.3")
+    return path
+
+
+def suggest_with(local_answer):
+    calls = []
+
+    def suggest(prompt, context, model_name, max_suggestions):
+        calls.append(model_name)
+        if model_name != LOCAL:
+            return ["cloud answer"]
+        if isinstance(local_answer, Exception):
+            raise local_answer
+        if local_answer == "slow":
+            time.sleep(1)
+            return ["ls"]
+        return local_answer
+    return suggest, calls
+
+
+def outcomes(path):
+    return json.loads(path.read_text())["outcomes"]
+
+
+def test_good_local_answer_is_kept(stats_file):
+    suggest, calls = suggest_with(["ls -la", "find . -type f"])
+    assert cascade.cascade("list files", None, 3, CLOUD, suggest) == ["ls -la", "find . -type f"]
+    assert calls == [LOCAL]
+    assert outcomes(stats_file) == ["local"]
+
+
+@pytest.mark.parametrize("local_answer, outcome", [
+    (["echo 'list files'"], "rejected"),
+    (["ls -la (", "echo done"], "rejected"),
+    (RuntimeError("connection refused"), "error"),
+    ("slow", "timeout"),
+])
+def test_escalates_to_cloud(stats_file, local_answer, outcome):
+    suggest, calls = suggest_with(local_answer)
+    assert cascade.cascade("list files", None, 3, CLOUD, suggest) == ["cloud answer"]
+    assert calls == [LOCAL, CLOUD]
+    assert outcomes(stats_file) == [outcome]
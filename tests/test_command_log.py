@@ -0,0 +1,41 @@
+"""Command log appends, compaction trigger and compaction."""
+import subprocess
+
+import pytest
+
+import command_log
+
+
+@pytest.fixture
+def spawned(monkeypatch):
+    """Compactions started by append, as argument lists; none is actually run."""
+    calls = []
+    monkeypatch.setattr(subprocess, "Popen", lambda args, **kwargs: calls.append(args))
+    return calls
+
+
+def test_long_commands_are_not_recompacted_after_compaction(tmp_path, spawned):
+    log = tmp_path / "commands.log"
+    for _ in range(10):
+        command_log.append(log, "x" * 400, "/tmp", max_entries=10)
+    command_log.compact(log, 10)
+    assert log.stat().st_size > 2 * 10 * command_log._ENTRY_BYTES
+
+    command_log.append(log, "x" * 400, "/tmp", max_entries=10)
+    assert spawned == []
+
+
+def test_compaction_starts_past_twice_the_entries(tmp_path, spawned):
+    log = tmp_path / "commands.log"
+    for idx in range(30):
+        command_log.append(log, f"echo {idx} " + "x" * 100, "/tmp", max_entries=10)
+    assert len(spawned) > 0
+    assert spawned[0][-3:] == ["compact", str(log), "10"]
+
+
+def test_compact_keeps_newest_entries(tmp_path, spawned):
+    log = tmp_path / "commands.log"
+    for idx in range(25):
+        command_log.append(log, f"echo {idx}", "/tmp", max_entries=10)
+    command_log.compact(log, 10)
+    assert [entry.cmd for entry in command_log.search(log)] == [f"echo {idx}" for idx in range(15, 25)]
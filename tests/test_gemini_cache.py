@@ -0,0 +1,64 @@
+"""Gemini cachedContents: when a prefix is uploaded and how its name is reused."""
+import functools
+
+import pytest
+
+import gemini_cache
+import model
+from gemini_cache import PrefixCache
+from transport import HttpResult
+
+PREFIX = "alias ll='ls -la'\n" * 300  # About 2400 estimated tokens
+
+
+class FakeTransport:
+    def __init__(self):
+        self.posts = []
+
+    def post(self, url, json=None, headers=None, read_timeout=None):
+        self.posts.append((url, json))
+        return HttpResult(200, f'{{"name": "cachedContents/c{len(self.posts)}"}}', {}, 0.01)
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    transport = FakeTransport()
+    monkeypatch.setattr(gemini_cache, "get_transport", lambda: transport)
+    return transport
+
+
+def test_prefix_is_created_once_and_reused(tmp_path, transport):
+    cache = PrefixCache(tmp_path / "gemini.json")
+    first = cache.lookup("https://gemini.test/v1beta", "key", "gemini-2.5-flash", PREFIX)
+    assert first == "cachedContents/c1"
+    assert cache.lookup("https://gemini.test/v1beta", "key", "gemini-2.5-flash", PREFIX) == first
+
+    # Another process finds the name in the file
+    other = PrefixCache(tmp_path / "gemini.json")
+    assert other.lookup("https://gemini.test/v1beta", "key", "gemini-2.5-flash", PREFIX) == first
+    assert len(transport.posts) == 1
+    url, payload = transport.posts[0]
+    assert url == "https://gemini.test/v1beta/cachedContents?key=key"
+    assert payload["model"] == "models/gemini-2.5-flash"
+    assert payload["systemInstruction"]["parts"][0]["text"] == PREFIX
+
+
+def test_prefix_below_the_model_minimum_is_sent_inline(tmp_path, transport):
+    cache = PrefixCache(tmp_path / "gemini.json")
+    assert cache.lookup("https://gemini.test/v1beta", "key", "gemini-2.0-flash", PREFIX) is None
+    assert PrefixCache(tmp_path / "gemini.json", min_tokens=1000).lookup(
+        "https://gemini.test/v1beta", "key", "gemini-2.0-flash", PREFIX) == "cachedContents/c1"
+
+
+def test_request_refers_to_cached_prefix_with_default_settings(tmp_path, transport, monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "key")
+    monkeypatch.delenv("GEMINI_CACHE", raising=False)
+    monkeypatch.delenv("GEMINI_CACHE_MIN_TOKENS", raising=False)
+    monkeypatch.setattr(model, "PrefixCache", functools.partial(PrefixCache, tmp_path / "gemini.json"))
+    monkeypatch.setattr(model, "_gemini_prefix_cache", None)
+
+    for _ in range(2):
+        _, payload = model._gemini_request("list files", PREFIX, 3, "gemini/gemini-2.5-flash", "generateContent")
+        assert payload["cachedContent"] == "cachedContents/c1"
+        assert "systemInstruction" not in payload
+    assert len(transport.posts) == 1
@@ -0,0 +1,65 @@
+"""Suggestion caching around the model call."""
+import pytest
+
+import main
+import model
+import time_budget
+from cache import SuggestionCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = SuggestionCache(path=tmp_path / "cache.db")
+    monkeypatch.setattr(main, "_cache", cache)
+    return cache
+
+
+def test_stream_cut_by_deadline_is_not_cached(cache, monkeypatch):
+    def cut_stream(prompt, context, model_name, max_suggestions):
+        yield "ls"
+        yield "pwd"
+        time_budget.cut("model stream")
+    monkeypatch.setattr(model, "stream_suggestions", cut_stream)
+
+    with time_budget.limit(60):
+        assert list(main.iter_suggestions("list files", None, "openai/gpt-4o-mini", 3)) == ["ls", "pwd"]
+
+    def full_stream(prompt, context, model_name, max_suggestions):
+        yield from ["ls -la", "ls", "pwd"]
+    monkeypatch.setattr(model, "stream_suggestions", full_stream)
+    assert list(main.iter_suggestions("list files", None, "openai/gpt-4o-mini", 3)) == ["ls -la", "ls", "pwd"]
+
+
+def test_complete_stream_is_cached(cache, monkeypatch):
+    monkeypatch.setattr(model, "stream_suggestions", lambda *args, **kwargs: iter(["ls", "pwd"]))
+    list(main.iter_suggestions("list files", None, "openai/gpt-4o-mini", 3))
+
+    monkeypatch.setattr(model, "stream_suggestions", lambda *args, **kwargs: iter(["df -h"]))
+    assert list(main.iter_suggestions("list files", None, "openai/gpt-4o-mini", 3)) == ["ls", "pwd"]
+
+
+def test_answer_cut_by_deadline_is_not_cached(cache, monkeypatch):
+    def cut_answer(prompt, context, model_name, max_suggestions):
+        time_budget.cut("model stream")
+        return ["ls"]
+    monkeypatch.setattr(model, "get_suggestions", cut_answer)
+
+    with time_budget.limit(60):
+        assert main.lookup_suggestions("list files", None, "openai/gpt-4o-mini", 3) == ["ls"]
+
+    monkeypatch.setattr(model, "get_suggestions", lambda *args, **kwargs: ["ls -la", "ls"])
+    assert main.lookup_suggestions("list files", None, "openai/gpt-4o-mini", 3) == ["ls -la", "ls"]
+
+
+def test_history_notes_stay_out_of_the_screen(cache, monkeypatch, capsys):
+    from validate import Screen, Validator
+
+    monkeypatch.setattr(model, "stream_suggestions", lambda *args, **kwargs: iter(["rm -rf /"]))
+    screen = Screen(Validator(blacklist=[r"rm -rf /"], check_syntax=False))
+
+    shown = main._stream_command_suggestions("clean up", None, "openai/gpt-4o-mini", 3, use_cache=False,
+                                             refresh=False, use_daemon=False, local=["ls -la"], screen=screen)
+    assert shown == ["ls -la"]
+    assert f"ls -la  ({main.HISTORY_NOTE})" in capsys.readouterr().out
+    assert screen.notes == {}
+    assert "rm -rf /" in screen.dropped
@@ -0,0 +1,33 @@
+"""Parsing of model answers into suggestions; run with ``python -m pytest`` from the project dir."""
+import pytest
+
+from model import _iter_suggestions, _openai_body, _parse_suggestions
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('["ls -la", "pwd"]', ["ls -la", "pwd"]),
+    ('Here are commands:\n["ls"]', ["ls"]),
+    ('echo "a: [\\"x\\"]"', ['echo "a: [\\"x\\"]"']),
+    ('Here are the commands:', []),
+    ('Here are the commands:\n\nls -la', ["ls -la"]),
+    ('Sure!\n```json\n["df -h"]\n```\nThis shows disk usage.', ["df -h"]),
+    ('[\n  "du -sh *",\n  "ls -lS"\n]\nExplanation follows.', ["du -sh *", "ls -lS"]),
+    ('1. ls -la\n2. `pwd`', ["ls -la", "pwd"]),
+    ("[]", []),
+])
+def test_parse_suggestions(text, expected):
+    assert _parse_suggestions(text, 3) == expected
+
+
+def test_prose_before_array_when_streamed():
+    text = 'Here are commands:\n["ls", "pwd"]'
+    assert list(_iter_suggestions(iter(text), 3)) == ["ls", "pwd"]
+
+
+def test_truncated_array_keeps_complete_commands():
+    assert _parse_suggestions('["ls -la", "pwd", "df -', 3) == ["ls -la", "pwd"]
+
+
+def test_no_stop_sequence_that_prose_can_hit(monkeypatch):
+    monkeypatch.setenv("ADAPTIVE_OUTPUT", "false")
+    assert _openai_body("list files", None, 3, "gpt-4o-mini")["stop"] is None
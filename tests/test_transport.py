@@ -0,0 +1,77 @@
+"""Retry policy of the pooled transport, against a local HTTP server."""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from transport import Transport, TransportError
+
+
+@pytest.fixture
+def server():
+    """Server answering POSTs with the queued (status, delay) replies, then 200; counts requests."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.server.requests += 1
+            status, delay = self.server.replies.pop(0) if self.server.replies else (200, 0)
+            time.sleep(delay)
+            body = b'{"ok": true}'
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except OSError:
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.requests = 0
+    httpd.replies = []
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def url(httpd):
+    return f"http://127.0.0.1:{httpd.server_address[1]}/v1/chat"
+
+
+def test_read_timeout_is_not_retried(server):
+    server.replies = [(200, 1.0)] * 3
+    transport = Transport(read_timeout=0.3, retries=2, backoff=0.01)
+    started = time.monotonic()
+    with pytest.raises(TransportError):
+        transport.post(url(server), json={})
+    assert server.requests == 1
+    assert time.monotonic() - started < 1.0
+
+
+def test_server_errors_are_retried(server):
+    server.replies = [(503, 0), (502, 0)]
+    result = Transport(retries=2, backoff=0.01).post(url(server), json={})
+    assert result.ok
+    assert server.requests == 3
+
+
+def test_connection_errors_are_retried(server, monkeypatch):
+    import requests
+
+    calls = []
+    post = requests.Session.post
+
+    def refuse_once(self, *args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise requests.ConnectionError("refused")
+        return post(self, *args, **kwargs)
+    monkeypatch.setattr(requests.Session, "post", refuse_once)
+
+    assert Transport(retries=2, backoff=0.01).post(url(server), json={}).ok
+    assert len(calls) == 2
@@ -0,0 +1,79 @@
+"""End-to-end latency deadline for one round of suggestions.
+
+``aih --deadline SECONDS`` (or DEADLINE) bounds the time from starting a
+round to showing its suggestions. The deadline lives in a context variable,
+so every stage reads the budget that is left instead of its own fixed
+timeout: the context script and its sections, the collectors, commands.md
+and the provider call with its retries. A stage that has no time left is
+skipped and named in ``cut()``, and the round shows what it has: context
+built so far, a cached or history answer, or the suggestions streamed before
+time ran out.
+
+Context variables are not inherited by threads started with
+``threading.Thread``; use ``propagate`` for work that should count against
+the same deadline.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional
+
+# Smallest timeout handed to a stage that is still allowed to start
+MIN_TIMEOUT = 0.05
+
+_deadline: "contextvars.ContextVar[Optional[float]]" = contextvars.ContextVar("aih_time_budget", default=None)
+_cuts: "contextvars.ContextVar[Optional[List[str]]]" = contextvars.ContextVar("aih_time_budget_cuts", default=None)
+
+
+@contextmanager
+def limit(seconds: Optional[float]) -> Iterator[List[str]]:
+    """Run the block under a deadline seconds from now (none when seconds is 0 or None).
+
+    Yields the list that collects the names of the stages cut short.
+    """
+    cuts: List[str] = []
+    deadline_token = _deadline.set(time.monotonic() + seconds if seconds else None)
+    cuts_token = _cuts.set(cuts)
+    try:
+        yield cuts
+    finally:
+        _deadline.reset(deadline_token)
+        _cuts.reset(cuts_token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left, None without a deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def cap(timeout: float) -> float:
+    """timeout, shortened to the time left."""
+    left = remaining()
+    return timeout if left is None else max(MIN_TIMEOUT, min(timeout, left))
+
+
+def cut(stage: str) -> None:
+    """Note that stage was skipped or stopped early because the deadline passed."""
+    cuts = _cuts.get()
+    if cuts is not None and stage not in cuts:
+        cuts.append(stage)
+
+
+def cuts() -> List[str]:
+    """Names of the stages cut short so far under the current deadline."""
+    return list(_cuts.get() or [])
+
+
+def propagate(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """fn bound to the current deadline, for running in one other thread."""
+    context = contextvars.copy_context()
+
+    def run(*args: Any, **kwargs: Any) -> Any:
+        return context.run(fn, *args, **kwargs)
+    return run
@@ -0,0 +1,91 @@
+"""Per-phase timing of one aih invocation.
+
+Enabled with ``--timings`` or ``AIH_TIMINGS=true``. Code wraps its phases in
+``with timings.phase("name"):``; phases nest, and the breakdown printed at the
+end indents them accordingly. When timing is off ``phase`` returns a shared
+no-op context manager, so instrumented code pays one function call.
+
+With ``AIH_TIMINGS_FILE`` set, every timed invocation appends one JSON line
+with all phases to that file for later aggregation.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Optional
+
+_NOOP = nullcontext()
+
+_enabled = False
+_origin = time.perf_counter()
+_records: List[Dict[str, Any]] = []
+_local = threading.local()
+
+
+def enable() -> None:
+    """Start recording phases for the rest of the process."""
+    global _enabled
+    _enabled = True
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def _depth() -> int:
+    return getattr(_local, "depth", 0)
+
+
+def _add(name: str, depth: int, start: float, seconds: float) -> None:
+    _records.append({
+        "name": name,
+        "depth": depth,
+        "start_ms": round((start - _origin) * 1000, 3),
+        "ms": round(seconds * 1000, 3),
+        "thread": threading.current_thread().name,
+    })
+
+
+@contextmanager
+def _timed(name: str) -> Iterator[None]:
+    depth = _depth()
+    _local.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add(name, depth, start, time.perf_counter() - start)
+        _local.depth = depth
+
+
+def phase(name: str):
+    """Context manager timing the enclosed block as phase name."""
+    return _timed(name) if _enabled else _NOOP
+
+
+def record(name: str, seconds: float, start: Optional[float] = None) -> None:
+    """Record a phase measured elsewhere; start is a perf_counter value, default now minus seconds."""
+    if _enabled:
+        _add(name, _depth(), time.perf_counter() - seconds if start is None else start, seconds)
+
+
+def since_start() -> float:
+    """Seconds since this module was imported, roughly since the process started."""
+    return time.perf_counter() - _origin
+
+
+def report() -> str:
+    """Compact breakdown of the recorded phases, in the order they started."""
+    lines = ["Timings:"]
+    for rec in sorted(_records, key=lambda r: r["start_ms"]):
+        indent = "  " * (rec["depth"] + 1)
+        lines.append(f"{indent}{rec['name']:<{34 - len(indent)}} {rec['ms']:9.1f} ms")
+    lines.append(f"  {'total':<32} {since_start() * 1000:9.1f} ms")
+    return "\n".join(lines)
+
+
+def export(path: str, **fields: Any) -> None:
+    """Append this invocation's phases and fields as one JSON line to path."""
+    trace = dict(fields, time=time.time(), total_ms=round(since_start() * 1000, 3), phases=_records)
+    with open(path, "a") as f:
+        f.write(json.dumps(trace) + "\n")
@@ -0,0 +1,272 @@
+"""Shared pooled HTTP transport used by every provider.
+
+Connections are pooled per host and kept alive for the life of the process, so
+regenerations (and every request served by the daemon) reuse a warm TLS
+connection. Requests get separate connect and read timeouts and are retried
+with jittered exponential backoff on connection errors, 429 and 5xx answers,
+honoring Retry-After. A read timeout is not retried: the provider may already
+be generating (and billing) the answer, so the POST is not sent again.
+
+``requests`` is imported on the first request, not at module import, so
+commands that never reach the network do not pay for loading it.
+"""
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+
+import time_budget
+import timings
+
+if TYPE_CHECKING:
+    import requests
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TransportError(RuntimeError):
+    """The request could not be completed, even after retrying."""
+
+
+class HttpResult:
+    """A response read and parsed once: status, raw text, parsed JSON and timing."""
+
+    def __init__(self, status: int, text: str, headers: Dict[str, str], elapsed: float) -> None:
+        self.status: int = status
+        self.text: str = text
+        self.headers: Dict[str, str] = headers
+        self.elapsed: float = elapsed  # Seconds from sending to the full body
+        self.data: Any = None  # Parsed JSON body, None if the body is not JSON
+        try:
+            self.data = json.loads(text) if text else None
+        except ValueError:
+            pass
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+
+class StreamResponse:
+    """A streamed response whose body is read incrementally."""
+
+    def __init__(self, response: "requests.Response") -> None:
+        self._response = response
+        self.status: int = response.status_code
+        self.headers: Dict[str, str] = dict(response.headers)
+
+    @property
+    def text(self) -> str:
+        return self._response.text
+
+    def iter_lines(self) -> Iterator[str]:
+        """Yield decoded body lines as they arrive."""
+        import requests
+
+        try:
+            for line in self._response.iter_lines(decode_unicode=True):
+                yield line
+        except requests.RequestException as e:
+            raise TransportError(f"Connection lost while streaming: {e}")
+
+    def close(self) -> None:
+        self._response.close()
+
+
+def _retry_after(headers: Any) -> Optional[float]:
+    """Return the Retry-After header in seconds, accepting both seconds and HTTP dates."""
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class Transport:
+    """Pooled keep-alive HTTP client with retries, backoff and split timeouts."""
+
+    def __init__(
+        self,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        retries: int = 2,
+        backoff: float = 0.5,
+        backoff_max: float = 8.0,
+    ) -> None:
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._sessions: Dict[str, "requests.Session"] = {}
+        self._lock = threading.Lock()
+
+    def _session(self, url: str) -> "requests.Session":
+        """Return the keep-alive session for the URL's host."""
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=8)
+                session.mount(host, adapter)
+                self._sessions[host] = session
+            return session
+
+    @staticmethod
+    def _opened_connections(session: "requests.Session", url: str) -> int:
+        """Number of connections the session's pools for url have opened so far."""
+        try:
+            pools = session.get_adapter(url).poolmanager.pools
+            return sum(pools[key].num_connections for key in pools.keys())
+        except Exception:
+            return 0
+
+    def _delay(self, attempt: int, headers: Any = None) -> Optional[float]:
+        """Seconds to sleep before the next attempt, or None when the server asks us to wait too long."""
+        retry_after = _retry_after(headers) if headers is not None else None
+        if retry_after is not None:
+            return retry_after if retry_after <= self.backoff_max else None
+        return min(self.backoff_max, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def _timeout(self, read_timeout: Optional[float]) -> Tuple[float, float]:
+        """Connect and read timeouts, shortened to what is left of a --deadline."""
+        return time_budget.cap(self.connect_timeout), time_budget.cap(read_timeout or self.read_timeout)
+
+    def _retry_delay(self, attempt: int, headers: Any = None) -> Optional[float]:
+        """_delay, or None when the next attempt would start after the deadline."""
+        delay = self._delay(attempt, headers)
+        left = time_budget.remaining()
+        if delay is not None and left is not None and delay >= left:
+            return None
+        return delay
+
+    def _send(self, url: str, stream: bool, read_timeout: Optional[float], **kwargs: Any) -> "requests.Response":
+        """POST with retries; return the last response, retryable or not."""
+        with timings.phase("http: setup"):
+            import requests
+
+            session = self._session(url)
+        attempt = 0
+        while True:
+            if time_budget.expired():
+                time_budget.cut("model")
+                raise TransportError("Deadline exceeded before the request was sent")
+            timed = timings.enabled()
+            opened = self._opened_connections(session, url) if timed else 0
+            started = time.perf_counter()
+            try:
+                response = session.post(url, timeout=self._timeout(read_timeout), stream=stream, **kwargs)
+            except requests.ConnectionError as e:
+                # Includes ConnectTimeout; read timeouts are not ConnectionErrors and end up below
+                delay = self._retry_delay(attempt)
+                if attempt >= self.retries or delay is None:
+                    if time_budget.expired():
+                        time_budget.cut("model")
+                    raise TransportError(str(e))
+                with timings.phase("http: retry wait"):
+                    time.sleep(delay)
+                attempt += 1
+                continue
+            except requests.RequestException as e:
+                if time_budget.expired():
+                    time_budget.cut("model")
+                raise TransportError(str(e))
+
+            if timed:
+                # elapsed ends at the response headers, so a new connection's DNS/TLS is part of it
+                ttfb = response.elapsed.total_seconds()
+                reused = self._opened_connections(session, url) == opened
+                timings.record("http: ttfb" if reused else "http: connect + ttfb", ttfb, started)
+                if not stream:
+                    timings.record("http: body", time.perf_counter() - started - ttfb, started + ttfb)
+
+            if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                return response
+            delay = self._retry_delay(attempt, response.headers)
+            if delay is None:
+                return response
+            response.close()
+            with timings.phase("http: retry wait"):
+                time.sleep(delay)
+            attempt += 1
+
+    def post(
+        self,
+        url: str,
+        json: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        read_timeout: Optional[float] = None,
+    ) -> HttpResult:
+        """POST a JSON body and return the fully read, parsed response."""
+        started = time.monotonic()
+        response = self._send(url, False, read_timeout, json=json, headers=headers)
+        with timings.phase("http: decode + parse json"):
+            return HttpResult(response.status_code, response.text, dict(response.headers), time.monotonic() - started)
+
+    def preconnect(self, url: str) -> bool:
+        """Open a pooled connection to url's host (DNS, TCP, TLS) ahead of the first request.
+
+        The answer to the HEAD request does not matter; False when the host is unreachable.
+        """
+        import requests
+
+        session = self._session(url)
+        try:
+            session.head(url, timeout=self._timeout(None)).close()
+        except requests.RequestException:
+            return False
+        return True
+
+    @contextmanager
+    def stream(
+        self,
+        url: str,
+        json: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        read_timeout: Optional[float] = None,
+    ) -> Iterator[StreamResponse]:
+        """POST a JSON body and yield the response with its body unread.
+
+        Retries happen only before the body starts; the connection returns to
+        the pool when the block exits.
+        """
+        response = self._send(url, True, read_timeout, json=json, headers=headers)
+        try:
+            yield StreamResponse(response)
+        finally:
+            response.close()
+
+
+_transport: Optional[Transport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> Transport:
+    """Return the process-wide transport, configured from HTTP_* settings on first use."""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = Transport(
+                connect_timeout=float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5)),
+                read_timeout=float(os.environ.get("HTTP_READ_TIMEOUT", 30)),
+                retries=int(os.environ.get("HTTP_RETRIES", 2)),
+                backoff=float(os.environ.get("HTTP_BACKOFF", 0.5)),
+                backoff_max=float(os.environ.get("HTTP_BACKOFF_MAX", 8)),
+            )
+        return _transport
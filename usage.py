@@ -0,0 +1,188 @@
+"""Token usage, cost and latency per model, and output limits learned from them.
+
+Every provider call made by model.py adds a sample to USAGE_STATS_FILE:
+prompt, cached and completion tokens as reported by the provider, latency,
+the number of suggestions in the answer and the output limit it was given.
+The last USAGE_WINDOW samples per model are kept.
+
+With ADAPTIVE_OUTPUT (on by default) and at least MIN_SAMPLES answers, the
+output limit of a model is sized to what its answers actually need: the 95th
+percentile of completion tokens per suggestion times the suggestions asked
+for, plus headroom, never above the static limit. A recent answer that ran
+into its limit switches back to the static one. A model whose last answers
+were all one-line JSON arrays also gets ARRAY_END as stop sequence, so
+whatever it would write on the lines after the array is never generated.
+
+``aih --stats`` prints the report.
+"""
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from router import percentile
+
+USAGE_STATS_FILE = Path(__file__).with_name(".aih_usage.json")
+
+# Answers needed before a model's limits are adapted
+MIN_SAMPLES = 20
+# An answer cut by its limit among this many recent ones restores the static limit
+TRUNCATION_LOOKBACK = 10
+HEADROOM = 1.25
+MIN_OUTPUT_TOKENS = 16
+# A closing bracket followed by a newline: JSON strings cannot contain a raw
+# newline, so this only matches once the array is complete, fenced or not
+ARRAY_END = "]\n"
+
+# USD per million prompt and completion tokens; USAGE_PRICES adds to and overrides these
+DEFAULT_PRICES = {
+    "openai/gpt-4o-mini": (0.15, 0.60),
+    "openai/gpt-4o": (2.50, 10.00),
+    "gemini/gemini-2.0-flash": (0.10, 0.40),
+    "gemini/gemini-2.0-flash-lite": (0.075, 0.30),
+}
+
+
+def parse_prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse "openai/gpt-4o-mini=0.15:0.60,..." into prompt and completion prices per million tokens."""
+    prices: Dict[str, Tuple[float, float]] = {}
+    for part in spec.split(","):
+        model, _, price = part.strip().partition("=")
+        prompt_price, _, completion_price = price.partition(":")
+        if not model or not prompt_price:
+            continue
+        try:
+            prices[model.strip()] = (float(prompt_price), float(completion_price or prompt_price))
+        except ValueError:
+            pass
+    return prices
+
+
+def one_line_array(text: str) -> bool:
+    """Whether an answer is a JSON array on its first line.
+
+    An answer stopped by ARRAY_END lacks the closing bracket, the stop sequence is not returned.
+    """
+    first, _, rest = text.strip().partition("\n")
+    first = first.rstrip()
+    return first.startswith("[") and (first.endswith("]") or not rest)
+
+
+class UsageStats:
+    """Rolling per-model samples, merged into the file on every record so processes share them."""
+
+    def __init__(self, path: Path = USAGE_STATS_FILE, window: int = 200) -> None:
+        self.path = Path(path)
+        self.window = window
+        self._lock = threading.Lock()
+        self._data: Dict[str, List[dict]] = self._read()
+
+    def _read(self) -> Dict[str, List[dict]]:
+        try:
+            data = json.loads(self.path.read_text())
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, model: str, sample: dict) -> None:
+        """Add a sample for model and store it next to those of other processes."""
+        sample = dict(sample, time=round(time.time(), 3))
+        with self._lock:
+            try:
+                with open(self.path.with_name(self.path.name + ".lock"), "a") as lock:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                    data = self._read()
+                    data[model] = (data.get(model, []) + [sample])[-self.window:]
+                    tmp = self.path.with_suffix(".tmp")
+                    tmp.write_text(json.dumps(data))
+                    os.replace(tmp, self.path)
+                    self._data = data
+            except OSError:
+                self._data[model] = (self._data.get(model, []) + [sample])[-self.window:]
+
+    def samples(self, model: str) -> List[dict]:
+        return list(self._data.get(model, []))
+
+    def _answers(self, model: str) -> List[dict]:
+        return [s for s in self.samples(model) if not s.get("error") and s.get("completion_tokens")]
+
+    def output_limit(self, model: str, max_suggestions: int, default: int) -> int:
+        """Output token limit for max_suggestions commands from model, at most default."""
+        answers = self._answers(model)
+        if len(answers) < MIN_SAMPLES:
+            return default
+        if any(s.get("limit") and s["completion_tokens"] >= s["limit"] for s in answers[-TRUNCATION_LOOKBACK:]):
+            return default
+        per_suggestion = [s["completion_tokens"] / max(1, s.get("suggestions", 0)) for s in answers]
+        needed = math.ceil(percentile(per_suggestion, 95) * max_suggestions * HEADROOM)
+        return max(MIN_OUTPUT_TOKENS, min(default, needed))
+
+    def stop_sequences(self, model: str, base: List[str]) -> List[str]:
+        """base, plus ARRAY_END for models that keep answering with one-line arrays."""
+        answers = self._answers(model)[-MIN_SAMPLES:]
+        if len(answers) >= MIN_SAMPLES and all(s.get("one_line") for s in answers) and ARRAY_END not in base:
+            return base + [ARRAY_END]
+        return base
+
+    def report(self, max_suggestions: int, default_limit: int,
+               prices: Optional[Dict[str, Tuple[float, float]]] = None) -> str:
+        """Tokens, cost, latency percentiles and the output limit for max_suggestions commands per model."""
+        prices = dict(DEFAULT_PRICES, **(prices or {}))
+        if not any(self._data.values()):
+            return "No provider calls recorded yet."
+        sections = []
+        for model in sorted(self._data):
+            samples = self.samples(model)
+            if not samples:
+                continue
+            errors = sum(1 for s in samples if s.get("error"))
+            lines = [f"{model}: {len(samples)} calls, {errors} errors"]
+
+            answers = self._answers(model)
+            if answers:
+                prompt = [s.get("prompt_tokens", 0) for s in answers]
+                cached = sum(s.get("cached_tokens", 0) for s in answers)
+                completion = [s["completion_tokens"] for s in answers]
+                share = f" ({cached / sum(prompt):.0%} cached)" if cached and sum(prompt) else ""
+                lines.append(f"  Tokens: prompt p50 {percentile(prompt, 50):.0f}{share}, "
+                             f"completion p50 {percentile(completion, 50):.0f} / p95 {percentile(completion, 95):.0f}")
+                price = prices.get(model, (0.0, 0.0) if model.startswith("ollama") else None)
+                if price is not None:
+                    cost = (sum(prompt) * price[0] + sum(completion) * price[1]) / 1e6
+                    lines.append(f"  Cost: ${cost:.4f} for {len(answers)} answers "
+                                 f"(${cost / len(answers) * 1000:.2f} per 1000)")
+
+            latencies = [s["latency"] for s in samples if not s.get("error") and s.get("latency") is not None]
+            if latencies:
+                line = (f"  Latency: p50 {percentile(latencies, 50):.2f}s, p90 {percentile(latencies, 90):.2f}s, "
+                        f"p99 {percentile(latencies, 99):.2f}s")
+                first = [s["first_chunk"] for s in samples if s.get("first_chunk") is not None]
+                if first:
+                    line += f"; first chunk p50 {percentile(first, 50):.2f}s"
+                lines.append(line)
+
+            if adaptive() and len(answers) >= MIN_SAMPLES:
+                limit = self.output_limit(model, max_suggestions, default_limit)
+                lines.append(f"  Output limit: {limit} of {default_limit} tokens for {max_suggestions} suggestions"
+                             + (", stop after the array" if self.stop_sequences(model, []) else ""))
+            sections.append("\n".join(lines))
+        return "\n\n".join(sections)
+
+
+_stats: Optional[UsageStats] = None
+
+
+def stats() -> UsageStats:
+    """The process-wide UsageStats, loaded on first use."""
+    global _stats
+    if _stats is None:
+        _stats = UsageStats(window=int(os.environ.get("USAGE_WINDOW", 200)))
+    return _stats
+
+
+def adaptive() -> bool:
+    return os.environ.get("ADAPTIVE_OUTPUT", "true").lower() in ("true", "yes", "1")
@@ -1,23 +1,72 @@
 import os
 import sys
 import itertools
+import json
 import subprocess
 import threading
-import time
 from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Optional, MutableMapping, Iterator
+from typing import Dict, List, Optional, MutableMapping, Iterator, Sequence, Set
 
-from dotenv import load_dotenv
+import time_budget
+import timings
+
+ENV_CACHE_FILE = Path(__file__).with_name('.aih_env_cache.json')
+
+# .env files already loaded into os.environ by this process
+_loaded_env: Set[str] = set()
+
+def _read_env_file(env_path: str) -> Dict[str, Optional[str]]:
+    """Parse a .env file, reusing the last parse while the file is unchanged.
+
+    Importing python-dotenv costs more than the rest of a --history run, so its
+    result is kept in ENV_CACHE_FILE keyed on the file's size and mtime. Files
+    with ${VAR} references are always parsed, their values depend on the environment.
+    """
+    try:
+        st = os.stat(env_path)
+    except OSError:
+        return {}
+    stamp = [env_path, st.st_size, st.st_mtime_ns]
+    try:
+        with open(ENV_CACHE_FILE) as f:
+            cached = json.load(f)
+        if cached["stamp"] == stamp:
+            return cached["values"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    from dotenv import dotenv_values
+
+    values = dict(dotenv_values(env_path))
+    try:
+        if "${" not in Path(env_path).read_text():
+            tmp = ENV_CACHE_FILE.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"stamp": stamp, "values": values}))
+            os.replace(tmp, ENV_CACHE_FILE)
+    except OSError:
+        pass
+    return values
 
 def load_env(env_path: Optional[str] = None) -> MutableMapping[str, str]:
-    """Load .env file and return a mapping of env vars."""
-    env_path = env_path or Path(__file__).with_name('.env')
-    load_dotenv(env_path)
+    """Load .env file (once per process) and return a mapping of env vars.
+
+    Like load_dotenv, variables already set in the environment win.
+    """
+    env_path = str(env_path or Path(__file__).with_name('.env'))
+    if env_path not in _loaded_env:
+        for key, value in _read_env_file(env_path).items():
+            if value is not None:
+                os.environ.setdefault(key, value)
+        _loaded_env.add(env_path)
     return os.environ
 
-def execute_context_script() -> Optional[str]:
-    """Execute .aih_context.sh script and return its output if it exists."""
+def user_cwd() -> str:
+    """Return the directory aih was started from; commands.sh runs main.py from the project dir."""
+    return os.environ.get("AIH_CWD") or os.getcwd()
+
+def execute_context_script(max_bytes: int = 32768) -> Optional[str]:
+    """Execute .aih_context.sh script and return its output (at most max_bytes) if it exists."""
     script_path = Path(__file__).with_name('.aih_context.sh')
     
     # Check if file exists and is executable
@@ -32,25 +81,51 @@ def execute_context_script() -> Optional[str]:
     # Check if file has content (not empty)
     if script_path.stat().st_size == 0:
         return None
+
+    if time_budget.expired():
+        time_budget.cut("context script")
+        return None
+
+    from context_sections import parse_sections, run_capped, run_sections
+
+    # Scripts split into sections run them in parallel, each with its own timeout and cache
+    preamble, sections = parse_sections(script_path.read_text())
+    if sections:
+        with timings.phase("context sections"):
+            return run_sections(preamble, sections, user_cwd(), max_bytes) or None
         
     try:
-        result = subprocess.run([script_path], capture_output=True, text=True, timeout=10)
-        if result.returncode == 0:
-            return result.stdout.strip()
-    except (subprocess.SubprocessError, subprocess.TimeoutExpired) as e:
+        # Output is read as it is produced and the script stopped once the cap is reached
+        with timings.phase("context script"):
+            returncode, output = run_capped([str(script_path)], time_budget.cap(10), max_bytes, user_cwd())
+        if returncode in (0, None):
+            return output.strip()
+    except subprocess.TimeoutExpired as e:
+        if time_budget.expired():
+            time_budget.cut("context script")
+        else:
+            print(f"Warning: Error executing context script: {e}", file=sys.stderr)
+    except (subprocess.SubprocessError, OSError) as e:
         print(f"Warning: Error executing context script: {e}", file=sys.stderr)
     except Exception as e:
         print(f"Warning: Unexpected error with context script: {e}", file=sys.stderr)
     
     return None
 
-def build_context() -> str:
-    """Collect optional contextual info from custom context script only."""
-    cwd = os.getcwd()
+def build_context(max_bytes: int = 32768, collectors: Sequence[str] = ()) -> str:
+    """Collect contextual info from the built-in collectors and the custom context script."""
+    cwd = user_cwd()
     ctx_parts = [f"Current directory: {cwd}"]
+
+    # Native collectors read files and /proc instead of forking ls, git, df, ps, ...
+    if collectors:
+        from collectors import collect
+
+        with timings.phase("context collectors"):
+            ctx_parts.extend(collect(collectors, cwd))
     
     # Execute custom context script if it exists
-    script_output = execute_context_script()
+    script_output = execute_context_script(max_bytes)
     if script_output:
         ctx_parts.append("Additional context:\n" + script_output)
     
@@ -60,15 +135,15 @@ def build_context() -> str:
 @contextmanager
 def spinner(msg: str = "Loading...") -> Iterator[None]:
     """Simple terminal spinner context manager."""
-    stop = False
+    stop = threading.Event()
 
     def spin():
         for ch in itertools.cycle("|/-\\"):
-            if stop:
+            if stop.is_set():
                 break
             sys.stdout.write(f"\r{msg} {ch}")
             sys.stdout.flush()
-            time.sleep(0.1)
+            stop.wait(0.1)
         sys.stdout.write("\r" + " " * (len(msg) + 2) + "\r")
 
     thread = threading.Thread(target=spin)
@@ -76,5 +151,5 @@ def spinner(msg: str = "Loading...") -> Iterator[None]:
     try:
         yield
     finally:
-        stop = True
+        stop.set()
         thread.join()
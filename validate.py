@@ -0,0 +1,247 @@
+"""Local checks that screen model suggestions before they are shown.
+
+Three checks run on every suggestion:
+
+- blacklist: the command matches an entry of the Blacklist section of
+  commands.md (one command or pattern per line). Such suggestions are dropped.
+- syntax: ``bash -n`` rejects the command. Dropped as well. The checks of a
+  batch of suggestions run in parallel.
+- executables: a command word is neither a shell builtin nor found on $PATH.
+  The suggestion is kept but flagged, it may be an alias or function of the
+  user's shell. The names on $PATH are cached in PATH_INDEX_FILE and rescanned
+  only when PATH or the mtime of one of its directories changes.
+"""
+import json
+import os
+import re
+import shlex
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set
+
+PATH_INDEX_FILE = Path(__file__).with_name(".aih_path_index.json")
+
+SYNTAX_TIMEOUT = 2.0
+
+# Words that are never looked up on PATH
+SHELL_WORDS = {
+    # keywords
+    "if", "then", "else", "elif", "fi", "case", "esac", "for", "select", "while", "until", "do", "done",
+    "in", "function", "time", "{", "}", "!", "[[", "]]", "coproc",
+    # builtins
+    ".", ":", "[", "alias", "bg", "bind", "break", "builtin", "caller", "cd", "command", "compgen", "complete",
+    "compopt", "continue", "declare", "dirs", "disown", "echo", "enable", "eval", "exec", "exit", "export",
+    "false", "fc", "fg", "getopts", "hash", "help", "history", "jobs", "kill", "let", "local", "logout",
+    "mapfile", "popd", "printf", "pushd", "pwd", "read", "readarray", "readonly", "return", "set", "shift",
+    "shopt", "source", "suspend", "test", "times", "trap", "true", "type", "typeset", "ulimit", "umask",
+    "unalias", "unset", "wait",
+}
+
+# After these the next word is again in command position
+_PREFIX_WORDS = {"then", "else", "elif", "do", "if", "while", "until", "!", "{", "time", "sudo", "nohup", "exec",
+                 "command", "builtin"}
+# The rest of the simple command is not a command name (loop variables, patterns, wrapped commands with options)
+_SKIP_WORDS = {"for", "select", "case", "function", "xargs", "env", "nice", "timeout", "watch", "parallel"}
+_SEPARATORS = {"|", "||", "&&", ";", "&", "(", ")", "|&", ";;", "$("}
+_ASSIGNMENT_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+_LIST_MARKER_RE = re.compile(r"^(?:[-*+]|\d+[.)])\s+")
+
+
+class Verdict:
+    """Outcome of checking one suggestion: dropped, flagged (reason only) or fine."""
+
+    def __init__(self, cmd: str, drop: bool = False, reason: Optional[str] = None) -> None:
+        self.cmd = cmd
+        self.drop = drop
+        self.reason = reason
+
+
+def command_names(cmd: str) -> List[str]:
+    """Names in command position of cmd: the programs it would run, roughly as bash parses them."""
+    lexer = shlex.shlex(cmd, posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    try:
+        tokens = list(lexer)
+    except ValueError:
+        return []  # Unbalanced quotes, left to the syntax check
+
+    names: List[str] = []
+    expect_command = True
+    for token in tokens:
+        if token in _SEPARATORS or token.endswith("$("):
+            expect_command = True
+        elif not expect_command:
+            continue
+        elif _ASSIGNMENT_RE.match(token) or token in _PREFIX_WORDS:
+            continue
+        elif token in _SKIP_WORDS:
+            expect_command = False
+        elif token.startswith("-") or any(ch in token for ch in "<>"):
+            expect_command = False  # Options of a prefix word such as sudo, or a redirection
+        else:
+            names.append(token)
+            expect_command = False
+    return names
+
+
+class PathIndex:
+    """Names of the executables on a PATH."""
+
+    def __init__(self, names: Set[str]) -> None:
+        self.names = names
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    @staticmethod
+    def _scan(dirs: Sequence[str]) -> Set[str]:
+        names: Set[str] = set()
+        for directory in dirs:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_file() and os.access(entry.path, os.X_OK):
+                                names.add(entry.name)
+                        except OSError:
+                            pass
+            except OSError:
+                pass
+        return names
+
+    @classmethod
+    def load(cls, path_env: Optional[str] = None, cache_file: Path = PATH_INDEX_FILE) -> "PathIndex":
+        """Index of path_env (default $PATH), from cache_file while PATH and its directories are unchanged."""
+        path_env = os.environ.get("PATH", "") if path_env is None else path_env
+        dirs = [d for d in path_env.split(os.pathsep) if d]
+        mtimes = []
+        for directory in dirs:
+            try:
+                mtimes.append(os.stat(directory).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        stamp = [path_env, mtimes]
+        try:
+            with open(cache_file) as f:
+                cached = json.load(f)
+            if cached["stamp"] == stamp:
+                return cls(set(cached["names"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        names = cls._scan(dirs)
+        try:
+            tmp = Path(cache_file).with_suffix(".tmp")
+            tmp.write_text(json.dumps({"stamp": stamp, "names": sorted(names)}))
+            os.replace(tmp, cache_file)
+        except OSError:
+            pass
+        return cls(names)
+
+
+def blacklist_entries(text: str) -> List[str]:
+    """Commands listed in a Blacklist section: one per line, list markers, backticks and fences removed."""
+    entries = []
+    for line in text.splitlines():
+        line = _LIST_MARKER_RE.sub("", line.strip()).strip("`").strip()
+        if line and not line.startswith(("```", "~~~", "#")):
+            entries.append(line)
+    return entries
+
+
+def compile_blacklist(entries: Iterable[str]) -> Optional["re.Pattern[str]"]:
+    """One regex matching any entry as whole words, with any amount of whitespace between them."""
+    patterns = []
+    for entry in entries:
+        words = entry.split()
+        if words:
+            patterns.append(r"(?<![\w./-])" + r"\s+".join(re.escape(w) for w in words) + r"(?![\w./-])")
+    return re.compile("|".join(patterns)) if patterns else None
+
+
+def syntax_error(cmd: str) -> Optional[str]:
+    """First line of bash's complaint about cmd, None when it parses (or bash is unavailable)."""
+    try:
+        result = subprocess.run(
+            ["bash", "-n", "-c", cmd], stdin=subprocess.DEVNULL, capture_output=True, text=True,
+            timeout=SYNTAX_TIMEOUT,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode == 0:
+        return None
+    message = (result.stderr.strip().splitlines() or ["syntax error"])[0]
+    return re.sub(r"^bash: (-c: )?(line \d+: )?", "", message)
+
+
+class Validator:
+    """Runs the blacklist, syntax and executable checks."""
+
+    def __init__(self, blacklist: Iterable[str] = (), path_index: Optional[PathIndex] = None,
+                 check_syntax: bool = True) -> None:
+        self.blacklist = compile_blacklist(blacklist)
+        self.path_index = path_index
+        self.check_syntax = check_syntax
+
+    def check(self, cmd: str) -> Verdict:
+        if self.blacklist is not None and self.blacklist.search(cmd):
+            return Verdict(cmd, drop=True, reason="blacklisted")
+        if self.check_syntax:
+            error = syntax_error(cmd)
+            if error:
+                return Verdict(cmd, drop=True, reason=error)
+        if self.path_index is not None:
+            missing = [name for name in command_names(cmd)
+                       if "/" not in name and "$" not in name and name not in SHELL_WORDS
+                       and name not in self.path_index]
+            if missing:
+                return Verdict(cmd, reason=f"not found: {', '.join(dict.fromkeys(missing))}")
+        return Verdict(cmd)
+
+    def check_all(self, cmds: Sequence[str]) -> List[Verdict]:
+        """Check several commands at once; each bash -n runs in its own process, in parallel."""
+        if len(cmds) <= 1:
+            return [self.check(cmd) for cmd in cmds]
+        with ThreadPoolExecutor(max_workers=min(8, len(cmds))) as pool:
+            return list(pool.map(self.check, cmds))
+
+
+class Screen:
+    """Validation of one round of suggestions: notes for flagged ones, reasons for dropped ones."""
+
+    def __init__(self, validator: Validator) -> None:
+        self.validator = validator
+        self.notes: Dict[str, str] = {}
+        self.dropped: Dict[str, str] = {}
+        self.passed = 0
+
+    def _verdicts(self, suggestions: Iterable[str]) -> Iterator[Verdict]:
+        if isinstance(suggestions, list):
+            yield from self.validator.check_all(suggestions)
+        else:
+            # Streamed: check each one as it arrives so it can be shown right away
+            for cmd in suggestions:
+                yield self.validator.check(cmd)
+
+    def filter(self, suggestions: Iterable[str]) -> Iterator[str]:
+        """Yield the suggestions that are not dropped, in order."""
+        for verdict in self._verdicts(suggestions):
+            if verdict.drop:
+                self.dropped[verdict.cmd] = verdict.reason or "invalid"
+                continue
+            if verdict.reason:
+                self.notes[verdict.cmd] = verdict.reason
+            else:
+                self.passed += 1
+            yield verdict.cmd
+
+    @property
+    def rejected(self) -> Dict[str, str]:
+        """Dropped and flagged suggestions with their reasons."""
+        return {**self.dropped, **self.notes}
+
+    def feedback(self) -> str:
+        """Comment telling the model why the suggestions in rejected (in that order) failed."""
+        reasons = [f"{idx}. {reason}" for idx, reason in enumerate(self.rejected.values(), start=1)]
+        return "These suggestions failed local checks:\n" + "\n".join(reasons) + "\nSuggest working alternatives."